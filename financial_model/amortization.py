@@ -0,0 +1,38 @@
+# Closed-form loan amortization.
+#
+# A loan owing amount at the start of week start, repaid repayment a week, owes
+#   interest_index[week] * (amount / interest_index[start] - repayment * D(start, week))
+# at the start of a later week, where D(start, week) is the sum of 1 / interest_index[j]
+# for start < j <= week. So a stretch of weeks between PAY/START events is worked out
+# without stepping through it week by week.
+
+def balance(interest_index, amount, repayment, start, week):
+    return interest_index[week] * (amount / interest_index[start] \
+            - repayment * interest_index.discount_sum(start, week))
+
+def payoff_week(interest_index, amount, repayment, start, end):
+    # The first week after start that opens with nothing owing, or end if the loan is
+    # still owing then. amount must be positive.
+    owing = amount / interest_index[start]
+    if owing > repayment * interest_index.discount_sum(start, end):
+        return end
+    # Balances are positive up to low and not positive from high
+    low = start
+    high = end
+    while high - low > 1:
+        middle = (low + high) // 2
+        if owing > repayment * interest_index.discount_sum(start, middle):
+            low = middle
+        else:
+            high = middle
+    return high
+
+def amortize(interest_index, amount, repayment, start, end):
+    # Returns the opening balance of each week from start up to and including the week
+    # the loan is paid off (or up to end), and the week it is paid off (or end).
+    # The repayment is made in every week from start up to the payoff week.
+    last_week = payoff_week(interest_index, amount, repayment, start, end)
+    balances = [balance(interest_index, amount, repayment, start, week) \
+                for week in range(start, min(last_week + 1, end))]
+    closing_balance = balance(interest_index, amount, repayment, start, last_week)
+    return balances, last_week, closing_balance
@@ -0,0 +1,176 @@
+# Benchmarks for the simulators, on synthetic schedules. Run from this directory:
+#   python benchmark.py --years 10 25 50 100 --out benchmark.json
+# Every horizon is run --repeat times and each stage keeps its fastest time. Every run
+# starts with the tables shared between simulations in the process cleared, so it costs
+# what a single fresh simulation does. The results
+# are written as JSON (to stdout, or --out) so runs can be compared between versions,
+# and a table of them is printed to stderr.
+#
+# The synthetic schedules are much busier than any experiment: income, expenses and
+# super contributions every week, a share purchase every week with --sells-per-year
+# sells a year in both shares and super, and --loans home and car loans started one
+# after the other across the horizon.
+
+import simulator
+import income
+import misc
+import superannuation
+import shares
+import home
+import home_loan
+import car_loan
+import hecs
+import rates
+import scenario
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+
+STAGES = ["inputs", "shares", "super", "home", "home_loan", "car_loan", "hecs", \
+            "tax", "receipts", "report", "simulate"]
+
+def synthetic_input_file_gens(num_weeks, sells_per_year, num_loans):
+    income_file_gen = income.InputFileGenerator(num_weeks)
+    misc_file_gen = misc.InputFileGenerator(num_weeks)
+    shares_file_gen = shares.InputFileGenerator(num_weeks)
+    super_file_gen = superannuation.InputFileGenerator(num_weeks)
+    for week in range(num_weeks):
+        income_file_gen.add(week, 2000)
+        misc_file_gen.add(week, 500)
+        shares_file_gen.buy(300, week)
+        super_file_gen.buy(200, "CC", week)
+        if week % 4 == 0:
+            super_file_gen.buy(100, "NCC", week)
+    sell_interval = max(1, 52 // sells_per_year)
+    for week in range(sell_interval, num_weeks, sell_interval):
+        shares_file_gen.sell(100, week)
+        super_file_gen.sell(50, week)
+
+    home_file_gen = home.InputFileGenerator(num_weeks)
+    home_file_gen.buy(500000, 0)
+    home_loan_file_gen = home_loan.InputFileGenerator(num_weeks)
+    car_loan_file_gen = car_loan.InputFileGenerator(num_weeks)
+    loan_interval = num_weeks // num_loans
+    for i in range(num_loans):
+        home_loan_file_gen.buy(400000, i * loan_interval, 30)
+        car_loan_file_gen.buy(30000, 5000, i * loan_interval, 5)
+    for week in range(26, num_weeks, 26):
+        home_loan_file_gen.pay(1000, week)
+
+    hecs_file_gen = hecs.InputFileGenerator(num_weeks)
+    hecs_file_gen.buy(20000, 0)
+    for week in range(52, num_weeks, 52):
+        hecs_file_gen.pay(1000, week)
+
+    return [income_file_gen, misc_file_gen, shares_file_gen, super_file_gen, \
+            home_file_gen, home_loan_file_gen, car_loan_file_gen, hecs_file_gen]
+
+
+class BenchmarkSimulator(simulator.Simulator):
+    def __init__(self, sells_per_year, num_loans):
+        sim_params = [{"STARTING_BALANCE": 10 ** 7, "ANNUAL_INFLATION_RATE": 3},
+                        {"STARTING_BALANCE": 10000, "ANNUAL_ROR": 10},
+                        {"STARTING_BALANCE": 10000, "ANNUAL_ROR": 10},
+                        {"ANNUAL_ROR": 8},
+                        {"ANNUAL_INTEREST_RATE": 6},
+                        {"ANNUAL_INTEREST_RATE": 6},
+                        {"ANNUAL_INDEXATION_RATE": 4}]
+        super().__init__(sim_params)
+        self.sells_per_year = sells_per_year
+        self.num_loans = num_loans
+
+    def generate_input_files(self, num_weeks):
+        self.load_inputs(*synthetic_input_file_gens(num_weeks, self.sells_per_year, \
+                                                    self.num_loans))
+        self.generate_hecs_brackets(num_weeks)
+        self.generate_tax_brackets(num_weeks)
+
+
+def count_transactions(sources):
+    num_transactions = 0
+    for in_file, schedule in sources.items():
+        if in_file.startswith("input_files/") and isinstance(schedule, list):
+            num_transactions += len([line for line in schedule if len(line) > 1])
+    return num_transactions
+
+def clear_caches():
+    # The bracket tables, inflation indexes and compiled scenarios built in this process
+    simulator.bracket_tables.clear()
+    rates.inflation_indexes.clear()
+    scenario.compiled_scenarios.clear()
+
+def time_stages(num_weeks, sells_per_year, num_loans):
+    # Times each stage of Simulator.simulate with its profiler, then the report
+    clear_caches()
+    sim = BenchmarkSimulator(sells_per_year, num_loans)
+    try:
+        sim.simulate(num_weeks, report=False, profile=True)
+    except AssertionError:
+        pass
+    times = {record["stage"]: record["seconds"] for record in sim.profile["stages"]}
+    times["simulate"] = sim.profile["seconds"]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim.print_final_report(num_weeks)
+    times["report"] = time.perf_counter() - start
+    return times, count_transactions(sim.sources)
+
+def run_benchmarks(years, repeat=3, sells_per_year=12, num_loans=3):
+    results = []
+    for num_years in years:
+        num_weeks = num_years * 52
+        best = {}
+        for _ in range(repeat):
+            times, num_transactions = time_stages(num_weeks, sells_per_year, num_loans)
+            for stage, seconds in times.items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+        for stage in STAGES:
+            results.append({
+                "stage": stage,
+                "years": num_years,
+                "num_weeks": num_weeks,
+                "num_transactions": num_transactions,
+                "seconds": best[stage]
+            })
+    return {
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "sells_per_year": sells_per_year,
+        "num_loans": num_loans,
+        "results": results
+    }
+
+def print_table(benchmarks, out=sys.stderr):
+    years = sorted(set([result["years"] for result in benchmarks["results"]]))
+    seconds = {(result["stage"], result["years"]): result["seconds"] \
+                for result in benchmarks["results"]}
+    print("stage".ljust(12) + "".join([f"{num_years} years".rjust(12) for num_years in years]), \
+            file=out)
+    for stage in STAGES:
+        print(stage.ljust(12) + "".join([f"{seconds[(stage, num_years)]:12.4f}" \
+                                        for num_years in years]), file=out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sells-per-year", type=int, default=12)
+    parser.add_argument("--loans", type=int, default=3)
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    benchmarks = run_benchmarks(args.years, args.repeat, args.sells_per_year, args.loans)
+    print_table(benchmarks)
+    if args.out is None:
+        json.dump(benchmarks, sys.stdout, indent=1)
+        print()
+    else:
+        f = open(args.out, "w")
+        json.dump(benchmarks, f, indent=1)
+        f.close()
@@ -0,0 +1,119 @@
+# Tax and HECS bracket tables.
+#
+# A table holds the rates and thresholds in effect for each period (a year for income
+# tax, a week for HECS), as listed in input_files/tax_brackets.txt and hecs_brackets.txt:
+#   {period} RATES {rate} {rate} ...
+#   {period} BRACKETS {threshold} {threshold} ...
+# For income tax, each rate applies to income above the threshold in the same position.
+# For HECS there is one more rate than thresholds, and the first rate applies below the
+# first threshold. The table is built once, and lookups within a period use bisect.
+
+from bisect import bisect_left, bisect_right
+
+from schedule import read_schedule
+
+class BracketTable:
+    def __init__(self, rates, thresholds):
+        self.rates = rates
+        self.thresholds = thresholds
+        # Thresholds with a rate for every one, so a rate below the first listed
+        # threshold starts from 0
+        self.lower_bounds = []
+        # Tax owed on income up to each lower bound
+        self.cumulative_tax = []
+        for period, (period_rates, period_thresholds) in enumerate(zip(rates, thresholds)):
+            # A period with the same brackets as the one before shares its lists, so
+            # lookups can tell the brackets have not changed
+            if period > 0 and period_rates == rates[period - 1] \
+                    and period_thresholds == thresholds[period - 1]:
+                self.lower_bounds.append(self.lower_bounds[-1])
+                self.cumulative_tax.append(self.cumulative_tax[-1])
+                continue
+            if len(period_rates) > len(period_thresholds):
+                period_thresholds = [0] + period_thresholds
+            cumulative_tax = [0]
+            for i in range(1, len(period_thresholds)):
+                cumulative_tax.append(cumulative_tax[-1] + period_rates[i - 1] / 100 \
+                                        * (period_thresholds[i] - period_thresholds[i - 1]))
+            self.lower_bounds.append(period_thresholds)
+            self.cumulative_tax.append(cumulative_tax)
+
+    def __len__(self):
+        return len(self.rates)
+
+    def marginal_rate(self, period, income):
+        # Income exactly on a threshold is charged the rate above it. Income below the
+        # lowest threshold is not taxed, as in tax().
+        i = bisect_right(self.lower_bounds[period], income) - 1
+        if i < 0:
+            return 0
+        return self.rates[period][i]
+
+    def marginal_rates(self, incomes, start=0):
+        # The marginal rate on each period's income (incomes[period] for each period), from
+        # period start on. A period whose income and brackets are the same as the period
+        # before's gets the same rate without another lookup.
+        marginal_rates = []
+        income = None
+        lower_bounds = None
+        for period in range(start, len(incomes)):
+            if incomes[period] != income or self.lower_bounds[period] is not lower_bounds:
+                income = incomes[period]
+                lower_bounds = self.lower_bounds[period]
+                rate = self.marginal_rate(period, income)
+            marginal_rates.append(rate)
+        return marginal_rates
+
+    def tax(self, period, income, rate_offset=0):
+        # Tax on income under the period's brackets, with every rate lowered by
+        # rate_offset. Income below the lowest threshold is not taxed.
+        lower_bounds = self.lower_bounds[period]
+        i = bisect_left(lower_bounds, income) - 1
+        if i < 0:
+            return 0
+        return self.cumulative_tax[period][i] \
+                + (self.rates[period][i] - rate_offset) / 100 * (income - lower_bounds[i]) \
+                - rate_offset / 100 * (lower_bounds[i] - lower_bounds[0])
+
+    def taxes(self, incomes, period=None, rate_offset=0):
+        # Tax on every income in one call, each under the given period's brackets, or
+        # under its own period's (incomes[year] for each year) if no period is given
+        if period is None:
+            return [self.tax(i, income, rate_offset) for i, income in enumerate(incomes)]
+        return [self.tax(period, income, rate_offset) for income in incomes]
+
+    def schedule(self):
+        schedule = []
+        for period, (rates, thresholds) in enumerate(zip(self.rates, self.thresholds)):
+            schedule.append((period, "RATES", *rates))
+            schedule.append((period, "BRACKETS", *thresholds))
+        return schedule
+
+
+def indexed_brackets(rates, thresholds, factors):
+    # The same rates in every period, with each threshold multiplied by the period's
+    # factor, e.g. from an InflationIndex
+    return BracketTable([rates] * len(factors), \
+                        [[threshold * factor for threshold in thresholds] for factor in factors])
+
+def read_brackets(in_file, sources={}):
+    # Takes a table, or a schedule or the path of one (which may be in sources)
+    if isinstance(in_file, str):
+        in_file = sources.get(in_file, in_file)
+    if isinstance(in_file, BracketTable):
+        return in_file
+    rates = []
+    thresholds = []
+    for input_line in read_schedule(in_file):
+        if len(input_line) < 2:
+            continue
+        period = int(input_line[0])
+        command = input_line[1]
+        while len(rates) <= period:
+            rates.append([])
+            thresholds.append([])
+        if command == "RATES":
+            rates[period] = [float(rate) for rate in input_line[2:]]
+        if command == "BRACKETS":
+            thresholds[period] = [float(threshold) for threshold in input_line[2:]]
+    return BracketTable(rates, thresholds)
@@ -0,0 +1,102 @@
+# A cache of whole simulation runs on local disk, keyed on a hash of everything a run
+# depends on: the params, every input schedule and bracket table, the horizon and the
+# model version (see Simulator.cache_key). A run that repeats an earlier configuration,
+# e.g. a sweep point tried before, then loads its results instead of being simulated.
+#
+# Each entry is one file named by its key. Reading an entry touches it, and once the
+# entries add up to more than max_bytes, the least recently used ones are removed.
+# Entries are written to a temporary file first, so processes sharing a cache directory
+# never see half an entry.
+
+from brackets import BracketTable
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+def content_hash(parts):
+    # parts are schedules, series, bracket tables, params or any other values, and a
+    # string naming a file that exists stands for the file's contents
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, BracketTable):
+            part = part.schedule()
+        if isinstance(part, str) and os.path.isfile(part):
+            f = open(part, "rb")
+            digest.update(f.read())
+            f.close()
+        else:
+            # Equal values can pickle differently, which only costs a cache miss, but
+            # different values never pickle the same
+            digest.update(pickle.dumps(part))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir="cache", max_bytes=100 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+    def get(self, key):
+        # The entry for the key, a dict of the results, or None. The final report is not
+        # kept, as print_final_report() works it out from the results.
+        path = self.path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        entry = pickle.load(f)
+        f.close()
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key, results):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "results": {name: list(series) for name, series in results.items()}
+        }
+        f = tempfile.NamedTemporaryFile("wb", dir=self.cache_dir, delete=False)
+        pickle.dump(entry, f)
+        f.close()
+        os.replace(f.name, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pickle"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total_bytes = sum([size for _, size, _ in entries])
+        for _, size, name in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pickle"):
+                os.remove(os.path.join(self.cache_dir, name))
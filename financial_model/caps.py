@@ -0,0 +1,199 @@
+# The caps on super contributions, as described at the top of superannuation.py, tracked
+# by financial year (year y is weeks 52 * y to 52 * y + 51):
+#   Concessional contributions (CCs) are capped at CC_YEARLY_CAP a year. Going over uses
+#   the unused cap of up to CARRY_FORWARD_YEARS earlier years, oldest first, provided the
+#   total super balance at the end of the previous year was under
+#   CARRY_FORWARD_BALANCE_LIMIT (carry-forward).
+#   Non-concessional contributions (NCCs) are capped at NCC_CAP_MULTIPLE times the CC cap
+#   a year. Going over brings forward the caps of the next years, for up to
+#   BRING_FORWARD_YEARS years' worth over those years (bring-forward).
+#   Voluntary contributions count towards the first home super saver scheme (FHSS) up
+#   to FHSS_YEARLY_LIMIT a year and FHSS_TOTAL_LIMIT in all, and only within the caps.
+# Whatever goes over a cap is excess. Contributions are added in week order, and every
+# cap's ledgers are updated as each one is added, so what is left of a cap is always a
+# lookup. The CC and NCC caps can be indexed, e.g. to an InflationIndex, from the start
+# of each year. The FHSS limits are fixed amounts.
+
+CC_YEARLY_CAP = 27500
+NCC_CAP_MULTIPLE = 4
+CARRY_FORWARD_YEARS = 5
+CARRY_FORWARD_BALANCE_LIMIT = 500000
+BRING_FORWARD_YEARS = 3
+FHSS_YEARLY_LIMIT = 15000
+FHSS_TOTAL_LIMIT = 50000
+# The annual rate FHSS earnings are deemed at: the shortfall interest charge rate, which
+# the ATO sets every quarter as its base interest rate (the 90-day bank bill yield) plus
+# 3%. The base rate is taken to stay at about what it was in 2025.
+FHSS_BASE_INTEREST_RATE = 4.4
+FHSS_DEEMED_RATE = FHSS_BASE_INTEREST_RATE + 3
+
+# The contribution variants in a super schedule: CCs and NCCs, and the voluntary ones of
+# each that count towards the FHSS
+CC_VARIANTS = ["CC", "FHSS_CC"]
+NCC_VARIANTS = ["NCC", "FHSS_NCC"]
+FHSS_VARIANTS = ["FHSS_CC", "FHSS_NCC"]
+
+class ContributionCaps:
+    def __init__(self, cc_yearly_cap=CC_YEARLY_CAP, index=None):
+        self.cc_yearly_cap = cc_yearly_cap
+        self.index = index
+        # Each year's contributions, what went over its caps, and what counted towards
+        # the FHSS
+        self.cc = []
+        self.ncc = []
+        self.excess_cc = []
+        self.excess_ncc = []
+        self.fhss = []
+        self.fhss_total = 0
+        # Each year's CC cap left unused, less what later years have carried forward,
+        # and the total of it over the years that can still be carried forward
+        self.unused_cc = []
+        self.carry_forward = 0
+        self.carry_forward_allowed = True
+        # The first year of the bring-forward period in effect, and the NCCs made in it
+        self.bring_forward_year = None
+        self.bring_forward_ncc = 0
+        self.start_year(0)
+
+    def cap(self, year):
+        # The CC cap for the year
+        if self.index is None:
+            return self.cc_yearly_cap
+        return self.cc_yearly_cap * self.index[52 * year]
+
+    def year(self):
+        return len(self.cc) - 1
+
+    def start_year(self, year, balance=None):
+        # Closes the years before the given one. balance is the total super balance at the
+        # end of the previous year, or None if it is not known, for carry-forward.
+        while self.year() < year:
+            closed_year = self.year()
+            if closed_year >= 0:
+                self.unused_cc[closed_year] = max(0, self.cap(closed_year) - self.cc[closed_year])
+                self.carry_forward += self.unused_cc[closed_year]
+                expired_year = closed_year - CARRY_FORWARD_YEARS
+                if expired_year >= 0:
+                    self.carry_forward -= self.unused_cc[expired_year]
+                    self.unused_cc[expired_year] = 0
+            for ledger in [self.cc, self.ncc, self.excess_cc, self.excess_ncc, self.fhss, \
+                            self.unused_cc]:
+                ledger.append(0)
+        self.carry_forward_allowed = balance is None or balance < CARRY_FORWARD_BALANCE_LIMIT
+        if self.bring_forward_year is not None \
+                and year >= self.bring_forward_year + BRING_FORWARD_YEARS:
+            self.bring_forward_year = None
+            self.bring_forward_ncc = 0
+
+    def contribute(self, week, amount, variant):
+        # Adds a contribution, and returns the part of it that went over the caps
+        year = week // 52
+        if year > self.year():
+            self.start_year(year)
+        if variant in CC_VARIANTS:
+            excess = self.contribute_cc(year, amount)
+        elif variant in NCC_VARIANTS:
+            excess = self.contribute_ncc(year, amount)
+        else:
+            return 0
+        if variant in FHSS_VARIANTS:
+            counted = min(amount - excess, FHSS_YEARLY_LIMIT - self.fhss[year], \
+                            FHSS_TOTAL_LIMIT - self.fhss_total)
+            if counted > 0:
+                self.fhss[year] += counted
+                self.fhss_total += counted
+        return excess
+
+    def contribute_cc(self, year, amount):
+        over = amount - max(0, self.cap(year) - self.cc[year])
+        self.cc[year] += amount
+        if over <= 0:
+            return 0
+        if self.carry_forward_allowed:
+            for earlier_year in range(max(0, year - CARRY_FORWARD_YEARS), year):
+                carried = min(over, self.unused_cc[earlier_year])
+                self.unused_cc[earlier_year] -= carried
+                self.carry_forward -= carried
+                over -= carried
+                if over <= 0:
+                    return 0
+        self.excess_cc[year] += over
+        return over
+
+    def contribute_ncc(self, year, amount):
+        cap = NCC_CAP_MULTIPLE * self.cap(year)
+        self.ncc[year] += amount
+        if self.bring_forward_year is None:
+            if self.ncc[year] <= cap:
+                return 0
+            self.bring_forward_year = year
+            self.bring_forward_ncc = self.ncc[year] - amount
+        limit = BRING_FORWARD_YEARS * NCC_CAP_MULTIPLE * self.cap(self.bring_forward_year)
+        over = min(amount, self.bring_forward_ncc + amount - limit)
+        self.bring_forward_ncc += amount
+        if over <= 0:
+            return 0
+        self.excess_ncc[year] += over
+        return over
+
+    def remaining_cc(self, week):
+        # The most that can be contributed as CCs in the week's year without going over
+        year = week // 52
+        if year > self.year():
+            self.start_year(year)
+        carry_forward = self.carry_forward if self.carry_forward_allowed else 0
+        return max(0, self.cap(year) - self.cc[year]) + carry_forward
+
+    def remaining_ncc(self, week):
+        # The most that can be contributed as NCCs in the week's year without going
+        # over, bringing forward later years' caps if it has to
+        year = week // 52
+        if year > self.year():
+            self.start_year(year)
+        if self.bring_forward_year is None:
+            return max(0, BRING_FORWARD_YEARS * NCC_CAP_MULTIPLE * self.cap(year) \
+                            - self.ncc[year])
+        limit = BRING_FORWARD_YEARS * NCC_CAP_MULTIPLE * self.cap(self.bring_forward_year)
+        return max(0, limit - self.bring_forward_ncc)
+
+    def remaining_fhss(self, week):
+        # The most that can still count towards the FHSS in the week's year
+        year = week // 52
+        if year > self.year():
+            self.start_year(year)
+        return max(0, min(FHSS_YEARLY_LIMIT - self.fhss[year], \
+                            FHSS_TOTAL_LIMIT - self.fhss_total))
+
+    def excess(self):
+        # The CCs and NCCs over the caps in each year that had any
+        return {year: {"CC": self.excess_cc[year], "NCC": self.excess_ncc[year]} \
+                for year in range(len(self.cc)) \
+                if self.excess_cc[year] > 0 or self.excess_ncc[year] > 0}
+
+    def checkpoint(self):
+        return {
+            "cc": list(self.cc),
+            "ncc": list(self.ncc),
+            "excess_cc": list(self.excess_cc),
+            "excess_ncc": list(self.excess_ncc),
+            "fhss": list(self.fhss),
+            "fhss_total": self.fhss_total,
+            "unused_cc": list(self.unused_cc),
+            "carry_forward": self.carry_forward,
+            "carry_forward_allowed": self.carry_forward_allowed,
+            "bring_forward_year": self.bring_forward_year,
+            "bring_forward_ncc": self.bring_forward_ncc
+        }
+
+    def restore(self, state):
+        self.cc = list(state["cc"])
+        self.ncc = list(state["ncc"])
+        self.excess_cc = list(state["excess_cc"])
+        self.excess_ncc = list(state["excess_ncc"])
+        self.fhss = list(state["fhss"])
+        self.fhss_total = state["fhss_total"]
+        self.unused_cc = list(state["unused_cc"])
+        self.carry_forward = state["carry_forward"]
+        self.carry_forward_allowed = state["carry_forward_allowed"]
+        self.bring_forward_year = state["bring_forward_year"]
+        self.bring_forward_ncc = state["bring_forward_ncc"]
@@ -4,61 +4,111 @@
 # Actual balloon payment paid is {balloon_payment} specified plus interest it accrues over the loan term
 # {duration} is in years
 
-import math
+from amortization import amortize
+from checkpoints import drop_checkpoints_after
+from ledger import EventLedger
+from rates import GrowthIndex
+from schedule import event_weeks, read_events, write_schedule, write_series
 
 class CarLoan:
     def __init__(self, in_file, params):
         self.in_file = in_file
         self.out_file_gen = OutputFileGenerator()
         self.out_cash_file_gen = OutputCashFileGenerator()
-        self.interest_rate = params["ANNUAL_INTEREST_RATE"]
-        self.weekly_interest_rate = (math.exp(math.log(1 + self.interest_rate / 100) / 52) - 1) \
-                                    * 100
+        self.interest_index = GrowthIndex(params["ANNUAL_INTEREST_RATE"])
+        # Set to a dict to keep a checkpoint at week 0 and at every event, see
+        # checkpoints.py. Between events a stretch of weeks is worked out in one go, so
+        # events are where the loan can be resumed from.
+        self.checkpoints = None
 
-    def simulate(self, num_weeks):
-        f = open(self.in_file, "r")
+    def simulate(self, num_weeks, export=True, start=0):
+        # start can be a week with a checkpoint, to carry on from there
+        events = read_events(self.in_file)
         self.loan_amount = 0
+        self.weekly_repayment = 0
         self.balloon_payment = {
                 "amount": 0,
                 "time": -1
             }
-        input_line = f.readline().split()
-        time = int(input_line[0])
-        for week in range(num_weeks):
-            while time == week:
-                if len(input_line) == 5:
-                    time, command, amount, balloon_payment, duration = input_line
-                    time, amount, balloon_payment = int(time), float(amount), int(balloon_payment)
-                    duration = int(duration)
-                    if command == "START":
-                        self.buy(amount, balloon_payment, time, duration)
-                        self.weekly_repayment = self.minimum_repayment(self.loan_amount, \
-                                                                        self.interest_rate, \
-                                                                        duration)
-                input_line = f.readline().split()
-                if len(input_line) == 0:
-                    break
-                time = int(input_line[0])
-            self.out_file_gen.write_output(self.loan_amount \
-                                            + self.balloon_payment["amount"])
-            if week == self.balloon_payment["time"]:
-                self.out_cash_file_gen.add_payment({
-                    "time": week,
-                    "amount": self.balloon_payment["amount"]
-                })
-                #self.loan_amount -= self.balloon_payment["amount"]
-                self.balloon_payment["amount"] = 0
-            self.balloon_payment["amount"] *= 1 + self.weekly_interest_rate / 100
-            if self.loan_amount > 0:
-                self.out_cash_file_gen.add_payment({
-                    "time": week,
-                    "amount": self.weekly_repayment
-                })
-                self.loan_amount *= 1 + self.weekly_interest_rate / 100
-                self.loan_amount -= self.weekly_repayment
-        f.close()
-        self.out_file_gen.generate_output_file()
-        self.out_cash_file_gen.generate_output_file(num_weeks)
+        # Between events the loan only changes by its weekly repayment, so each stretch
+        # of weeks is amortized in one go
+        if start > 0:
+            self.restore(start)
+        elif self.checkpoints is not None:
+            self.checkpoints[0] = self.checkpoint()
+        week = start
+        for event_week in sorted(events):
+            if event_week < start:
+                continue
+            if event_week >= num_weeks:
+                break
+            self.repay(week, event_week)
+            if self.checkpoints is not None:
+                self.checkpoints[event_week] = self.checkpoint()
+            for input_line in events[event_week]:
+                self.apply_event(input_line)
+            week = event_week
+        self.repay(week, num_weeks)
+        self.out_file_gen.generate_output_file(export)
+        self.out_cash_file_gen.generate_output_file(num_weeks, export)
+
+    def apply_event(self, input_line):
+        if len(input_line) == 5:
+            time, command, amount, balloon_payment, duration = input_line
+            time, amount, balloon_payment = int(time), float(amount), int(balloon_payment)
+            duration = int(duration)
+            if command == "START":
+                self.buy(amount, balloon_payment, time, duration)
+                interest_rate = self.interest_index.annual_rate(time)
+                self.weekly_repayment = self.minimum_repayment(self.loan_amount, \
+                                                                interest_rate, \
+                                                                duration)
+
+    def repay(self, start, end):
+        # Writes out the weeks from start up to end. Once the loan is no longer owing,
+        # repayments stop and the balance is left where it is.
+        if start == end:
+            return
+        if self.loan_amount > 0:
+            balances, last_week, closing_balance = amortize(self.interest_index, \
+                                                            self.loan_amount, \
+                                                            self.weekly_repayment, \
+                                                            start, end)
+            balances.extend([closing_balance] * (end - start - len(balances)))
+            self.out_cash_file_gen.add_payments(self.weekly_repayment, start, last_week)
+            self.loan_amount = closing_balance
+        else:
+            balances = [self.loan_amount] * (end - start)
+        # The balloon payment accrues interest until it is paid
+        balloon_time = self.balloon_payment["time"]
+        balloon_amount = self.balloon_payment["amount"]
+        balloon_start = self.interest_index[start]
+        for week in range(start, min(end, balloon_time + 1)):
+            amount = balloon_amount * self.interest_index[week] / balloon_start
+            balances[week - start] += amount
+            if week == balloon_time:
+                self.out_cash_file_gen.add_payments(amount, week, week + 1)
+                balloon_amount = 0
+        if end <= balloon_time:
+            balloon_amount *= self.interest_index[end] / balloon_start
+        self.balloon_payment["amount"] = balloon_amount
+        self.out_file_gen.write_outputs(balances)
+
+    def checkpoint(self):
+        return {
+            "loan_amount": self.loan_amount,
+            "weekly_repayment": self.weekly_repayment,
+            "balloon_payment": dict(self.balloon_payment)
+        }
+
+    def restore(self, week):
+        state = self.checkpoints[week]
+        self.loan_amount = state["loan_amount"]
+        self.weekly_repayment = state["weekly_repayment"]
+        self.balloon_payment = dict(state["balloon_payment"])
+        del self.out_file_gen.loan_value[week:]
+        self.out_cash_file_gen.loan_payments.truncate(week)
+        drop_checkpoints_after(self.checkpoints, week)
 
     def buy(self, amount, balloon_payment, time, duration):
         self.loan_amount = amount - balloon_payment
@@ -77,23 +127,96 @@ class CarLoan:
                 ** num_payments) / ((1 + weekly_interest_rate) ** num_payments - 1)
 
 
+class CarLoanPaths:
+    # The same car loan schedule run under a batch of interest rate paths at once, as
+    # HomeLoanPaths does for the home loan. Only the balances in the sample weeks and the
+    # total repaid on each path are kept.
+    def __init__(self, in_file, interest_rates):
+        self.in_file = in_file
+        # A PathRates, see rates.py
+        self.interest_rates = interest_rates
+
+    def simulate(self, num_weeks, sample_weeks=None):
+        events = read_events(self.in_file)
+        num_paths = len(self.interest_rates)
+        self.sample_weeks = sorted(range(num_weeks) if sample_weeks is None else sample_weeks)
+        sampled = set(self.sample_weeks)
+        # balances[i] is the balance of each path at the start of sample_weeks[i],
+        # including the balloon payment
+        self.balances = []
+        self.repaid = [0] * num_paths
+        self.loan_amounts = [0] * num_paths
+        self.weekly_repayments = [0] * num_paths
+        self.balloon_amounts = [0] * num_paths
+        self.balloon_time = -1
+        for week in range(num_weeks):
+            for input_line in events.get(week, []):
+                self.apply_event(input_line)
+            if week in sampled:
+                self.balances.append([loan + balloon for loan, balloon \
+                                        in zip(self.loan_amounts, self.balloon_amounts)])
+            # The balloon payment accrues interest until it is paid
+            if week <= self.balloon_time:
+                growths = self.interest_rates.growths(week)
+                if week == self.balloon_time:
+                    self.repaid = [repaid + balloon for repaid, balloon \
+                                    in zip(self.repaid, self.balloon_amounts)]
+                    self.balloon_amounts = [0] * num_paths
+                else:
+                    self.balloon_amounts = [balloon * growth for balloon, growth \
+                                            in zip(self.balloon_amounts, growths)]
+            # Once the loan is no longer owing, repayments stop and the balance is left
+            # where it is
+            if max(self.loan_amounts) <= 0:
+                continue
+            if week > self.balloon_time:
+                growths = self.interest_rates.growths(week)
+            self.repaid = [repaid + repayment if loan > 0 else repaid \
+                            for repaid, loan, repayment \
+                            in zip(self.repaid, self.loan_amounts, self.weekly_repayments)]
+            self.loan_amounts = [loan * growth - repayment if loan > 0 else loan \
+                                    for loan, growth, repayment \
+                                    in zip(self.loan_amounts, growths, self.weekly_repayments)]
+
+    def apply_event(self, input_line):
+        if len(input_line) == 5:
+            time, command, amount, balloon_payment, duration = input_line
+            time, amount, balloon_payment = int(time), float(amount), int(balloon_payment)
+            duration = int(duration)
+            if command == "START":
+                num_paths = len(self.loan_amounts)
+                self.loan_amounts = [amount - balloon_payment] * num_paths
+                self.balloon_amounts = [balloon_payment] * num_paths
+                self.balloon_time = time + 52 * duration
+                self.weekly_repayments = [self.minimum_repayment(amount - balloon_payment, \
+                                                                    interest_rate, duration) \
+                                            for interest_rate \
+                                            in self.interest_rates.annual(time)]
+
+    def minimum_repayment(self, loan_amount, interest_rate, loan_years):
+        weekly_interest_rate = interest_rate / 52 / 100
+        num_payments = loan_years * 52
+        return (loan_amount * weekly_interest_rate * (1 + weekly_interest_rate) \
+                ** num_payments) / ((1 + weekly_interest_rate) ** num_payments - 1)
+
+
 class InputFileGenerator:
     def __init__(self, num_weeks):
-        self.in_file = open("input_files/car_loan.txt", "w")
+        self.in_file = "input_files/car_loan.txt"
         self.num_weeks = num_weeks
         self.buy_list = {}
 
+    def events(self):
+        for week in event_weeks(self.num_weeks, self.buy_list):
+            yield (week, "START", self.buy_list[week]["amount"],
+                    self.buy_list[week]["balloon_payment"],
+                    self.buy_list[week]["duration"])
+
+    def schedule(self):
+        return list(self.events())
+
     def write(self):
-        for week in range(self.num_weeks):
-            try:
-                self.in_file.write(f"{week} START {self.buy_list[week]['amount']} " \
-                                    f"{self.buy_list[week]['balloon_payment']} " \
-                                    f"{self.buy_list[week]['duration']}\n")
-            except:
-                pass
-            if week not in self.buy_list:
-                self.in_file.write(f"{week}\n")
-        self.in_file.close()
+        write_schedule(self.in_file, self.events(), self.num_weeks)
 
     def buy(self, amount, balloon_payment, time, duration):
         self.buy_list[time] = {
@@ -105,39 +228,35 @@ class InputFileGenerator:
 
 class OutputFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/car_loan.txt", "w")
+        self.out_file = "output_files/car_loan.txt"
         self.loan_value = []
 
     def write_output(self, amount):
         self.loan_value.append(amount)
 
-    def generate_output_file(self):
-        for week in range(len(self.loan_value)):
-            self.out_file.write(f"{week} {self.loan_value[week]}\n")
-        self.out_file.close()
+    def write_outputs(self, amounts):
+        self.loan_value.extend(amounts)
+
+    def generate_output_file(self, export=True):
+        if export:
+            write_series(self.out_file, self.loan_value)
 
 
 class OutputCashFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/cash/car_loan.txt", "w")
-        self.loan_payments = []
+        self.out_file = "output_files/cash/car_loan.txt"
+        # Amount repaid in each week
+        self.loan_payments = EventLedger()
+        self.cash = []
 
-    def add_payment(self, payment):
-        self.loan_payments.append(payment)
+    def add_payments(self, amount, start, end):
+        # amount is paid in each week from start up to end
+        self.loan_payments.add_range(start, end, amount)
 
-    def generate_output_file(self, num_weeks):
-        # I will assume the list is sorted based on time
-        for week in range(num_weeks):
-            amount = 0
-            if len(self.loan_payments) == 0:
-                break
-            while week == self.loan_payments[0]["time"]:
-                amount += self.loan_payments[0]["amount"]
-                self.loan_payments.pop(0)
-                if len(self.loan_payments) == 0:
-                    break
-            self.out_file.write(f"{week} {-amount}\n")
-        self.out_file.close()
+    def generate_output_file(self, num_weeks, export=True):
+        self.cash = [-amount for amount in self.loan_payments.amounts(num_weeks)]
+        if export:
+            write_series(self.out_file, self.cash)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+# Change detection for incremental re-simulation.
+#
+# Every input is fingerprinted with a hash of each year of its lines, so comparing the
+# fingerprints of two runs gives the first year an input changed in. An asset that keeps
+# checkpoints of its state (a dict of week -> state at the start of that week) can then
+# be resumed from its latest checkpoint before the change, rather than from week 0.
+
+from brackets import BracketTable
+from schedule import read_schedule
+
+def fingerprint(source, weeks_per_period=1):
+    # A hash of the lines of each year of a schedule or bracket table. The first field of
+    # a line is its period, which is weeks_per_period weeks long.
+    if isinstance(source, BracketTable):
+        source = source.schedule()
+    years = {}
+    for line in read_schedule(source):
+        if len(line) > 0:
+            year = int(line[0]) * weeks_per_period // 52
+            years.setdefault(year, []).append(tuple(line))
+    return [hash(tuple(years.get(year, ()))) for year in range(max(years, default=-1) + 1)]
+
+def first_change(old, new):
+    # The first week of the first year that differs between two fingerprints, or None
+    # if they are the same
+    for year in range(max(len(old), len(new))):
+        if year >= len(old) or year >= len(new) or old[year] != new[year]:
+            return year * 52
+    return None
+
+def earliest(*weeks):
+    # The earliest of the weeks that are not None, or None if they all are
+    weeks = [week for week in weeks if week is not None]
+    return min(weeks, default=None)
+
+def latest_checkpoint(checkpoints, week):
+    # The last week with a checkpoint at or before week, or None if there is none
+    return max([checkpoint for checkpoint in checkpoints if checkpoint <= week], default=None)
+
+def drop_checkpoints_after(checkpoints, week):
+    # Checkpoints after the week a run resumes from are stale once it has resumed
+    for checkpoint in [checkpoint for checkpoint in checkpoints if checkpoint > week]:
+        del checkpoints[checkpoint]
@@ -0,0 +1,125 @@
+# Binary columnar files, an optional alternative to the text input and output files for
+# anything numeric: the output series, tax receipts and invoices, and the income and
+# misc schedules. Readers tell the two apart by the magic bytes at the start, so a file
+# keeps its name in either form.
+#
+# Layout, all little-endian:
+#   magic        8 bytes, b"FMCOLS01"
+#   horizon      uint32, the number of weeks (or years, for invoices) covered
+#   num_rows     uint32
+#   num_columns  uint32, not counting the week index
+#   names_size   uint32, the size of the column names
+#   names        the column names in utf-8, separated by "\n"
+#   weeks        int32 week index for each row
+#   columns      float64 for each row, one column after another
+# The names and week index are zero-padded to a multiple of 8 bytes, so every column
+# starts 8-byte aligned and can be mapped straight into an array, e.g.
+#   numpy.memmap(path, dtype="<f8", mode="r", offset=offset, shape=(num_rows,))
+# with the offset from column_offsets(). Reading maps the file and hands out memoryviews
+# of it, without copying the columns.
+#
+# To convert files between the text and binary forms, from this directory:
+#   python columnar.py binary output_files/cash/*.txt
+#   python columnar.py text output_files/cash/*.txt
+
+from array import array
+import mmap
+import struct
+import sys
+
+MAGIC = b"FMCOLS01"
+HEADER = struct.Struct("<8sIIII")
+
+def padding(size):
+    return -size % 8
+
+def is_columnar(path):
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return False
+    magic = f.read(len(MAGIC))
+    f.close()
+    return magic == MAGIC
+
+def write_columnar(path, weeks, columns, names=None, horizon=None):
+    weeks = array("i", weeks)
+    columns = [array("d", column) for column in columns]
+    if names is None:
+        names = [f"amount{i}" for i in range(len(columns))]
+    if horizon is None:
+        horizon = weeks[-1] + 1 if len(weeks) > 0 else 0
+    if sys.byteorder != "little":
+        for column in [weeks] + columns:
+            column.byteswap()
+    names = "\n".join(names).encode()
+    f = open(path, "wb")
+    f.write(HEADER.pack(MAGIC, horizon, len(weeks), len(columns), len(names)))
+    f.write(names + bytes(padding(len(names))))
+    weeks = weeks.tobytes()
+    f.write(weeks + bytes(padding(len(weeks))))
+    for column in columns:
+        f.write(column.tobytes())
+    f.close()
+
+def column_offsets(num_rows, num_columns, names_size):
+    # The byte offsets of the week index and of each column
+    weeks_offset = HEADER.size + names_size + padding(names_size)
+    columns_offset = weeks_offset + 4 * num_rows + padding(4 * num_rows)
+    return weeks_offset, [columns_offset + 8 * num_rows * i for i in range(num_columns)]
+
+def read_columnar(path):
+    # Returns a dict of the horizon, column names, week index and columns, where the
+    # week index and columns are memoryviews of the mapped file
+    f = open(path, "rb")
+    header = f.read(HEADER.size)
+    magic, horizon, num_rows, num_columns, names_size = HEADER.unpack(header)
+    names = f.read(names_size).decode().split("\n") if num_columns > 0 else []
+    if num_rows == 0:
+        f.close()
+        return {"horizon": horizon, "names": names, "weeks": [], \
+                "columns": [[] for _ in names]}
+    data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    f.close()
+    weeks_offset, offsets = column_offsets(num_rows, num_columns, names_size)
+    weeks = data[weeks_offset:weeks_offset + 4 * num_rows].cast("i")
+    columns = [data[offset:offset + 8 * num_rows].cast("d") for offset in offsets]
+    if sys.byteorder != "little":
+        weeks = array("i", weeks)
+        weeks.byteswap()
+        columns = [array("d", column) for column in columns]
+        for column in columns:
+            column.byteswap()
+    return {"horizon": horizon, "names": names, "weeks": weeks, "columns": columns}
+
+def convert(path, to_format):
+    # Rewrites a numeric text file as binary, or a binary file as text, in place
+    import schedule
+    if to_format == "binary":
+        if is_columnar(path):
+            return
+        horizon = schedule.read_horizon(path)
+        lines = list(schedule.read_schedule(path))
+        num_columns = max([len(line) for line in lines], default=1) - 1
+        try:
+            weeks = [int(line[0]) for line in lines]
+            columns = [[float(line[i + 1]) if len(line) > i + 1 else 0 for line in lines] \
+                        for i in range(num_columns)]
+        except ValueError:
+            raise ValueError(f"{path} has commands, only numeric files can be binary")
+        write_columnar(path, weeks, columns, horizon=horizon)
+    elif to_format == "text":
+        if not is_columnar(path):
+            return
+        table = read_columnar(path)
+        lines = [(week, *amounts) for week, amounts in zip(table["weeks"], \
+                                                            zip(*table["columns"]))]
+        schedule.write_schedule(path, lines, table["horizon"])
+    else:
+        raise ValueError(f"Unknown format {to_format}")
+
+
+if __name__ == "__main__":
+    to_format = sys.argv[1]
+    for path in sys.argv[2:]:
+        convert(path, to_format)
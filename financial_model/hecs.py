@@ -1,54 +1,88 @@
-import math
+from brackets import read_brackets
+from checkpoints import drop_checkpoints_after
+from ledger import EventLedger
+from rates import GrowthIndex
+from schedule import event_weeks, read_events, read_schedule, read_schedule_from, write_schedule, write_series
 
 class Hecs:
-    def __init__(self, in_file, params):
+    def __init__(self, in_file, params, income_file="input_files/income.txt", \
+                    brackets_file="input_files/hecs_brackets.txt"):
         self.in_file = in_file
-        self.brackets_file = open("input_files/hecs_brackets.txt", "r")
-        self.income_file = open("input_files/income.txt", "r")
+        self.income_file = income_file
+        self.brackets_file = brackets_file
         self.out_file_gen = OutputFileGenerator()
         self.out_cash_file_gen = OutputCashFileGenerator()
-        self.interest_rate = params["ANNUAL_INDEXATION_RATE"]
-        self.weekly_interest_rate = (math.exp(math.log(1 + self.interest_rate / 100) / 52) - 1) \
-                                    * 100
-
-    def simulate(self, num_weeks):
-        f = open(self.in_file, "r")
-        hecs_debt_started = False
-        input_line = f.readline().split()
-        time = int(input_line[0])
-        for week in range(num_weeks):
+        self.interest_index = GrowthIndex(params["ANNUAL_INDEXATION_RATE"])
+        # Set to a dict to keep a checkpoint at the start of every year, see checkpoints.py
+        self.checkpoints = None
+
+    def simulate(self, num_weeks, export=True, start=0):
+        # start can be a week with a checkpoint, to carry on from there
+        input_lines = read_schedule_from(self.in_file, start)
+        self.brackets = read_brackets(self.brackets_file)
+        self.num_weeks = num_weeks
+        # Worked out the first time a repayment is due, see minimum_repayment()
+        self.repayments = None
+        self.loan_amount = 0
+        self.weekly_repayment = 0
+        self.hecs_debt_started = False
+        if start > 0:
+            self.restore(start)
+        input_line = next(input_lines, [])
+        time = int(input_line[0]) if len(input_line) > 0 else -1
+        for week in range(start, num_weeks):
+            if self.checkpoints is not None and week % 52 == 0:
+                self.checkpoints[week] = self.checkpoint()
             while time == week:
                 if len(input_line) == 3:
                     time, command, amount = input_line
                     time, amount = int(time), int(amount)
                     if command == "START":
                         self.buy(amount, week)
-                        hecs_debt_started = True
+                        self.hecs_debt_started = True
                     if command == "PAY":
                         self.pay(amount, week)
-                        self.out_cash_file_gen.add_payment({
-                            "time": week,
-                            "amount": amount
-                        })
-                input_line = f.readline().split()
+                        self.out_cash_file_gen.add_payment(amount, week)
+                input_line = next(input_lines, [])
                 if len(input_line) == 0:
                     break
                 time = int(input_line[0])
-            if hecs_debt_started:
-                self.weekly_repayment = self.minimum_repayment(week)
+            # With nothing owing and no events to come, e.g. with no HECS debt at all, the
+            # balance stays where it is to the end
+            if len(input_line) == 0 and self.loan_amount <= 0:
+                self.settle(week, num_weeks)
+                break
             self.out_file_gen.write_output(self.loan_amount)
             if self.loan_amount > 0:
-                self.out_cash_file_gen.add_payment({
-                    "time": week,
-                    "amount": self.weekly_repayment
-                })
-                self.loan_amount *= 1 + self.weekly_interest_rate / 100
+                if self.hecs_debt_started:
+                    self.weekly_repayment = self.minimum_repayment(week)
+                self.out_cash_file_gen.add_payment(self.weekly_repayment, week)
+                self.loan_amount *= 1 + self.interest_index.rate(week) / 100
                 self.loan_amount -= self.weekly_repayment
-        f.close()
-        self.brackets_file.close()
-        self.income_file.close()
-        self.out_file_gen.generate_output_file()
-        self.out_cash_file_gen.generate_output_file(num_weeks)
+        self.out_file_gen.generate_output_file(export)
+        self.out_cash_file_gen.generate_output_file(num_weeks, export)
+
+    def settle(self, start, num_weeks):
+        if self.checkpoints is not None:
+            for week in range((start // 52 + 1) * 52, num_weeks, 52):
+                self.checkpoints[week] = self.checkpoint()
+        self.out_file_gen.write_outputs([self.loan_amount] * (num_weeks - start))
+
+    def checkpoint(self):
+        return {
+            "loan_amount": self.loan_amount,
+            "weekly_repayment": self.weekly_repayment,
+            "hecs_debt_started": self.hecs_debt_started
+        }
+
+    def restore(self, week):
+        state = self.checkpoints[week]
+        self.loan_amount = state["loan_amount"]
+        self.weekly_repayment = state["weekly_repayment"]
+        self.hecs_debt_started = state["hecs_debt_started"]
+        del self.out_file_gen.loan_value[week:]
+        self.out_cash_file_gen.loan_payments.truncate(week)
+        drop_checkpoints_after(self.checkpoints, week)
 
     def buy(self, amount, time):
         self.loan_amount = amount
@@ -57,60 +91,133 @@ class Hecs:
         self.loan_amount -= amount
 
     def minimum_repayment(self, time):
-        #TODO:Fix this method, because each income bracket should be compared against
-        #     taxable income plus super contributions
-        income_brackets = []
-        repayment_rates = []
-        while len(income_brackets) == 0 or len(repayment_rates) == 0:
-            input_line = self.brackets_file.readline().split()
-            if len(input_line) > 0:
-                week = int(input_line[0])
-                command = input_line[1]
-                if week == time:
-                    if command == "RATES":
-                        for i in range(2, len(input_line)):
-                            repayment_rates.append(float(input_line[i]))
-                    if command == "BRACKETS":
-                        for i in range(2, len(input_line)):
-                            income_brackets.append(float(input_line[i]))
-
-        week, weekly_income = self.income_file.readline().split()
-        week = int(week)
-        while week != time:
-            week, weekly_income = self.income_file.readline().split()
-            week = int(week)
-        weekly_income = float(weekly_income)
-        annual_income = weekly_income * 52
-        for i, income_bracket in enumerate(income_brackets):
-            if annual_income < income_bracket:
-                repayment_rate = repayment_rates[i]
-                break
-        if annual_income > income_brackets[-1]:
-            repayment_rate = repayment_rates[-1]
-        return weekly_income * repayment_rate / 100
+        # The repayments from the first week one is due to the end are worked out together
+        # from the income series, so a run without a HECS debt never reads the income
+        if self.repayments is None:
+            self.repayments = weekly_repayments(self.brackets, \
+                                                weekly_incomes(self.income_file, self.num_weeks), \
+                                                self.num_weeks, time)
+        return self.repayments[time]
+
+
+class HecsPaths:
+    # The same HECS schedule run under a batch of paths at once, as HomeLoanPaths does
+    # for the home loan. Each path has its own indexation rates and its own income, so
+    # its own repayments. Paths can share an income series, and the repayments on each
+    # distinct series are only worked out once. Only the balances in the sample
+    # weeks and the total repaid on each path are kept.
+    def __init__(self, in_file, indexation_rates, incomes, \
+                    brackets_file="input_files/hecs_brackets.txt"):
+        self.in_file = in_file
+        # A PathRates, see rates.py
+        self.indexation_rates = indexation_rates
+        # The weekly income in each week of each path, e.g. from weekly_incomes()
+        self.incomes = incomes
+        self.brackets_file = brackets_file
+
+    def simulate(self, num_weeks, sample_weeks=None):
+        events = read_events(self.in_file)
+        self.brackets = read_brackets(self.brackets_file)
+        self.num_weeks = num_weeks
+        num_paths = len(self.indexation_rates)
+        self.sample_weeks = sorted(range(num_weeks) if sample_weeks is None else sample_weeks)
+        sampled = set(self.sample_weeks)
+        distinct_incomes = {}
+        for income in self.incomes:
+            distinct_incomes.setdefault(id(income), income)
+        self.distinct_incomes = list(distinct_incomes.values())
+        positions = {income_id: i for i, income_id in enumerate(distinct_incomes)}
+        self.income_positions = [positions[id(income)] for income in self.incomes]
+        # balances[i] is the balance of each path at the start of sample_weeks[i]
+        self.balances = []
+        self.repaid = [0] * num_paths
+        self.loan_amounts = [0] * num_paths
+        self.weekly_repayments = [0] * num_paths
+        self.hecs_debt_started = False
+        self.repayments = None
+        for week in range(num_weeks):
+            for input_line in events.get(week, []):
+                self.apply_event(input_line)
+            if week in sampled:
+                self.balances.append(self.loan_amounts)
+            if max(self.loan_amounts) <= 0:
+                continue
+            if self.hecs_debt_started:
+                self.weekly_repayments = self.minimum_repayments(week)
+            growths = self.indexation_rates.growths(week)
+            self.repaid = [repaid + repayment if loan > 0 else repaid \
+                            for repaid, loan, repayment \
+                            in zip(self.repaid, self.loan_amounts, self.weekly_repayments)]
+            self.loan_amounts = [loan * growth - repayment if loan > 0 else loan \
+                                    for loan, growth, repayment \
+                                    in zip(self.loan_amounts, growths, self.weekly_repayments)]
+
+    def apply_event(self, input_line):
+        # The lists are replaced rather than changed, as the balances keep them
+        if len(input_line) == 3:
+            time, command, amount = input_line
+            time, amount = int(time), int(amount)
+            if command == "START":
+                self.loan_amounts = [amount] * len(self.loan_amounts)
+                self.hecs_debt_started = True
+            if command == "PAY":
+                self.loan_amounts = [loan - amount for loan in self.loan_amounts]
+                self.repaid = [repaid + amount for repaid in self.repaid]
+
+    def minimum_repayments(self, time):
+        if self.repayments is None:
+            self.repayments = [weekly_repayments(self.brackets, income, self.num_weeks, time) \
+                                for income in self.distinct_incomes]
+        return [self.repayments[i][time] for i in self.income_positions]
+
+
+def weekly_incomes(income_file, num_weeks, sources={}):
+    # The weekly income in each week of an income schedule. Weeks without income are not
+    # listed, and are 0. Only the first line of a week is read.
+    incomes = [0] * num_weeks
+    last_week = -1
+    for line in read_schedule(income_file, sources):
+        if len(line) == 0:
+            continue
+        week = int(line[0])
+        if week >= num_weeks:
+            break
+        if week != last_week and len(line) == 2:
+            incomes[week] = float(line[1])
+        last_week = week
+    return incomes
+
+def weekly_repayments(brackets, incomes, num_weeks, start=0):
+    # The repayment due on the weekly income in each week from start up to num_weeks, with
+    # the repayment rate found from the annual income. Weeks past the end of the incomes
+    # have no income.
+    #TODO:Fix this, because each income bracket should be compared against taxable
+    #     income plus super contributions
+    incomes = list(incomes[:num_weeks]) + [0] * (num_weeks - len(incomes))
+    repayment_rates = brackets.marginal_rates([income * 52 for income in incomes], start)
+    return [0] * start + [income * repayment_rate / 100 \
+                            for income, repayment_rate in zip(incomes[start:], repayment_rates)]
 
 
 class InputFileGenerator:
     def __init__(self, num_weeks):
-        self.in_file = open("input_files/hecs.txt", "w")
+        self.in_file = "input_files/hecs.txt"
         self.num_weeks = num_weeks
         self.buy_list = {}
         self.pay_list = {}
 
+    def events(self):
+        for week in event_weeks(self.num_weeks, self.buy_list, self.pay_list):
+            if week in self.buy_list:
+                yield (week, "START", self.buy_list[week])
+            if week in self.pay_list:
+                yield (week, "PAY", self.pay_list[week])
+
+    def schedule(self):
+        return list(self.events())
+
     def write(self):
-        for week in range(self.num_weeks):
-            try:
-                self.in_file.write(f"{week} START {self.buy_list[week]}\n")
-            except:
-                pass
-            try:
-                self.in_file.write(f"{week} PAY {self.pay_list[week]}\n")
-            except:
-                pass
-            if week not in self.buy_list \
-                    and week not in self.pay_list:
-                self.in_file.write(f"{week}\n")
-        self.in_file.close()
+        write_schedule(self.in_file, self.events(), self.num_weeks)
 
     def buy(self, amount, time):
         self.buy_list[time] = amount
@@ -121,39 +228,33 @@ class InputFileGenerator:
 
 class OutputFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/hecs.txt", "w")
+        self.out_file = "output_files/hecs.txt"
         self.loan_value = []
 
     def write_output(self, amount):
         self.loan_value.append(amount)
 
-    def generate_output_file(self):
-        for week in range(len(self.loan_value)):
-            self.out_file.write(f"{week} {self.loan_value[week]}\n")
-        self.out_file.close()
+    def write_outputs(self, amounts):
+        self.loan_value.extend(amounts)
+
+    def generate_output_file(self, export=True):
+        if export:
+            write_series(self.out_file, self.loan_value)
 
 
 class OutputCashFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/cash/hecs.txt", "w")
-        self.loan_payments = []
+        self.out_file = "output_files/cash/hecs.txt"
+        self.loan_payments = EventLedger()
+        self.cash = []
 
-    def add_payment(self, payment):
-        self.loan_payments.append(payment)
+    def add_payment(self, amount, time):
+        self.loan_payments.add(time, amount)
 
-    def generate_output_file(self, num_weeks):
-        # I will assume the list is sorted based on time
-        for week in range(num_weeks):
-            amount = 0
-            if len(self.loan_payments) == 0:
-                break
-            while week == self.loan_payments[0]["time"]:
-                amount += self.loan_payments[0]["amount"]
-                self.loan_payments.pop(0)
-                if len(self.loan_payments) == 0:
-                    break
-            self.out_file.write(f"{week} {-amount}\n")
-        self.out_file.close()
+    def generate_output_file(self, num_weeks, export=True):
+        self.cash = [-amount for amount in self.loan_payments.amounts(num_weeks)]
+        if export:
+            write_series(self.out_file, self.cash)
 
 
 if __name__ == "__main__":
@@ -1,136 +1,217 @@
+# Usage:
+# {time} BUY {amount} [{id} [{annual_ror}]]
+# {time} SELL [{id}]
+# Each property can be given an id to sell it by, and its own annual growth rate instead
+# of ANNUAL_ROR. A SELL without an id sells the property held the longest. A BUY with
+# the id of a property that is held sells that property first.
+
 # I reckon have the loan in a separate input file, and simulate it separately.
 # Because what if you have multiple loans, and which one are you paying off?
 # Each loan can have its own separate input file.
 # And in the loan input file, you can specify the amount you pay in addition
 # to the minimum repayment.
 
-import math
+from rates import GrowthIndex
+from checkpoints import drop_checkpoints_after
+from ledger import EventLedger
+from schedule import event_weeks, read_schedule_from, write_schedule, write_series
 
 class Home:
     def __init__(self, in_file, params):
         self.in_file = in_file
-        self.properties = []
+        # The properties held, by id, in the order they were bought
+        self.properties = {}
         self.sold_properties = []
+        self.num_bought = 0
         annual_ror = params["ANNUAL_ROR"]
-        self.weekly_ror = 100 * (math.exp(math.log(1 + annual_ror / 100) / 52) - 1)
+        self.growth_index = GrowthIndex(annual_ror)
+        # Properties growing at the same rate are valued together, as a sum of the units
+        # of each (its buy amount over the growth index when it was bought), so valuing
+        # the portfolio each week costs the same however many properties it holds
+        self.groups = {
+            None: {
+                "growth_index": self.growth_index,
+                "units": 0
+            }
+        }
         self.out_file_gen = OutputFileGenerator()
         self.out_cash_file_gen = OutputCashFileGenerator()
-
-    def simulate(self, num_weeks):
-        f = open(self.in_file, "r")
-        input_line = f.readline().split()
-        time = int(input_line[0])
-        for week in range(num_weeks):
+        # Set to a dict to keep a checkpoint at the start of every year, see checkpoints.py
+        self.checkpoints = None
+
+    def simulate(self, num_weeks, export=True, start=0):
+        # start can be a week with a checkpoint, to carry on from there
+        if start > 0:
+            self.restore(start)
+        input_lines = read_schedule_from(self.in_file, start)
+        input_line = next(input_lines, [])
+        time = int(input_line[0]) if len(input_line) > 0 else -1
+        for week in range(start, num_weeks):
+            if self.checkpoints is not None and week % 52 == 0:
+                self.checkpoints[week] = self.checkpoint()
             while time == week:
-                if len(input_line) == 3:
-                    time, command, amount = input_line
-                    time, amount = int(time), int(amount)
-                    if command == "BUY":
-                        self.buy(amount, time)
-                        self.out_cash_file_gen.add_bought_properties([self.properties[-1]])
-                if len(input_line) == 2:
-                    time, command = input_line
-                    time = int(time)
-                    if command == "SELL":
-                        self.sell(time)
-                        self.out_cash_file_gen.add_sold_properties([self.sold_properties[-1]])
-                input_line = f.readline().split()
+                self.apply_event(input_line)
+                input_line = next(input_lines, [])
                 if len(input_line) == 0:
                     break
                 time = int(input_line[0])
-            self.out_file_gen.write_output(self.properties)
-            for home in self.properties:
-                home["amount"] *= 1 + self.weekly_ror / 100
-        f.close()
-        self.out_file_gen.generate_output_file()
-        self.out_cash_file_gen.generate_output_file(num_weeks)
-
-    def buy(self, amount, time):
-        self.properties.append({
+            self.out_file_gen.write_output(self.value(week))
+        self.out_file_gen.generate_output_file(export)
+        self.out_cash_file_gen.generate_output_file(num_weeks, export)
+
+    def apply_event(self, input_line):
+        if len(input_line) >= 3 and input_line[1] == "BUY":
+            time, amount = int(input_line[0]), int(input_line[2])
+            property_id = str(input_line[3]) if len(input_line) > 3 else None
+            annual_ror = float(input_line[4]) if len(input_line) > 4 else None
+            if self.buy(amount, time, property_id, annual_ror):
+                self.out_cash_file_gen.add_sold_properties([self.sold_properties[-1]])
+            self.out_cash_file_gen.add_bought_properties([self.properties[self.last_bought]])
+        if len(input_line) >= 2 and input_line[1] == "SELL":
+            time = int(input_line[0])
+            property_id = str(input_line[2]) if len(input_line) > 2 else None
+            if self.sell(time, property_id):
+                self.out_cash_file_gen.add_sold_properties([self.sold_properties[-1]])
+
+    def value(self, week):
+        # The value of every property held at the start of the week
+        return sum([group["growth_index"][week] * group["units"] \
+                    for group in self.groups.values() if group["units"] != 0])
+
+    def update_units(self, group):
+        # Worked out again from the properties rather than kept as a running total, so
+        # selling a property leaves no rounding behind
+        self.groups[group]["units"] = sum([home["units"] for home in self.properties.values() \
+                                            if home["group"] == group])
+
+    def checkpoint(self):
+        return {
+            "properties": {property_id: dict(home) \
+                            for property_id, home in self.properties.items()},
+            "num_sold": len(self.sold_properties),
+            "num_bought": self.num_bought
+        }
+
+    def restore(self, week):
+        state = self.checkpoints[week]
+        self.properties = {property_id: dict(home) \
+                            for property_id, home in state["properties"].items()}
+        del self.sold_properties[state["num_sold"]:]
+        self.num_bought = state["num_bought"]
+        for group in self.groups:
+            self.update_units(group)
+        del self.out_file_gen.property_value[week:]
+        self.out_cash_file_gen.truncate(week)
+        drop_checkpoints_after(self.checkpoints, week)
+
+    def buy(self, amount, time, property_id=None, annual_ror=None):
+        # Returns whether a property held under the id was sold to make way for this one.
+        # Properties bought without an id are numbered in the order they are bought.
+        if property_id is None:
+            property_id = self.num_bought
+        self.num_bought += 1
+        if annual_ror not in self.groups:
+            self.groups[annual_ror] = {
+                "growth_index": GrowthIndex(annual_ror),
+                "units": 0
+            }
+        # Buying again under an id that is held replaces that property, which is sold
+        replaced = self.sell(time, property_id) if property_id in self.properties else False
+        self.properties[property_id] = {
             "buy_time": time,
             "buy_amount": amount,
-            "amount": amount
-        })
-
-    def sell(self, time):
-# For now I will assume I only have 1 property, because multiple properties are treated
-# differently with regard to CGT.
+            "units": amount / self.groups[annual_ror]["growth_index"][time],
+            "group": annual_ror
+        }
+        self.last_bought = property_id
+        self.update_units(annual_ror)
+        return replaced
+
+    def sell(self, time, property_id=None):
+        # Returns whether there was a property to sell.
+        # Every property is treated as the same home for now, so none of them pay CGT.
+        if property_id is None:
+            property_id = next(iter(self.properties), None)
+        if property_id not in self.properties:
+            return False
+        home = self.properties.pop(property_id)
         self.sold_properties.append({
             "sell_time": time,
-            "amount": self.properties[0]["amount"]
+            "amount": self.groups[home["group"]]["growth_index"][time] * home["units"]
         })
-        self.properties.pop(0)
+        self.update_units(home["group"])
+        return True
 
 
 class InputFileGenerator:
     def __init__(self, num_weeks):
-        self.in_file = open("input_files/home.txt", "w")
+        self.in_file = "input_files/home.txt"
         self.num_weeks = num_weeks
+        # Each week's purchases and sales, in order
         self.buy_list = {}
         self.sell_list = {}
 
+    def events(self):
+        for week in event_weeks(self.num_weeks, self.buy_list, self.sell_list):
+            for amount, property_id, annual_ror in self.buy_list.get(week, []):
+                fields = [week, "BUY", amount]
+                if property_id is not None:
+                    fields.append(property_id)
+                    if annual_ror is not None:
+                        fields.append(annual_ror)
+                yield tuple(fields)
+            for property_id in self.sell_list.get(week, []):
+                yield (week, "SELL") if property_id is None else (week, "SELL", property_id)
+
+    def schedule(self):
+        return list(self.events())
+
     def write(self):
-        for week in range(self.num_weeks):
-            try:
-                self.in_file.write(f"{week} BUY {self.buy_list[week]}\n")
-            except:
-                pass
-            try:
-                temp = self.sell_list[week]
-                self.in_file.write(f"{week} SELL\n")
-            except:
-                pass
-            if week not in self.buy_list \
-                    and week not in self.sell_list:
-                self.in_file.write(f"{week}\n")
-        self.in_file.close()
-
-    def buy(self, amount, time):
-        self.buy_list[time] = amount
-
-    def sell(self, time):
-        self.sell_list[time] = 0
+        write_schedule(self.in_file, self.events(), self.num_weeks)
+
+    def buy(self, amount, time, property_id=None, annual_ror=None):
+        # annual_ror is only written for a property with an id
+        self.buy_list.setdefault(time, []).append((amount, property_id, annual_ror))
+
+    def sell(self, time, property_id=None):
+        self.sell_list.setdefault(time, []).append(property_id)
 
 
 class OutputFileGenerator:
     def __init__(self):
-        self.out_property_file = open(f"output_files/home.txt", "w")
+        self.out_property_file = "output_files/home.txt"
         self.property_value = []
 
-    def write_output(self, properties):
-        try:
-            self.property_value.append(properties[0]["amount"])
-        except:
-            self.property_value.append(0)
+    def write_output(self, amount):
+        self.property_value.append(amount)
 
-    def generate_output_file(self):
-        for week in range(len(self.property_value)):
-            self.out_property_file.write(f"{week} {self.property_value[week]}\n")
-        self.out_property_file.close()
+    def generate_output_file(self, export=True):
+        if export:
+            write_series(self.out_property_file, self.property_value)
 
 
 class OutputCashFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/cash/home.txt", "w")
-        self.bought_properties = []
-        self.sold_properties = []
+        self.out_file = "output_files/cash/home.txt"
+        self.bought = EventLedger()
+        self.sold = EventLedger()
+        self.cash = []
 
     def add_bought_properties(self, properties):
-        self.bought_properties.extend(properties)
+        for home in properties:
+            self.bought.add(home["buy_time"], home["buy_amount"])
 
     def add_sold_properties(self, properties):
-        self.sold_properties.extend(properties)
-
-    def generate_output_file(self, num_weeks):
-        # I will assume every list is sorted based on sell_time
-        for week in range(num_weeks):
-            amount = 0
-            if len(self.bought_properties) > 0 \
-                    and self.bought_properties[0]["buy_time"] == week:
-                amount -= self.bought_properties[0]["buy_amount"]
-                self.bought_properties.pop(0)
-            if len(self.sold_properties) > 0 \
-                    and self.sold_properties[0]["sell_time"] == week:
-                amount += self.sold_properties[0]["amount"]
-            self.out_file.write(f"{week} {amount}\n")
-        self.out_file.close()
+        for home in properties:
+            self.sold.add(home["sell_time"], home["amount"])
+
+    def truncate(self, week):
+        self.bought.truncate(week)
+        self.sold.truncate(week)
+
+    def generate_output_file(self, num_weeks, export=True):
+        bought = self.bought.amounts(num_weeks)
+        sold = self.sold.amounts(num_weeks)
+        self.cash = [-bought[week] + sold[week] for week in range(num_weeks)]
+        if export:
+            write_series(self.out_file, self.cash)
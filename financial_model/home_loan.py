@@ -1,63 +1,145 @@
-import math
+# Usage:
+# {time} START {amount} {duration} [{id} [{annual_interest_rate}]]
+# {time} PAY {amount} [{id}]
+# {duration} is in years
+# Any number of loans can be owing at once, each with an id to pay it by and its own
+# annual interest rate instead of ANNUAL_INTEREST_RATE. A START with the id of a loan
+# replaces that loan, e.g. to refinance it, and what is still owing on the old loan is
+# paid out of the new one. A PAY without an id pays the loan started
+# first that is still owing, or the last loan started if none are, and pays nothing if
+# no loan has been started. A loan started without an id can be paid by its number, in
+# the order the loans were started from 0. Paying an id that was never started is an
+# error.
+
+from amortization import amortize
+from checkpoints import drop_checkpoints_after
+from ledger import EventLedger
+from rates import GrowthIndex, weekly_rate
+from schedule import event_weeks, read_events, write_schedule, write_series
+
+import operator
 
 class HomeLoan:
     def __init__(self, in_file, params):
         self.in_file = in_file
         self.out_file_gen = OutputFileGenerator()
         self.out_cash_file_gen = OutputCashFileGenerator()
-        self.interest_rate = params["ANNUAL_INTEREST_RATE"]
-        #self.weekly_interest_rate = self.interest_rate / 52 / 100
-        self.weekly_interest_rate = (math.exp(math.log(1 + self.interest_rate / 100) / 52) - 1) \
-                                    * 100
-
-    def simulate(self, num_weeks):
-        f = open(self.in_file, "r")
-        self.loan_amount = 0
-        input_line = f.readline().split()
-        time = int(input_line[0])
-        for week in range(num_weeks):
-            while time == week:
-                if len(input_line) == 4:
-                    time, command, amount, duration = input_line
-                    time, amount, duration = int(time), float(amount), int(duration)
-                    if command == "START":
-                        self.buy(amount, time)
-                        self.out_cash_file_gen.add_loan(amount, time)
-                        self.weekly_repayment = self.minimum_repayment(amount, \
-                                                                        self.interest_rate, \
-                                                                        duration)
-                if len(input_line) == 3:
-                    time, command, amount = input_line
-                    time, amount = int(time), int(amount)
-                    if command == "PAY":
-                        self.pay(amount, time)
-                        self.out_cash_file_gen.add_payment({
-                            "time": time,
-                            "amount": amount
-                        })
-                input_line = f.readline().split()
-                if len(input_line) == 0:
-                    break
-                time = int(input_line[0])
-            self.out_file_gen.write_output(self.loan_amount)
-            if self.loan_amount > 0:
-                self.out_cash_file_gen.add_payment({
-                    "time": week,
-                    "amount": self.weekly_repayment
-                })
-                self.loan_amount *= 1 + self.weekly_interest_rate / 100
-                self.loan_amount -= self.weekly_repayment
-            else:
-                self.loan_amount = 0
-        f.close()
-        self.out_file_gen.generate_output_file()
-        self.out_cash_file_gen.generate_output_file(num_weeks)
+        self.interest_index = GrowthIndex(params["ANNUAL_INTEREST_RATE"])
+        # Set to a dict to keep a checkpoint at week 0 and at every event, see
+        # checkpoints.py. Between events a stretch of weeks is worked out in one go, so
+        # events are where the loan can be resumed from.
+        self.checkpoints = None
+
+    def simulate(self, num_weeks, export=True, start=0):
+        # start can be a week with a checkpoint, to carry on from there
+        events = read_events(self.in_file)
+        # The loans started, by id, in the order they were started
+        self.loans = {}
+        self.num_started = 0
+        # Between events each loan only changes by its weekly repayment, so each stretch
+        # of weeks is amortized in one go
+        if start > 0:
+            self.restore(start)
+        elif self.checkpoints is not None:
+            self.checkpoints[0] = self.checkpoint()
+        week = start
+        for event_week in sorted(events):
+            if event_week < start:
+                continue
+            if event_week >= num_weeks:
+                break
+            self.repay(week, event_week)
+            if self.checkpoints is not None:
+                self.checkpoints[event_week] = self.checkpoint()
+            for input_line in events[event_week]:
+                self.apply_event(input_line)
+            week = event_week
+        self.repay(week, num_weeks)
+        self.out_file_gen.generate_output_file(export)
+        self.out_cash_file_gen.generate_output_file(num_weeks, export)
+
+    def apply_event(self, input_line):
+        if len(input_line) >= 4 and input_line[1] == "START":
+            time, amount, duration = int(input_line[0]), float(input_line[2]), int(input_line[3])
+            loan_id = str(input_line[4]) if len(input_line) > 4 else None
+            annual_interest_rate = float(input_line[5]) if len(input_line) > 5 else None
+            paid_out = self.buy(amount, time, duration, loan_id, annual_interest_rate)
+            self.out_cash_file_gen.add_loan(amount, time)
+            self.out_cash_file_gen.add_payments(paid_out, time, time + 1)
+        if len(input_line) >= 3 and input_line[1] == "PAY":
+            time, amount = int(input_line[0]), int(input_line[2])
+            loan_id = str(input_line[3]) if len(input_line) > 3 else None
+            if self.pay(amount, time, loan_id):
+                self.out_cash_file_gen.add_payments(amount, time, time + 1)
+
+    def repay(self, start, end):
+        # Writes out the total owed in the weeks from start up to end. Once a loan is no
+        # longer owing, that week's balance is counted and it is cleared to 0 from the
+        # week after.
+        if start == end:
+            return
+        balances = [0] * (end - start)
+        for loan in self.loans.values():
+            if loan["amount"] == 0:
+                continue
+            if loan["amount"] < 0:
+                balances[0] += loan["amount"]
+                loan["amount"] = 0
+                continue
+            loan_balances, last_week, closing_balance = amortize(loan["interest_index"], \
+                                                                loan["amount"], \
+                                                                loan["weekly_repayment"], \
+                                                                start, end)
+            balances[:len(loan_balances)] = map(operator.add, balances, loan_balances)
+            self.out_cash_file_gen.add_payments(loan["weekly_repayment"], start, last_week)
+            loan["amount"] = 0 if last_week < end else closing_balance
+        self.out_file_gen.write_outputs(balances)
+
+    def checkpoint(self):
+        return {
+            "loans": {loan_id: dict(loan) for loan_id, loan in self.loans.items()},
+            "num_started": self.num_started
+        }
 
-    def buy(self, amount, time):
-        self.loan_amount = amount
+    def restore(self, week):
+        state = self.checkpoints[week]
+        self.loans = {loan_id: dict(loan) for loan_id, loan in state["loans"].items()}
+        self.num_started = state["num_started"]
+        del self.out_file_gen.loan_value[week:]
+        self.out_cash_file_gen.truncate(week)
+        drop_checkpoints_after(self.checkpoints, week)
 
-    def pay(self, amount, time):
-        self.loan_amount -= amount
+    def buy(self, amount, time, duration, loan_id=None, annual_interest_rate=None):
+        # Returns what was still owing on the loan this one replaces, which is paid off
+        # out of this one. Loans started without an id are numbered in the order they
+        # are started.
+        if loan_id is None:
+            loan_id = str(self.num_started)
+        self.num_started += 1
+        if annual_interest_rate is None:
+            interest_index = self.interest_index
+        else:
+            interest_index = GrowthIndex(annual_interest_rate)
+        replaced = self.loans.pop(loan_id, None)
+        self.loans[loan_id] = {
+            "amount": amount,
+            "weekly_repayment": self.minimum_repayment(amount, \
+                                                        interest_index.annual_rate(time), \
+                                                        duration),
+            "interest_index": interest_index
+        }
+        return 0 if replaced is None else max(0, replaced["amount"])
+
+    def pay(self, amount, time, loan_id=None):
+        # Returns whether there was a loan to pay
+        if loan_id is None:
+            loan_id = pay_target(self.loans, [loan["amount"] for loan in self.loans.values()])
+            if loan_id is None:
+                return False
+        if loan_id not in self.loans:
+            raise ValueError(f"Week {time}: no home loan {loan_id} to pay")
+        self.loans[loan_id]["amount"] -= amount
+        return True
 
     def minimum_repayment(self, loan_amount, interest_rate, loan_years):
         weekly_interest_rate = interest_rate / 52 / 100
@@ -66,83 +148,198 @@ class HomeLoan:
                 ** num_payments) / ((1 + weekly_interest_rate) ** num_payments - 1)
 
 
+class HomeLoanPaths:
+    # The same home loan schedule run under a batch of interest rate paths at once, e.g.
+    # to stress test the loans. The state of each loan is a list over the paths, and each
+    # week is one pass over those lists for every path, rather than a simulation each.
+    # Only the total owed in the sample weeks and the total repaid on each path are kept.
+    # A loan with its own interest rate has that rate on every path.
+    def __init__(self, in_file, interest_rates):
+        self.in_file = in_file
+        # A PathRates, see rates.py
+        self.interest_rates = interest_rates
+
+    def simulate(self, num_weeks, sample_weeks=None):
+        events = read_events(self.in_file)
+        num_paths = len(self.interest_rates)
+        self.sample_weeks = sorted(range(num_weeks) if sample_weeks is None else sample_weeks)
+        sampled = set(self.sample_weeks)
+        # balances[i] is the total owed on each path at the start of sample_weeks[i]
+        self.balances = []
+        self.repaid = [0] * num_paths
+        self.loans = {}
+        self.num_started = 0
+        for week in range(num_weeks):
+            for input_line in events.get(week, []):
+                self.apply_event(input_line)
+            if week in sampled:
+                balances = [0] * num_paths
+                for loan in self.loans.values():
+                    balances = list(map(operator.add, balances, loan["amounts"]))
+                self.balances.append(balances)
+            for loan in self.loans.values():
+                # Once no path is owing, there is nothing to work out until the next event
+                if max(loan["amounts"]) <= 0:
+                    if min(loan["amounts"]) < 0:
+                        loan["amounts"] = [0] * num_paths
+                    continue
+                growths = loan["growths"](week)
+                self.repaid = [repaid + repayment if amount > 0 else repaid \
+                                for repaid, amount, repayment \
+                                in zip(self.repaid, loan["amounts"], loan["weekly_repayments"])]
+                loan["amounts"] = [amount * growth - repayment if amount > 0 else 0 \
+                                    for amount, growth, repayment \
+                                    in zip(loan["amounts"], growths, loan["weekly_repayments"])]
+
+    def apply_event(self, input_line):
+        num_paths = len(self.interest_rates)
+        if len(input_line) >= 4 and input_line[1] == "START":
+            time, amount, duration = int(input_line[0]), float(input_line[2]), int(input_line[3])
+            loan_id = str(input_line[4]) if len(input_line) > 4 else None
+            if loan_id is None:
+                loan_id = str(self.num_started)
+            self.num_started += 1
+            if len(input_line) > 5:
+                annual_interest_rate = float(input_line[5])
+                growth = 1 + weekly_rate(annual_interest_rate) / 100
+                annual_interest_rates = [annual_interest_rate] * num_paths
+                growths = lambda week: [growth] * num_paths
+            else:
+                annual_interest_rates = self.interest_rates.annual(time)
+                growths = self.interest_rates.growths
+            # What is still owing on a loan this one replaces is repaid out of it
+            replaced = self.loans.pop(loan_id, None)
+            if replaced is not None:
+                self.repaid = [repaid + max(0, replaced_amount) for repaid, replaced_amount \
+                                in zip(self.repaid, replaced["amounts"])]
+            self.loans[loan_id] = {
+                "amounts": [amount] * num_paths,
+                "weekly_repayments": [self.minimum_repayment(amount, interest_rate, duration) \
+                                        for interest_rate in annual_interest_rates],
+                "growths": growths
+            }
+        if len(input_line) >= 3 and input_line[1] == "PAY":
+            amount = int(input_line[2])
+            if len(input_line) > 3:
+                if str(input_line[3]) not in self.loans:
+                    raise ValueError(f"Week {input_line[0]}: no home loan {input_line[3]} to pay")
+                targets = [str(input_line[3])] * num_paths
+            else:
+                # Each path pays the first loan still owing on that path, and none if no
+                # loan has been started
+                targets = [pay_target(self.loans, amounts) \
+                            for amounts in zip(*[loan["amounts"] for loan in self.loans.values()])]
+                if len(self.loans) == 0:
+                    targets = [None] * num_paths
+            for loan_id, loan in self.loans.items():
+                loan["amounts"] = [loan_amount - amount if target == loan_id else loan_amount \
+                                    for loan_amount, target in zip(loan["amounts"], targets)]
+            self.repaid = [repaid + amount if target is not None else repaid \
+                            for repaid, target in zip(self.repaid, targets)]
+
+    def minimum_repayment(self, loan_amount, interest_rate, loan_years):
+        weekly_interest_rate = interest_rate / 52 / 100
+        num_payments = loan_years * 52
+        return (loan_amount * weekly_interest_rate * (1 + weekly_interest_rate) \
+                ** num_payments) / ((1 + weekly_interest_rate) ** num_payments - 1)
+
+
+def pay_target(loans, amounts):
+    # The id of the loan a PAY without an id pays, given the amount owing on each loan:
+    # the first one still owing, or the last one if none are
+    for loan_id, amount in zip(loans, amounts):
+        if amount > 0:
+            return loan_id
+    return next(reversed(loans), None)
+
+
 class InputFileGenerator:
     def __init__(self, num_weeks):
-        self.in_file = open("input_files/home_loan.txt", "w")
+        self.in_file = "input_files/home_loan.txt"
         self.num_weeks = num_weeks
+        # Each week's loans started, in order
         self.buy_list = {}
+        # Each week's payments without an id, and with one, by id
         self.pay_list = {}
+        self.pay_loan_list = {}
+
+    def events(self):
+        for week in event_weeks(self.num_weeks, self.buy_list, self.pay_list, self.pay_loan_list):
+            for loan in self.buy_list.get(week, []):
+                fields = [week, "START", loan["amount"], loan["duration"]]
+                if loan["id"] is not None:
+                    fields.append(loan["id"])
+                    if loan["annual_interest_rate"] is not None:
+                        fields.append(loan["annual_interest_rate"])
+                yield tuple(fields)
+            if week in self.pay_list:
+                yield (week, "PAY", self.pay_list[week])
+            for loan_id, amount in self.pay_loan_list.get(week, {}).items():
+                yield (week, "PAY", amount, loan_id)
+
+    def schedule(self):
+        return list(self.events())
 
     def write(self):
-        for week in range(self.num_weeks):
-            try:
-                self.in_file.write(f"{week} START {self.buy_list[week]['amount']} " \
-                                    f"{self.buy_list[week]['duration']}\n")
-            except:
-                pass
-            try:
-                self.in_file.write(f"{week} PAY {self.pay_list[week]}\n")
-            except:
-                pass
-            if week not in self.buy_list \
-                    and week not in self.pay_list:
-                self.in_file.write(f"{week}\n")
-        self.in_file.close()
-
-    def buy(self, amount, time, duration):
-        self.buy_list[time] = {
+        write_schedule(self.in_file, self.events(), self.num_weeks)
+
+    def buy(self, amount, time, duration, loan_id=None, annual_interest_rate=None):
+        # annual_interest_rate is only written for a loan with an id
+        self.buy_list.setdefault(time, []).append({
                 "amount": amount,
-                "duration": duration
-            }
+                "duration": duration,
+                "id": loan_id,
+                "annual_interest_rate": annual_interest_rate
+            })
 
-    def pay(self, amount, time):
-        self.pay_list[time] = amount
+    def pay(self, amount, time, loan_id=None):
+        if loan_id is None:
+            self.pay_list[time] = amount
+        else:
+            self.pay_loan_list.setdefault(time, {})[loan_id] = amount
 
 
 class OutputFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/home_loan.txt", "w")
+        self.out_file = "output_files/home_loan.txt"
         self.loan_value = []
 
     def write_output(self, amount):
         self.loan_value.append(amount)
 
-    def generate_output_file(self):
-        for week in range(len(self.loan_value)):
-            self.out_file.write(f"{week} {self.loan_value[week]}\n")
-        self.out_file.close()
+    def write_outputs(self, amounts):
+        self.loan_value.extend(amounts)
+
+    def generate_output_file(self, export=True):
+        if export:
+            write_series(self.out_file, self.loan_value)
 
 
 class OutputCashFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/cash/home_loan.txt", "w")
-        self.loan_payments = []
+        self.out_file = "output_files/cash/home_loan.txt"
+        # Amount borrowed and amount repaid in each week
+        self.borrowed = EventLedger()
+        self.loan_payments = EventLedger()
+        self.cash = []
 
     def add_loan(self, amount, time):
-        self.loan = {
-                "buy_time": time,
-                "amount": amount
-            }
+        self.borrowed.add(time, amount)
 
-    def add_payment(self, payment):
-        self.loan_payments.append(payment)
+    def add_payments(self, amount, start, end):
+        # amount is paid in each week from start up to end
+        self.loan_payments.add_range(start, end, amount)
 
-    def generate_output_file(self, num_weeks):
-        # I will assume the list is sorted based on time
-        for week in range(num_weeks):
-            amount = 0
-            if len(self.loan_payments) == 0:
-                break
-            while week == self.loan_payments[0]["time"]:
-                amount += self.loan_payments[0]["amount"]
-                self.loan_payments.pop(0)
-                if len(self.loan_payments) == 0:
-                    break
-            if week == self.loan["buy_time"]:
-                self.out_file.write(f"{week} {self.loan['amount'] - amount}\n")
-            else:
-                self.out_file.write(f"{week} {-amount}\n")
-        self.out_file.close()
+    def truncate(self, week):
+        self.borrowed.truncate(week)
+        self.loan_payments.truncate(week)
+
+    def generate_output_file(self, num_weeks, export=True):
+        borrowed = self.borrowed.amounts(num_weeks)
+        self.cash = [-amount + borrowed[week] \
+                        for week, amount in enumerate(self.loan_payments.amounts(num_weeks))]
+        if export:
+            write_series(self.out_file, self.cash)
 
 
 if __name__ == "__main__":
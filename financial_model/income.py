@@ -1,17 +1,20 @@
+from schedule import event_weeks, write_schedule
+
 class InputFileGenerator:
     def __init__(self, num_weeks):
         self.num_weeks = num_weeks
         self.income = {}
-        self.out_file = "income.txt"
+        self.in_file = "input_files/income.txt"
+
+    def events(self):
+        for week in event_weeks(self.num_weeks, self.income):
+            yield (week, self.income[week])
+
+    def schedule(self):
+        return list(self.events())
 
     def write(self):
-        f = open(f"input_files/{self.out_file}", "w")
-        for week in range(self.num_weeks):
-            try:
-                f.write(f"{week} {self.income[week]}\n")
-            except:
-                f.write(f"{week}\n")
-        f.close()
+        write_schedule(self.in_file, self.events(), self.num_weeks)
 
     def add(self, week, amount):
         self.income[week] = amount
@@ -0,0 +1,71 @@
+# Amounts by week: EventLedger for the cash and tax receipt generators, and CashLedger
+# for the simulator's cash balance.
+#
+# Each week's amounts are added straight into a list indexed by week, in the order they
+# are recorded, so generating a series from them is one pass with no searching or
+# popping, and a run resumed from a checkpoint drops everything from that week on.
+
+import itertools
+import operator
+
+class EventLedger:
+    def __init__(self):
+        self.weekly_amounts = []
+
+    def __len__(self):
+        return len(self.weekly_amounts)
+
+    def extend(self, num_weeks):
+        if len(self.weekly_amounts) < num_weeks:
+            self.weekly_amounts.extend([0] * (num_weeks - len(self.weekly_amounts)))
+
+    def add(self, week, amount):
+        self.extend(week + 1)
+        self.weekly_amounts[week] += amount
+
+    def add_range(self, start, end, amount):
+        # amount is added in each week from start up to end
+        self.extend(end)
+        for week in range(start, end):
+            self.weekly_amounts[week] += amount
+
+    def amounts(self, num_weeks):
+        # The amount for each week up to num_weeks, 0 for weeks with nothing added
+        amounts = self.weekly_amounts[:num_weeks]
+        amounts.extend([0] * (num_weeks - len(amounts)))
+        return amounts
+
+    def truncate(self, week):
+        del self.weekly_amounts[week:]
+
+
+class CashLedger:
+    # The cash coming in (or going out, if negative) in each week of the horizon, set
+    # aside up front. Whole series are added in one pass with map(), which runs in C,
+    # and the balance is one running sum. Weeks past the horizon are not simulated, so
+    # anything recorded for them is left out.
+    def __init__(self, num_weeks, starting_balance=0):
+        self.amounts = [0.0] * num_weeks
+        if num_weeks > 0:
+            self.amounts[0] = starting_balance
+
+    def add(self, week, amount):
+        if 0 <= week < len(self.amounts):
+            self.amounts[week] += amount
+
+    def add_series(self, series):
+        # Adds a week-indexed series
+        num_weeks = min(len(series), len(self.amounts))
+        self.amounts[:num_weeks] = map(operator.add, self.amounts[:num_weeks], \
+                                        series[:num_weeks])
+
+    def balance(self):
+        return list(itertools.accumulate(self.amounts))
+
+
+def first_negative_week(balance):
+    # The first week with a negative balance, or None. A single min() checks the whole
+    # balance, and it is only searched when that fails.
+    if len(balance) == 0 or min(balance) >= 0:
+        return None
+    return next(week for week, amount in enumerate(balance) if amount < 0)
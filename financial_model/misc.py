@@ -1,28 +1,31 @@
 # Note that a positive expense is turned into a negative cash amount
 
+from schedule import write_schedule
+
 class InputFileGenerator:
     def __init__(self, num_weeks):
         self.num_weeks = num_weeks
         self.expenses = []
-        self.out_file = "misc.txt"
+        self.in_file = "input_files/misc.txt"
 
-    def write(self):
-        self.expenses.sort(key=lambda x: x["time"])
-        f = open(f"input_files/{self.out_file}", "w")
-        for week in range(self.num_weeks):
-            if len(self.expenses) == 0:
-                f.write(f"{week} 0\n")
-                continue
-            time = self.expenses[0]["time"]
+    def events(self):
+        # Expenses in the same week are added together
+        expenses = sorted(self.expenses, key=lambda x: x["time"])
+        idx = 0
+        while idx < len(expenses):
+            week = expenses[idx]["time"]
             amount = 0
-            while time == week:
-                amount += self.expenses[0]["amount"]
-                self.expenses.pop(0)
-                if len(self.expenses) == 0:
-                    break
-                time = self.expenses[0]["time"]
-            f.write(f"{week} {amount}\n")
-        f.close()
+            while idx < len(expenses) and expenses[idx]["time"] == week:
+                amount += expenses[idx]["amount"]
+                idx += 1
+            if 0 <= week < self.num_weeks:
+                yield (week, amount)
+
+    def schedule(self):
+        return list(self.events())
+
+    def write(self):
+        write_schedule(self.in_file, self.events(), self.num_weeks)
 
     def add(self, week, amount):
         self.expenses.append({
@@ -0,0 +1,101 @@
+# Instrumentation for Simulator.simulate(profile=...). Nothing here runs unless a
+# profile is asked for.
+#
+# Every stage of a run gets its wall time and the change in the number of memory blocks
+# Python has allocated, and the rows read and written are counted for each file (or
+# in-memory schedule). A run can also be captured as a whole with cProfile, or traced
+# with tracemalloc, which adds the memory each stage allocated and its peak.
+
+import schedule
+
+import contextlib
+import cProfile
+import io
+import pstats
+import sys
+import time
+import tracemalloc
+
+PROFILE_CAPTURES = [True, "cprofile", "tracemalloc"]
+
+class Profiler:
+    def __init__(self, capture=True, num_lines=20):
+        # capture is True for the stages and row counts only, or "cprofile" or
+        # "tracemalloc" to capture the whole run as well. num_lines is how many of the
+        # top functions or allocation sites are kept.
+        if capture not in PROFILE_CAPTURES:
+            raise ValueError(f"Unknown profile capture {capture}")
+        self.capture = capture
+        self.num_lines = num_lines
+        self.stages = []
+        self.rows = {}
+        self.seconds = 0
+        self.cprofile = None
+        self.profile_stats = None
+        self.top_allocations = None
+
+    def start(self):
+        schedule.row_counter = self.count_rows
+        if self.capture == "tracemalloc":
+            tracemalloc.start()
+        if self.capture == "cprofile":
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.start_time
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            stats_text = io.StringIO()
+            stats = pstats.Stats(self.cprofile, stream=stats_text)
+            stats.sort_stats("cumulative").print_stats(self.num_lines)
+            self.profile_stats = stats_text.getvalue()
+        if self.capture == "tracemalloc":
+            snapshot = tracemalloc.take_snapshot()
+            self.top_allocations = []
+            for stat in snapshot.statistics("lineno")[:self.num_lines]:
+                frame = stat.traceback[0]
+                self.top_allocations.append({
+                    "location": f"{frame.filename}:{frame.lineno}",
+                    "size": stat.size,
+                    "count": stat.count
+                })
+            tracemalloc.stop()
+        schedule.row_counter = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_blocks = sys.getallocatedblocks()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "seconds": time.perf_counter() - start_time,
+                "allocated_blocks": sys.getallocatedblocks() - start_blocks
+            }
+            if tracing:
+                memory, peak_memory = tracemalloc.get_traced_memory()
+                record["memory"] = memory - start_memory
+                record["peak_memory"] = peak_memory - start_memory
+            self.stages.append(record)
+
+    def count_rows(self, path, direction, num_rows):
+        if path not in self.rows:
+            self.rows[path] = {"read": 0, "written": 0}
+        self.rows[path][direction] += num_rows
+
+    def report(self):
+        return {
+            "seconds": self.seconds,
+            "stages": self.stages,
+            "rows": self.rows,
+            "profile_stats": self.profile_stats,
+            "top_allocations": self.top_allocations
+        }
@@ -0,0 +1,187 @@
+# Rates are annual percentages, as in params.txt, compounded weekly.
+# Anywhere a rate is read from params, it can either be a fixed rate or a list holding
+# the annual rate in effect for each week, e.g. a path sampled for a Monte Carlo run.
+
+from array import array
+import math
+import operator
+
+# The inflation indexes built in this process, by inflation rate, see shared_inflation_index()
+inflation_indexes = {}
+MAX_INFLATION_INDEXES = 8
+
+def weekly_rate(annual_rate):
+    return 100 * (math.exp(math.log(1 + annual_rate / 100) / 52) - 1)
+
+
+class GrowthIndex:
+    def __init__(self, annual_rate):
+        if isinstance(annual_rate, list):
+            self.annual_rates = annual_rate
+            self.weekly_rates = [weekly_rate(rate) for rate in annual_rate]
+            self.index = [1]
+            for rate in self.weekly_rates:
+                self.index.append(self.index[-1] * (1 + rate / 100))
+            # discounts[week] is the sum of 1 / index[j] for 0 < j <= week
+            self.discounts = [0]
+            for growth in self.index[1:]:
+                self.discounts.append(self.discounts[-1] + 1 / growth)
+        else:
+            self.annual_rates = None
+            self.fixed_annual_rate = annual_rate
+            self.fixed_weekly_rate = weekly_rate(annual_rate)
+            self.growth = 1 + self.fixed_weekly_rate / 100
+
+    def __getitem__(self, week):
+        # Growth from the start of week 0 to the start of the given week
+        if self.annual_rates is None:
+            return self.growth ** week
+        return self.index[week]
+
+    def discount_sum(self, start, end):
+        # Sum of 1 / self[week] for start < week <= end, as used to amortize loans
+        if self.annual_rates is None:
+            if self.growth == 1:
+                return end - start
+            return (self.growth ** -start - self.growth ** -end) / (self.growth - 1)
+        return self.discounts[end] - self.discounts[start]
+
+    def rate(self, week):
+        if self.annual_rates is None:
+            return self.fixed_weekly_rate
+        return self.weekly_rates[week]
+
+    def annual_rate(self, week):
+        if self.annual_rates is None:
+            return self.fixed_annual_rate
+        return self.annual_rates[week]
+
+
+class InflationIndex:
+    # Prices relative to the start of week 0, kept in a table with the factor for each
+    # week, so indexing an amount is one lookup and indexing a whole schedule is one
+    # pass of map(). The table grows as later weeks are asked for, and holds the same
+    # factors as GrowthIndex at the inflation rate. Amounts in real dollars are in
+    # week 0 prices.
+    def __init__(self, annual_inflation_rate):
+        self.growth_index = GrowthIndex(annual_inflation_rate)
+        self.factors = []
+        # 1 / the factor for each week, see deflators()
+        self.reciprocals = []
+
+    def extend(self, num_weeks):
+        if len(self.factors) < num_weeks:
+            self.factors.extend([self.growth_index[week] \
+                                    for week in range(len(self.factors), num_weeks)])
+
+    def __getitem__(self, week):
+        if week >= len(self.factors):
+            self.extend(week + 1)
+        return self.factors[week]
+
+    def over(self, weeks):
+        # The factor for each week of a range
+        if len(weeks) == 0:
+            return []
+        self.extend(weeks[-1] + 1)
+        return self.factors[weeks.start:weeks.stop:weeks.step]
+
+    def inflate(self, amount, week):
+        # An amount in week 0 prices, in the prices of the given week
+        return amount * self[week]
+
+    def inflate_series(self, amounts, start=0):
+        # A series of amounts in week 0 prices, one for each week from start
+        self.extend(start + len(amounts))
+        return list(map(operator.mul, amounts, self.factors[start:start + len(amounts)]))
+
+    def deflators(self, num_weeks):
+        # What each week's amounts are multiplied by to be in week 0 prices
+        self.extend(num_weeks)
+        if len(self.reciprocals) < num_weeks:
+            self.reciprocals.extend([1 / factor \
+                                        for factor in self.factors[len(self.reciprocals):num_weeks]])
+        return self.reciprocals[:num_weeks]
+
+    def deflate_series(self, amounts, start=0):
+        # A series of amounts in the prices of each week from start, in week 0 prices
+        deflators = self.deflators(start + len(amounts))
+        return list(map(operator.mul, amounts, deflators[start:]))
+
+
+def shared_inflation_index(annual_inflation_rate):
+    # The InflationIndex at the rate, shared by every simulator in this process with the
+    # same inflation. Only the most recently built MAX_INFLATION_INDEXES are kept.
+    key = annual_inflation_rate
+    if isinstance(key, list):
+        key = tuple(key)
+    if key not in inflation_indexes:
+        if len(inflation_indexes) >= MAX_INFLATION_INDEXES:
+            del inflation_indexes[next(iter(inflation_indexes))]
+        inflation_indexes[key] = InflationIndex(annual_inflation_rate)
+    return inflation_indexes[key]
+
+
+def discount_factors(annual_rate, num_weeks):
+    # What each week's amounts are multiplied by for their present value at week 0,
+    # discounting at the annual rate
+    growth_index = GrowthIndex(annual_rate)
+    return [1 / growth_index[week] for week in range(num_weeks)]
+
+
+class PathRates:
+    # The rates of a batch of paths, e.g. for HomeLoanPaths, with each path a fixed rate
+    # or a list holding the rate for each week, as above. Each path's rates are kept in
+    # arrays of doubles rather than lists, so thousands of paths fit in memory, and each
+    # week's growth (1 + weekly rate / 100) is only worked out once.
+    def __init__(self, annual_rates, num_weeks):
+        # annual_rates can be any iterable, so paths can be sampled one at a time
+        self.annual_rates = []
+        self.weekly_growths = []
+        for rates in annual_rates:
+            if isinstance(rates, list):
+                rates = rates[:num_weeks]
+                self.annual_rates.append(array("d", rates))
+                self.weekly_growths.append(array("d", [1 + weekly_rate(rate) / 100 \
+                                                        for rate in rates]))
+            else:
+                self.annual_rates.append(array("d", [rates]) * num_weeks)
+                self.weekly_growths.append(array("d", [1 + weekly_rate(rates) / 100]) * num_weeks)
+
+    def __len__(self):
+        return len(self.annual_rates)
+
+    def annual(self, week):
+        # The annual rate of every path in the given week
+        return [rates[week] for rates in self.annual_rates]
+
+    def growths(self, week):
+        # The weekly growth of every path in the given week
+        return [growths[week] for growths in self.weekly_growths]
+
+
+def sample_returns(annual_rate, annual_volatility, num_weeks, rng):
+    # Weekly log returns are normally distributed, with the median path growing at
+    # annual_rate. Each week's return is given back as an equivalent annual rate.
+    mean = math.log(1 + annual_rate / 100) / 52
+    stddev = annual_volatility / 100 / math.sqrt(52)
+    return [100 * (math.exp(52 * rng.gauss(mean, stddev)) - 1) for _ in range(num_weeks)]
+
+def sample_rates(annual_rate, annual_volatility, num_weeks, rng, reversion=0.5, floor=0):
+    # Interest and inflation rates wander around annual_rate, reverting towards it by
+    # the given fraction per year, and are kept at or above floor.
+    stddev = annual_volatility / math.sqrt(52)
+    weekly_reversion = reversion / 52
+    gauss = rng.gauss
+    rate = annual_rate
+    rates = []
+    for _ in range(num_weeks):
+        rate += weekly_reversion * (annual_rate - rate) + gauss(0, stddev)
+        rates.append(rate if rate > floor else floor)
+    return rates
+
+def percentile(sorted_values, percent):
+    position = percent / 100 * (len(sorted_values) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (position - lower) * (sorted_values[upper] - sorted_values[lower])
@@ -0,0 +1,155 @@
+# Lazy access to the output series of an exported run, e.g. for reporting on archived runs
+# without reading every line of every file:
+#   results = Results("output_files")
+#   results["home_loan"][-1]    # the final week
+#   results["cash"][520:572]    # the second year
+# A series is only opened when first asked for. Binary series (see columnar.py) are
+# memory-mapped and indexed directly. Text series are memory-mapped as well, and since
+# their weeks are in order, a week is found by bisecting on byte offsets into the file.
+
+from columnar import is_columnar, read_columnar
+
+import mmap
+import operator
+import os
+
+# The output file of each series, relative to the output directory
+RESULT_FILES = {
+    "shares": "shares.txt",
+    "super": "super.txt",
+    "home": "home.txt",
+    "home_loan": "home_loan.txt",
+    "car_loan": "car_loan.txt",
+    "hecs": "hecs.txt",
+    "cash": "cash.txt"
+}
+
+class Series:
+    def __init__(self, path, column=0):
+        self.path = path
+        self.column = column
+        self.values = None
+        self.data = b""
+        if is_columnar(path):
+            self.values = read_columnar(path)["columns"][column]
+            return
+        f = open(path, "rb")
+        if os.fstat(f.fileno()).st_size > 0:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        # Skip any header lines
+        self.start = 0
+        while self.data[self.start:self.start + 1] == b"#":
+            self.start = self.line_after(self.start + 1)
+        self.length = 0
+        last_line = self.last_line()
+        if last_line is not None:
+            self.length = self.week_at(last_line) + 1
+
+    def __len__(self):
+        if self.values is not None:
+            return len(self.values)
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.week_range(start, stop)[::step]
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError(f"Week {key} is not in {self.path}")
+        if self.values is not None:
+            return self.values[key]
+        return self.week_range(key, key + 1)[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def week_range(self, start, stop):
+        if self.values is not None:
+            return list(self.values[start:stop])
+        amounts = []
+        offset = self.week_offset(start)
+        while offset < len(self.data) and len(amounts) < stop - start:
+            end = self.line_end(offset)
+            fields = self.data[offset:end].split()
+            if len(fields) > 0:
+                amounts.append(float(fields[self.column + 1]) \
+                                if len(fields) > self.column + 1 else 0)
+            offset = end + 1
+        return amounts
+
+    def line_after(self, offset):
+        # The start of the first line at or after offset
+        if offset <= 0:
+            return 0
+        newline = self.data.find(b"\n", offset - 1)
+        return len(self.data) if newline == -1 else newline + 1
+
+    def line_end(self, offset):
+        newline = self.data.find(b"\n", offset)
+        return len(self.data) if newline == -1 else newline
+
+    def week_at(self, offset):
+        return int(self.data[offset:self.line_end(offset)].split()[0])
+
+    def last_line(self):
+        end = len(self.data)
+        while end > self.start and self.data[end - 1:end] in [b"\n", b" "]:
+            end -= 1
+        if end <= self.start:
+            return None
+        return max(self.start, self.data.rfind(b"\n", self.start, end) + 1)
+
+    def week_offset(self, week):
+        # The first line for the week (or a later one), found by bisecting for the lowest
+        # offset whose next line is not before the week
+        low = self.start
+        high = len(self.data)
+        while low < high:
+            middle = (low + high) // 2
+            line_start = self.line_after(middle)
+            if line_start >= len(self.data) or self.week_at(line_start) >= week:
+                high = middle
+            else:
+                low = middle + 1
+        return self.line_after(low)
+
+
+class Results:
+    def __init__(self, out_dir="output_files"):
+        self.out_dir = out_dir
+        self.series = {}
+
+    def __getitem__(self, name):
+        if name not in self.series:
+            self.series[name] = Series(os.path.join(self.out_dir, RESULT_FILES[name]))
+        return self.series[name]
+
+    def __contains__(self, name):
+        return name in RESULT_FILES
+
+    def keys(self):
+        return RESULT_FILES.keys()
+
+    def final(self):
+        # The last week of each series, skipping any that are empty
+        return {name: self[name][-1] for name in self.keys() if len(self[name]) > 0}
+
+
+def present_values(results, factors):
+    # Every series of results, e.g. a run's results or a Results, in today's dollars, with
+    # each week's amount multiplied by that week's factor, e.g. from
+    # InflationIndex.deflators() or discount_factors() in rates.py
+    return {name: list(map(operator.mul, results[name], factors)) for name in results.keys()}
+
+
+if __name__ == "__main__":
+    # Prints the final amounts of one or more exported runs, e.g.
+    #   python results.py output_files archive/*/output_files
+    import sys
+    for out_dir in sys.argv[1:] or ["output_files"]:
+        print(out_dir)
+        for name, amount in Results(out_dir).final().items():
+            print(f"  {name} = " + "${:,.2f}".format(amount))
@@ -1,8 +1,15 @@
 import math
 
+# The inflation factor for each week, by annual inflation rate, worked out once
+inflation_factors = {}
+
 def apply_inflation(amount, time, annual_inflation_rate):
-    weekly_inflation_rate = (math.exp(math.log(1 + annual_inflation_rate / 100) / 52) - 1) * 100
-    return amount * (1 + weekly_inflation_rate / 100) ** time
+    factors = inflation_factors.setdefault(annual_inflation_rate, [])
+    if time >= len(factors):
+        weekly_inflation_rate = (math.exp(math.log(1 + annual_inflation_rate / 100) / 52) - 1) * 100
+        factors.extend([(1 + weekly_inflation_rate / 100) ** week \
+                            for week in range(len(factors), time + 1)])
+    return amount * factors[time]
 
 
 def write_params_file(params):
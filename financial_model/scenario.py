@@ -0,0 +1,349 @@
+# Scenarios: the input schedules of an experiment, written as data rather than code, e.g.
+# input_files/scenarios/comprehensive.txt. A scenario file is compiled into the input
+# file generators of the assets it uses, one rule per line:
+#   LET {name} {expression}
+#       A variable. A knob of the same name set on the Simulator wins, see sweep().
+#   AT {week} [INDEXED] {target} {action} {args}
+#       An event in one week.
+#   EVERY {weeks} FROM {week} [TO {week}] [INDEXED] {target} {action} {args}
+#       An event every so many weeks, from the first week up to (not including) the
+#       second, or to the end of the horizon.
+#   WHEN {target} {action} >= {amount} [INDEXED] {target} {action} {args}
+#       An event in the first week the running total of a flow (see below) reaches the
+#       amount, counting the lines above it.
+#   RESET {target} ...
+#       A placeholder schedule for each target the scenario does not otherwise use.
+# INDEXED grows the first amount of the event with inflation from week 0. Any number can
+# be arithmetic on numbers and variables, written without spaces, e.g. 0.11*WEEKLY_INCOME.
+# NUM_WEEKS, the params as e.g. CASH_STARTING_BALANCE, and the total of every flow so far
+# as e.g. TOTAL_SHARES_BUY are variables too. Anything after a # is a comment.
+#
+# The targets and actions, with the fields of each as in the asset's input file:
+#   INCOME ADD {amount}
+#   MISC ADD {amount}, an expense
+#   SHARES BUY {amount}, SHARES SELL {amount}
+#   SUPER BUY CC {amount}, SUPER BUY NCC {amount}, SUPER SELL {amount}, and
+#   SUPER BUY FHSS_CC {amount} and SUPER BUY FHSS_NCC {amount} for voluntary contributions,
+#   and SUPER RELEASE_FHSS to sell as much as the first home super saver scheme allows
+#   HOME BUY {amount} [{id} [{annual_ror}]], HOME SELL [{id}]
+#   HOME_LOAN START {amount} {duration} [{id} [{annual_interest_rate}]]
+#   HOME_LOAN PAY {amount} [{id}]
+#   CAR_LOAN START {amount} {balloon_payment} {duration}
+#   HECS START {amount}, HECS PAY {amount}
+# Events of the actions that only take an amount are flows, and a flow's events in the
+# same week are added together, so e.g. a bonus contribution goes on top of a regular
+# one. Each flow is kept in a list over the weeks of the horizon, and a rule is added to
+# it a whole stretch of weeks at a time. Compiled scenarios are kept for the next
+# simulator that compiles the same scenario with the same variables and inflation.
+
+from rates import shared_inflation_index
+import income
+import misc
+import shares
+import superannuation
+import home
+import home_loan
+import car_loan
+import hecs
+
+import ast
+import itertools
+import operator
+
+# The fields after the action of each target's actions: "amount" for a number, which
+# INDEXED grows, "number" for any other number and "name" for a word, with a "?" if the
+# field can be left out
+ACTIONS = {
+    ("INCOME", "ADD"): ["amount"],
+    ("MISC", "ADD"): ["amount"],
+    ("SHARES", "BUY"): ["amount"],
+    ("SHARES", "SELL"): ["amount"],
+    ("SUPER", "BUY"): ["name", "amount"],
+    ("SUPER", "SELL"): ["amount"],
+    ("SUPER", "RELEASE_FHSS"): [],
+    ("HOME", "BUY"): ["amount", "name?", "number?"],
+    ("HOME", "SELL"): ["name?"],
+    ("HOME_LOAN", "START"): ["amount", "number", "name?", "number?"],
+    ("HOME_LOAN", "PAY"): ["amount", "name?"],
+    ("CAR_LOAN", "START"): ["amount", "number", "number"],
+    ("HECS", "START"): ["amount"],
+    ("HECS", "PAY"): ["amount"]
+}
+
+# The flows, and the dict of the input file generator each is kept in, by week
+FLOWS = {
+    "INCOME ADD": "income",
+    "MISC ADD": None,
+    "SHARES BUY": "buy_list",
+    "SHARES SELL": "sell_list",
+    "SUPER BUY CC": "buy_cc_list",
+    "SUPER BUY NCC": "buy_ncc_list",
+    "SUPER BUY FHSS_CC": "buy_fhss_cc_list",
+    "SUPER BUY FHSS_NCC": "buy_fhss_ncc_list",
+    "SUPER SELL": "sell_list",
+    "HOME_LOAN PAY": "pay_list",
+    "HECS PAY": "pay_list"
+}
+
+GENERATORS = {
+    "INCOME": income.InputFileGenerator,
+    "MISC": misc.InputFileGenerator,
+    "SHARES": shares.InputFileGenerator,
+    "SUPER": superannuation.InputFileGenerator,
+    "HOME": home.InputFileGenerator,
+    "HOME_LOAN": home_loan.InputFileGenerator,
+    "CAR_LOAN": car_loan.InputFileGenerator,
+    "HECS": hecs.InputFileGenerator
+}
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos
+}
+
+# Scenarios compiled in this process, by what they were compiled from. Only the most
+# recently compiled MAX_COMPILED_SCENARIOS are kept.
+compiled_scenarios = {}
+MAX_COMPILED_SCENARIOS = 8
+
+def evaluate(expression, variables):
+    # Arithmetic on numbers and variables only
+    def value(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name) and node.id in variables:
+            return variables[node.id]
+        if isinstance(node, ast.UnaryOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](value(node.operand))
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](value(node.left), value(node.right))
+        raise ValueError(f"Cannot work out {expression}")
+    return value(ast.parse(expression, mode="eval").body)
+
+def compile_scenario(scenario_file, num_weeks, variables={}, knobs={}, \
+                        annual_inflation_rate=0):
+    # variables are there for the scenario to use, and knobs are also used instead of
+    # the scenario's own LET of the same name
+    f = open(scenario_file, "r")
+    text = f.read()
+    f.close()
+    inflation_rate = annual_inflation_rate
+    if isinstance(inflation_rate, list):
+        inflation_rate = tuple(inflation_rate)
+    key = (text, num_weeks, tuple(sorted(variables.items())), tuple(sorted(knobs.items())), \
+            inflation_rate)
+    if key not in compiled_scenarios:
+        if len(compiled_scenarios) >= MAX_COMPILED_SCENARIOS:
+            del compiled_scenarios[next(iter(compiled_scenarios))]
+        compiled_scenarios[key] = Compiler(scenario_file, num_weeks, variables, knobs, \
+                                            shared_inflation_index(annual_inflation_rate)) \
+                                        .compile(text)
+    return compiled_scenarios[key]
+
+def input_file_gens(compiled, num_weeks):
+    # New input file generators for a compiled scenario, by target, which can be added to
+    # before they are loaded, e.g. by Simulator.allocate()
+    in_file_gens = {}
+    for target in compiled["resets"]:
+        if target not in compiled["targets"]:
+            in_file_gens[target] = reset_input_files(num_weeks, [target])[0]
+    for target in compiled["targets"]:
+        in_file_gens[target] = GENERATORS[target](num_weeks)
+    for flow, (weeks, amounts) in compiled["flows"].items():
+        in_file_gen = in_file_gens[flow.split()[0]]
+        if FLOWS[flow] is None:
+            for week, amount in zip(weeks, amounts):
+                in_file_gen.add(week, amount)
+        else:
+            getattr(in_file_gen, FLOWS[flow]).update(zip(weeks, amounts))
+    for week, target, action, fields in compiled["events"]:
+        in_file_gen = in_file_gens[target]
+        if target == "SUPER" and action == "RELEASE_FHSS":
+            in_file_gen.release_fhss(week)
+        if target == "HOME" and action == "BUY":
+            in_file_gen.buy(fields[0], week, *fields[1:])
+        if target == "HOME" and action == "SELL":
+            in_file_gen.sell(week, *fields)
+        if target == "HOME_LOAN" and action == "START":
+            in_file_gen.buy(fields[0], week, *fields[1:])
+        if target == "HOME_LOAN" and action == "PAY":
+            in_file_gen.pay(fields[0], week, *fields[1:])
+        if target == "CAR_LOAN" and action == "START":
+            in_file_gen.buy(fields[0], fields[1], week, fields[2])
+        if target == "HECS" and action == "START":
+            in_file_gen.buy(fields[0], week)
+    return in_file_gens
+
+
+class Compiler:
+    def __init__(self, scenario_file, num_weeks, variables, knobs, inflation_index):
+        self.scenario_file = scenario_file
+        self.num_weeks = num_weeks
+        self.variables = dict(variables, NUM_WEEKS=num_weeks)
+        self.variables.update(knobs)
+        self.knobs = knobs
+        self.inflation_index = inflation_index
+        # Each flow's amount in every week, and which weeks have an event
+        self.flows = {}
+        self.flow_weeks = {}
+        self.events = []
+        self.targets = []
+        self.resets = []
+
+    def compile(self, text):
+        for line_number, line in enumerate(text.splitlines(), 1):
+            fields = line.split("#")[0].split()
+            if len(fields) == 0:
+                continue
+            try:
+                self.compile_rule(fields, line)
+            except (ValueError, IndexError, KeyError) as e:
+                raise ValueError(f"{self.scenario_file}, line {line_number}: {e}") from e
+        flows = {}
+        for flow, amounts in self.flows.items():
+            weeks = [week for week in range(self.num_weeks) if self.flow_weeks[flow][week]]
+            flows[flow] = (weeks, [amounts[week] for week in weeks])
+        return {
+            "flows": flows,
+            "events": sorted(self.events, key=lambda event: event[0]),
+            "targets": self.targets,
+            "resets": self.resets
+        }
+
+    def compile_rule(self, fields, line):
+        if "TOTAL_" in line:
+            for flow, amounts in self.flows.items():
+                self.variables["TOTAL_" + flow.replace(" ", "_")] = sum(amounts)
+        rule = fields[0]
+        if rule == "LET":
+            name = fields[1]
+            self.variables[name] = self.knobs[name] if name in self.knobs \
+                    else evaluate(" ".join(fields[2:]), self.variables)
+        elif rule == "RESET":
+            for target in fields[1:]:
+                if target not in GENERATORS:
+                    raise ValueError(f"Unknown target {target}")
+                self.resets.append(target)
+        elif rule == "AT":
+            week = int(self.number(fields[1]))
+            self.add(range(week, week + 1), fields[2:])
+        elif rule == "EVERY":
+            step = int(self.number(fields[1]))
+            if fields[2] != "FROM":
+                raise ValueError("EVERY needs FROM")
+            start = int(self.number(fields[3]))
+            end = self.num_weeks
+            fields = fields[4:]
+            if fields[0] == "TO":
+                end = int(self.number(fields[1]))
+                fields = fields[2:]
+            self.add(range(start, min(end, self.num_weeks), step), fields)
+        elif rule == "WHEN":
+            target, action, comparison, threshold = fields[1:5]
+            if comparison != ">=":
+                raise ValueError("WHEN only compares with >=")
+            flow = self.flow_name(target, action, fields[5:7])
+            threshold = self.number(threshold)
+            amounts = self.flows.get(flow, [])
+            week = next((week for week, total in enumerate(itertools.accumulate(amounts)) \
+                            if total >= threshold), None)
+            if week is not None:
+                self.add(range(week, week + 1), fields[5:])
+        else:
+            raise ValueError(f"Unknown rule {rule}")
+
+    def add(self, weeks, fields):
+        indexed = fields[0] == "INDEXED"
+        if indexed:
+            fields = fields[1:]
+        target, action = fields[0], fields[1]
+        kinds = ACTIONS[(target, action)]
+        values = []
+        for kind, field in zip(kinds, fields[2:]):
+            values.append(field if kind.startswith("name") else self.number(field))
+        required = len([kind for kind in kinds if not kind.endswith("?")])
+        if len(values) < required or len(fields[2:]) > len(kinds):
+            raise ValueError(f"{target} {action} takes {len(kinds)} fields")
+        if target not in self.targets:
+            self.targets.append(target)
+        weeks = range(max(0, weeks.start), min(weeks.stop, self.num_weeks), weeks.step)
+        amount_field = kinds.index("amount") if "amount" in kinds else None
+        flow = self.flow_name(target, action, fields[2:])
+        if flow in FLOWS and amount_field == len(values) - 1:
+            # A flow, added to a stretch of weeks in one go
+            if flow not in self.flows:
+                self.flows[flow] = [0] * self.num_weeks
+                self.flow_weeks[flow] = bytearray(self.num_weeks)
+            amount = values[amount_field]
+            if indexed:
+                amounts = list(map(operator.mul, itertools.repeat(amount), \
+                                    self.inflation_index.over(weeks)))
+            else:
+                amounts = [amount] * len(weeks)
+            stretch = slice(weeks.start, weeks.stop, weeks.step)
+            self.flows[flow][stretch] = map(operator.add, self.flows[flow][stretch], amounts)
+            self.flow_weeks[flow][stretch] = b"\1" * len(weeks)
+            return
+        for week in weeks:
+            event_values = list(values)
+            if indexed and amount_field is not None:
+                event_values[amount_field] *= self.inflation_index[week]
+            self.events.append((week, target, action, event_values))
+
+    def flow_name(self, target, action, fields):
+        # e.g. "SHARES BUY", or "SUPER BUY CC" for a flow with a name before its amount
+        kinds = ACTIONS[(target, action)]
+        names = [field for kind, field in zip(kinds, fields) if kind == "name"]
+        return " ".join([target, action] + names)
+
+    def number(self, field):
+        return evaluate(field, self.variables)
+
+
+def reset_input_files(num_weeks, inputs):
+    in_file_gens = []
+    if "SHARES" in inputs:
+        in_file_gen = shares.InputFileGenerator(num_weeks)
+        amount = 1
+        week = 0
+        in_file_gen.buy(amount, week)
+        in_file_gens.append(in_file_gen)
+    if "SUPER" in inputs:
+        in_file_gen = superannuation.InputFileGenerator(num_weeks)
+        amount = 1
+        week = 0
+        in_file_gen.buy(amount, "CC", week)
+        in_file_gens.append(in_file_gen)
+    if "HOME" in inputs:
+        in_file_gen = home.InputFileGenerator(num_weeks)
+        amount = 1
+        week = 0
+        in_file_gen.buy(amount, week)
+        in_file_gens.append(in_file_gen)
+    if "HOME_LOAN" in inputs:
+        in_file_gen = home_loan.InputFileGenerator(num_weeks)
+        amount = 1
+        start_week = 0
+        duration_years = 1
+        in_file_gen.buy(amount, start_week, duration_years)
+        in_file_gens.append(in_file_gen)
+    if "CAR_LOAN" in inputs:
+        in_file_gen = car_loan.InputFileGenerator(num_weeks)
+        amount = 1
+        balloon_payment = 0
+        start_week = 0
+        duration_years = 1
+        in_file_gen.buy(amount, balloon_payment, start_week, duration_years)
+        in_file_gens.append(in_file_gen)
+    if "HECS" in inputs:
+        in_file_gen = hecs.InputFileGenerator(num_weeks)
+        amount = 1
+        start_week = 0
+        in_file_gen.buy(amount, start_week)
+        in_file_gens.append(in_file_gen)
+    return in_file_gens
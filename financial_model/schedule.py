@@ -0,0 +1,188 @@
+# In-memory schedules and series, and their text file form.
+#
+# An input schedule is a list of lines, where each line is a tuple of the fields that
+# would be written on that line of the input file, e.g. (104, "BUY", 1000.0). Only weeks
+# with events are listed, in order, and a file starts with a header giving the number of
+# weeks it covers, e.g. "# horizon 1768". Older files listing every week still read.
+# An output series is a list of amounts indexed by week (or by year for tax invoices).
+# Anything that reads an input or output file can be handed either a file path or the
+# in-memory equivalent, so the files are only needed when a run is exported.
+# Numeric files can also be in the binary columnar form (see columnar.py), which every
+# reader here recognises, and which the writers use while binary_files is set.
+
+from columnar import is_columnar, read_columnar, write_columnar
+
+import itertools
+import os
+
+# Set while a run is exported in binary, to write numeric files in the columnar form
+binary_files = False
+
+# Lines are written out in chunks of this many
+WRITE_CHUNK_LINES = 4096
+
+# Set by a Profiler to a function taking (path, "read" or "written", num_rows) while it
+# is counting the rows read and written for each file
+row_counter = None
+
+def use_binary_files(binary):
+    global binary_files
+    binary_files = binary
+
+def read_schedule(in_file, sources={}):
+    if row_counter is not None and isinstance(in_file, str):
+        return count_rows(row_counter, in_file, "read", read_lines(in_file, sources))
+    return read_lines(in_file, sources)
+
+def count_rows(counter, path, direction, lines):
+    # Counts the lines as they are read, including when only some of them are
+    num_rows = 0
+    try:
+        for line in lines:
+            num_rows += 1
+            yield line
+    finally:
+        counter(path, direction, num_rows)
+
+def read_lines(in_file, sources={}):
+    if isinstance(in_file, str):
+        in_file = sources.get(in_file, in_file)
+    if isinstance(in_file, str) and is_columnar(in_file):
+        table = read_columnar(in_file)
+        for week, amounts in zip(table["weeks"], zip(*table["columns"])):
+            yield (week, *amounts)
+    elif isinstance(in_file, str):
+        f = open(in_file, "r")
+        for line in f:
+            line = line.split()
+            if len(line) > 0 and line[0].startswith("#"):
+                continue
+            yield line
+        f.close()
+    else:
+        for line in in_file:
+            yield line
+
+def read_events(in_file, sources={}):
+    # The lines of a schedule that do something, grouped by week
+    events = {}
+    for line in read_schedule(in_file, sources):
+        if len(line) > 1:
+            events.setdefault(int(line[0]), []).append(line)
+    return events
+
+def read_schedule_from(in_file, start, sources={}):
+    # The lines of a schedule from week start onward, for a run resumed from there
+    return itertools.dropwhile(lambda line: len(line) > 0 and int(line[0]) < start, \
+                                read_schedule(in_file, sources))
+
+def read_horizon(in_file, sources={}):
+    # The number of weeks in a schedule file's header, or None if it has no header
+    if not isinstance(in_file, str) or in_file in sources:
+        return None
+    if is_columnar(in_file):
+        return read_columnar(in_file)["horizon"]
+    f = open(in_file, "r")
+    line = f.readline().split()
+    f.close()
+    if len(line) == 3 and line[0] == "#" and line[1] == "horizon":
+        return int(line[2])
+    return None
+
+def event_weeks(num_weeks, *events):
+    # The weeks within the horizon with an event in any of the dicts, in order
+    return sorted([week for week in set().union(*events) if 0 <= week < num_weeks])
+
+def write_schedule(in_file, schedule, horizon=None):
+    # schedule can be any iterable of lines, e.g. a generator's events()
+    if binary_files:
+        schedule = list(schedule)
+        if is_numeric(schedule):
+            make_parent_dir(in_file)
+            write_columnar(in_file, [line[0] for line in schedule], \
+                            [[line[i] for line in schedule] for i in range(1, len(schedule[0]))], \
+                            horizon=horizon)
+            if row_counter is not None:
+                row_counter(in_file, "written", len(schedule))
+            return
+    lines = (" ".join([str(field) for field in line]) + "\n" for line in schedule)
+    header = [] if horizon is None else [f"# horizon {horizon}\n"]
+    write_lines(in_file, header, lines)
+
+def write_lines(path, header, lines):
+    make_parent_dir(path)
+    f = open(path, "w")
+    f.writelines(header)
+    num_rows = 0
+    while True:
+        chunk = list(itertools.islice(lines, WRITE_CHUNK_LINES))
+        if len(chunk) == 0:
+            break
+        f.write("".join(chunk))
+        num_rows += len(chunk)
+    f.close()
+    if row_counter is not None:
+        row_counter(path, "written", num_rows)
+
+def is_numeric(schedule):
+    # Whether a schedule can be written as columns: only numbers, the same on every line
+    if len(schedule) == 0 or len(schedule[0]) < 2:
+        return False
+    for line in schedule:
+        if len(line) != len(schedule[0]):
+            return False
+        for field in line:
+            if not isinstance(field, (int, float)):
+                return False
+    return True
+
+def read_columns(out_file, sources={}, num_columns=1):
+    # Missing amounts on a line are read as 0, as the old receipt parsers did.
+    columns = [[] for _ in range(num_columns)]
+    if out_file in sources:
+        in_memory = sources[out_file]
+        columns = [in_memory] if num_columns == 1 else in_memory
+        if row_counter is not None:
+            row_counter(out_file, "read", len(columns[0]))
+        return columns
+    if is_columnar(out_file):
+        table = read_columnar(out_file)
+        columns = table["columns"][:num_columns]
+        columns += [[0] * len(table["weeks"]) for _ in range(num_columns - len(columns))]
+        if row_counter is not None:
+            row_counter(out_file, "read", len(table["weeks"]))
+        return columns
+    f = open(out_file, "r")
+    for line in f:
+        line = line.split()
+        if len(line) == 0 or line[0].startswith("#"):
+            continue
+        for i in range(num_columns):
+            columns[i].append(float(line[i + 1]) if len(line) > i + 1 else 0)
+    f.close()
+    if row_counter is not None:
+        row_counter(out_file, "read", len(columns[0]))
+    return columns
+
+def read_series(out_file, sources={}):
+    return read_columns(out_file, sources)[0]
+
+def write_columns(out_file, *columns):
+    if binary_files:
+        make_parent_dir(out_file)
+        num_rows = min([len(column) for column in columns])
+        write_columnar(out_file, range(num_rows), [column[:num_rows] for column in columns])
+        if row_counter is not None:
+            row_counter(out_file, "written", num_rows)
+        return
+    lines = (f"{week} " + " ".join([str(amount) for amount in amounts]) + "\n" \
+                for week, amounts in enumerate(zip(*columns)))
+    write_lines(out_file, [], lines)
+
+def write_series(out_file, series):
+    write_columns(out_file, series)
+
+def make_parent_dir(path):
+    parent_dir = os.path.dirname(path)
+    if len(parent_dir) > 0:
+        os.makedirs(parent_dir, exist_ok=True)
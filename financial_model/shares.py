@@ -6,25 +6,43 @@
 # I think I have made a fix for the sentence above now
 # Everything else is correct
 
-import math
+from rates import GrowthIndex
+from checkpoints import drop_checkpoints_after
+from ledger import EventLedger
+from schedule import event_weeks, read_schedule_from, write_schedule, write_series
 
 class Shares:
     def __init__(self, in_file, params):
         self.in_file = in_file
-        self.shares = []
+        # Parcels are held oldest first in parallel lists, with sold parcels before
+        # self.first_parcel. A parcel is worth units * growth_index[week], so a week of
+        # growth needs no loop over the parcels, and the total is
+        # total_units * growth_index[week].
+        self.buy_time = []
+        self.buy_amount = []
+        self.units = []
+        self.first_parcel = 0
+        self.total_units = 0
         annual_ror = params["ANNUAL_ROR"]
         starting_balance = params["STARTING_BALANCE"]
+        self.growth_index = GrowthIndex(annual_ror)
         self.buy(starting_balance, 0)
-        self.weekly_ror = 100 * (math.exp(math.log(1 + annual_ror / 100) / 52) - 1)
         self.out_file_gen = OutputFileGenerator()
         self.out_cash_file_gen = OutputCashFileGenerator()
         self.tax_receipt_gen = TaxReceiptGenerator()
-
-    def simulate(self, num_weeks):
-        f = open(self.in_file, "r")
-        input_line = f.readline().split()
-        time = int(input_line[0])
-        for week in range(num_weeks):
+        # Set to a dict to keep a checkpoint at the start of every year, see checkpoints.py
+        self.checkpoints = None
+
+    def simulate(self, num_weeks, export=True, start=0):
+        # start can be a week with a checkpoint, to carry on from there
+        if start > 0:
+            self.restore(start)
+        input_lines = read_schedule_from(self.in_file, start)
+        input_line = next(input_lines, [])
+        time = int(input_line[0]) if len(input_line) > 0 else -1
+        for week in range(start, num_weeks):
+            if self.checkpoints is not None and week % 52 == 0:
+                self.checkpoints[week] = self.checkpoint()
             while time == week:
                 if len(input_line) == 3:
                     time, command, amount = input_line
@@ -36,67 +54,89 @@ class Shares:
                         sold_shares = self.sell(amount, time)
                         self.out_cash_file_gen.add_sold_shares(sold_shares)
                         self.tax_receipt_gen.add_sold_shares(sold_shares)
-                input_line = f.readline().split()
+                input_line = next(input_lines, [])
                 if len(input_line) == 0:
                     break
                 time = int(input_line[0])
-            self.out_file_gen.write_output(self.shares)
-            for i in range(len(self.shares)):
-                self.shares[i]["amount"] *= 1 + self.weekly_ror / 100
-        f.close()
-        self.out_file_gen.generate_output_file()
-        self.out_cash_file_gen.generate_output_file(num_weeks)
-        self.tax_receipt_gen.generate_tax_receipt(num_weeks)
+            self.out_file_gen.write_output(self.total_units * self.growth_index[week])
+        self.out_file_gen.generate_output_file(export)
+        self.out_cash_file_gen.generate_output_file(num_weeks, export)
+        self.tax_receipt_gen.generate_tax_receipt(num_weeks, export)
+
+    def checkpoint(self):
+        # Sold parcels and buy times never change, so only the rest of the parcels are kept
+        return {
+            "num_parcels": len(self.units),
+            "first_parcel": self.first_parcel,
+            "buy_amount": self.buy_amount[self.first_parcel:],
+            "units": self.units[self.first_parcel:],
+            "total_units": self.total_units
+        }
+
+    def restore(self, week):
+        state = self.checkpoints[week]
+        self.first_parcel = state["first_parcel"]
+        del self.buy_time[state["num_parcels"]:]
+        self.buy_amount[self.first_parcel:] = state["buy_amount"]
+        self.units[self.first_parcel:] = state["units"]
+        self.total_units = state["total_units"]
+        del self.out_file_gen.total_amount[week:]
+        self.out_cash_file_gen.truncate(week)
+        self.tax_receipt_gen.truncate(week)
+        drop_checkpoints_after(self.checkpoints, week)
 
     def buy(self, amount, time):
-        self.shares.append({
-            "buy_time": time,
-            "buy_amount": amount,
-            "amount": amount
-            })
+        units = amount / self.growth_index[time]
+        self.buy_time.append(time)
+        self.buy_amount.append(amount)
+        self.units.append(units)
+        self.total_units += units
 
     def sell(self, amount, time):
         amount_remaining = amount
         sold_shares = []
+        growth_factor = self.growth_index[time]
         while amount_remaining > 0:
-            sell_amount = min(amount_remaining, self.shares[0]["buy_amount"])
-            capital_gains = sell_amount / self.shares[0]["buy_amount"] \
-                    * (self.shares[0]["amount"] - self.shares[0]["buy_amount"])
+            i = self.first_parcel
+            buy_amount = self.buy_amount[i]
+            parcel_amount = self.units[i] * growth_factor
+            sell_amount = min(amount_remaining, buy_amount)
+            capital_gains = sell_amount / buy_amount * (parcel_amount - buy_amount)
             sold_shares.append({
                 "sell_time": time,
                 "amount": sell_amount,
                 "capital_gains": capital_gains,
-                "cgt_discount": (time - self.shares[0]["buy_time"]) > 52
+                "cgt_discount": (time - self.buy_time[i]) > 52
             })
-            self.shares[0]["amount"] -= sell_amount * self.shares[0]["amount"] \
-                    / self.shares[0]["buy_amount"]
-            self.shares[0]["buy_amount"] -= sell_amount
-            if self.shares[0]["buy_amount"] == 0:
-                self.shares.pop(0)
+            sold_units = sell_amount * self.units[i] / buy_amount
+            self.units[i] -= sold_units
+            self.total_units -= sold_units
+            self.buy_amount[i] -= sell_amount
+            if self.buy_amount[i] == 0:
+                self.first_parcel += 1
             amount_remaining -= sell_amount
         return sold_shares
 
 
 class InputFileGenerator:
     def __init__(self, num_weeks):
-        self.in_file = open("input_files/shares.txt", "w")
+        self.in_file = "input_files/shares.txt"
         self.num_weeks = num_weeks
         self.buy_list = {}
         self.sell_list = {}
 
+    def events(self):
+        for week in event_weeks(self.num_weeks, self.buy_list, self.sell_list):
+            if week in self.buy_list:
+                yield (week, "BUY", self.buy_list[week])
+            if week in self.sell_list:
+                yield (week, "SELL", self.sell_list[week])
+
+    def schedule(self):
+        return list(self.events())
+
     def write(self):
-        for week in range(self.num_weeks):
-            try:
-                self.in_file.write(f"{week} BUY {self.buy_list[week]}\n")
-            except:
-                pass
-            try:
-                self.in_file.write(f"{week} SELL {self.sell_list[week]}\n")
-            except:
-                pass
-            if week not in self.buy_list and week not in self.sell_list:
-                self.in_file.write(f"{week}\n")
-        self.in_file.close()
+        write_schedule(self.in_file, self.events(), self.num_weeks)
 
     def buy(self, amount, time):
         self.buy_list[time] = amount
@@ -107,83 +147,74 @@ class InputFileGenerator:
 
 class OutputFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/shares.txt", "w")
+        self.out_file = "output_files/shares.txt"
         self.total_amount = []
 
-    def write_output(self, shares):
-        self.total_amount.append(sum([share["amount"] for share in shares]))
+    def write_output(self, total_amount):
+        self.total_amount.append(total_amount)
 
-    def generate_output_file(self):
-        for week, amount in enumerate(self.total_amount):
-            self.out_file.write(f"{week} {amount}\n")
-        self.out_file.close()
+    def generate_output_file(self, export=True):
+        if export:
+            write_series(self.out_file, self.total_amount)
 
 
 # Why do I need this, if I can just read through the input files...?
 class OutputCashFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/cash/shares.txt", "w")
-        self.bought_shares = []
-        self.sold_shares = []
+        self.out_file = "output_files/cash/shares.txt"
+        self.bought = EventLedger()
+        self.sold = EventLedger()
+        self.cash = []
 
     def add_bought_shares(self, amount, time):
-        self.bought_shares.append({
-            "buy_time": time,
-            "amount": amount
-        })
+        self.bought.add(time, amount)
 
     def add_sold_shares(self, new_sold_shares):
-        self.sold_shares.extend(new_sold_shares)
+        for sold_shares in new_sold_shares:
+            self.sold.add(sold_shares["sell_time"], \
+                            sold_shares["amount"] + sold_shares["capital_gains"])
 
-    def generate_output_file(self, num_weeks):
-        # I will assume sold_shares list is sorted based on sell_time
-        # Similarly for bought_shares list
-        for week in range(num_weeks):
-            buy_amount = 0
-            sell_amount = 0
-            if len(self.bought_shares) != 0:
-                while self.bought_shares[0]["buy_time"] == week:
-                    buy_amount += self.bought_shares[0]["amount"]
-                    self.bought_shares.pop(0)
-                    if len(self.bought_shares) == 0:
-                        break
-            if len(self.sold_shares) != 0:
-                while self.sold_shares[0]["sell_time"] == week:
-                    sell_amount += self.sold_shares[0]["amount"] \
-                                    + self.sold_shares[0]["capital_gains"]
-                    self.sold_shares.pop(0)
-                    if len(self.sold_shares) == 0:
-                        break
-            self.out_file.write(f"{week} {sell_amount - buy_amount}\n")
-        self.out_file.close()
+    def truncate(self, week):
+        self.bought.truncate(week)
+        self.sold.truncate(week)
+
+    def generate_output_file(self, num_weeks, export=True):
+        bought = self.bought.amounts(num_weeks)
+        sold = self.sold.amounts(num_weeks)
+        self.cash = [sold[week] - bought[week] for week in range(num_weeks)]
+        if export:
+            write_series(self.out_file, self.cash)
 
 
 class TaxReceiptGenerator:
     def __init__(self):
-        self.tax_file = open("output_files/tax/shares.txt", "w")
-        self.sold_shares = []
+        self.tax_file = "output_files/tax/shares.txt"
+        self.capital_gains = EventLedger()
+        # Whether the last parcel sold in each week had the CGT discount, which applies
+        # to all of that week's capital gains
+        self.cgt_discount = {}
+        self.taxable_income = []
 
     def add_sold_shares(self, new_sold_shares):
-        self.sold_shares.extend(new_sold_shares)
-
-    def generate_tax_receipt(self, num_weeks):
-        # I will assume sold_shares list is sorted based on sell_time
+        for sold_shares in new_sold_shares:
+            self.capital_gains.add(sold_shares["sell_time"], sold_shares["capital_gains"])
+            self.cgt_discount[sold_shares["sell_time"]] = sold_shares["cgt_discount"]
+
+    def truncate(self, week):
+        self.capital_gains.truncate(week)
+        for sell_time in [sell_time for sell_time in self.cgt_discount if sell_time >= week]:
+            del self.cgt_discount[sell_time]
+
+    def generate_tax_receipt(self, num_weeks, export=True):
+        capital_gains = self.capital_gains.amounts(num_weeks)
+        self.taxable_income = []
         for week in range(num_weeks):
-            if len(self.sold_shares) == 0:
-                break
-            if self.sold_shares[0]["sell_time"] != week:
-                self.tax_file.write(f"{week}\n")
+            if self.cgt_discount.get(week, False):
+                self.taxable_income.append(capital_gains[week] / 2)
             else:
-                capital_gains = 0
-                while self.sold_shares[0]["sell_time"] == week:
-                    capital_gains += self.sold_shares[0]["capital_gains"]
-                    cgt_discount = self.sold_shares[0]["cgt_discount"]
-                    self.sold_shares.pop(0)
-                    if len(self.sold_shares) == 0:
-                        break
-                taxable_income = capital_gains if not cgt_discount else capital_gains / 2
-                self.tax_file.write(f"{week} {taxable_income}\n")
-        self.tax_file.close()
+                self.taxable_income.append(capital_gains[week])
+        if export:
+            write_series(self.tax_file, self.taxable_income)
 
 
 
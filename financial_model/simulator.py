@@ -1,69 +1,217 @@
 # TODO: Do starting balance consistency checking between simulations so you are comparing like for like.
-# TODO: Read tax brackets from file; they should increase with inflation.
 
 import tax_collector as tax
-import income
-import misc
 import superannuation
 import shares
 import home
 import home_loan
 import car_loan
 import hecs
-
+from brackets import indexed_brackets
+from caps import CC_YEARLY_CAP, ContributionCaps
+from cache import content_hash
+from checkpoints import earliest, fingerprint, first_change, latest_checkpoint
+from ledger import CashLedger, first_negative_week
+from profiler import Profiler
+from results import Results, present_values
+from scenario import compile_scenario, input_file_gens
+from rates import GrowthIndex, PathRates, discount_factors, sample_returns, sample_rates, \
+                    percentile, shared_inflation_index
+from schedule import read_schedule, read_series, use_binary_files, write_schedule, write_series
+
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import itertools
 import math
-
-def create_inflation_adjuster(annual_inflation_rate):
-    def apply_inflation(amount, time):
-        weekly_inflation_rate = (math.exp(math.log(1 + annual_inflation_rate / 100) / 52) - 1) \
-                                    * 100
-        return amount * (1 + weekly_inflation_rate / 100) ** time
-    return apply_inflation
-
-def reset_input_files(num_weeks, inputs):
-    if "SHARES" in inputs:
-        in_file_gen = shares.InputFileGenerator(num_weeks)
-        amount = 1
-        week = 0
-        in_file_gen.buy(amount, week)
-        in_file_gen.write()
-    if "SUPER" in inputs:
-        in_file_gen = superannuation.InputFileGenerator(num_weeks)
-        amount = 1
-        week = 0
-        in_file_gen.buy(amount, "CC", week)
-        in_file_gen.write()
-    if "HOME" in inputs:
-        in_file_gen = home.InputFileGenerator(num_weeks)
-        amount = 1
-        week = 0
-        in_file_gen.buy(amount, week)
-        in_file_gen.write()
-    if "HOME_LOAN" in inputs:
-        in_file_gen = home_loan.InputFileGenerator(num_weeks)
-        amount = 1
-        start_week = 0
-        duration_years = 1
-        in_file_gen.buy(amount, start_week, duration_years)
-        in_file_gen.write()
-    if "CAR_LOAN" in inputs:
-        in_file_gen = car_loan.InputFileGenerator(num_weeks)
-        amount = 1
-        balloon_payment = 0
-        start_week = 0
-        duration_years = 1
-        in_file_gen.buy(amount, balloon_payment, start_week, duration_years)
-        in_file_gen.write()
-    if "HECS" in inputs:
-        in_file_gen = hecs.InputFileGenerator(num_weeks)
-        amount = 1
-        start_week = 0
-        in_file_gen.buy(amount, start_week)
-        in_file_gen.write()
+import os
+import random
+
+# Annual standard deviations used to sample Monte Carlo paths. Returns are in percent,
+# and interest and inflation rates in percentage points.
+MONTE_CARLO_VOLATILITY = {
+    "RETURNS": 15,
+    "HOME": 10,
+    "INTEREST_RATE": 1,
+    "INFLATION": 1
+}
+
+# The order of the param groups in params.txt, as returned by Simulator.get_params()
+PARAM_GROUPS = ["CASH", "SHARES", "SUPER", "HOME", "HOME_LOAN", "CAR_LOAN", "HECS"]
+
+# Bracket tables built in this process, by what they were built from, so simulators with
+# the same horizon and inflation share them rather than each building their own. Only
+# the most recently built MAX_BRACKET_TABLES are kept.
+bracket_tables = {}
+MAX_BRACKET_TABLES = 8
+
+# The simulators this process runs the optimizer's candidate plans on, by a hash of their
+# params, scenario and horizon, see simulate_plans()
+plan_simulators = {}
+MAX_PLAN_SIMULATORS = 2
+
+# Bump when a change to the model changes the results of a run, so results cached by an
+# earlier version are not used
+MODEL_VERSION = 3
+
+# The inputs each asset reads, for an incremental run to tell which assets to resimulate
+ASSET_INPUTS = {
+    "shares": ["input_files/shares.txt"],
+    "super": ["input_files/super.txt"],
+    "home": ["input_files/home.txt"],
+    "home_loan": ["input_files/home_loan.txt"],
+    "car_loan": ["input_files/car_loan.txt"],
+    "hecs": ["input_files/hecs.txt", "input_files/income.txt", "input_files/hecs_brackets.txt"]
+}
+
+# The inputs tax is worked out from, besides the shares and super tax receipts
+TAX_INPUTS = ["input_files/income.txt", "input_files/super.txt", "input_files/tax_brackets.txt"]
+
+# Every input a run reads
+INPUT_FILES = ["input_files/income.txt", "input_files/misc.txt", "input_files/shares.txt", \
+                "input_files/super.txt", "input_files/home.txt", "input_files/home_loan.txt", \
+                "input_files/car_loan.txt", "input_files/hecs.txt", \
+                "input_files/tax_brackets.txt", "input_files/hecs_brackets.txt"]
+
+# Inputs whose periods are not weeks
+INPUT_PERIOD_WEEKS = {"input_files/tax_brackets.txt": 52}
+
+# Where an allocation plan can put surplus cash: concessional super contributions,
+# extra home loan repayments and shares
+ALLOCATION_TARGETS = ["SUPER", "HOME_LOAN", "SHARES"]
+
+# The scenario a simulator runs unless its scenario sets "SCENARIO_FILE", see scenario.py
+DEFAULT_SCENARIO_FILE = "input_files/scenarios/comprehensive.txt"
+
+class NegativeBalanceError(AssertionError):
+    def __init__(self, week, balance):
+        super().__init__(f"Cash balance is negative from week {week}: " \
+                            + "${:,.2f}".format(balance))
+        self.week = week
+        self.balance = balance
+
+
+def sample_params(sim_params, num_weeks, seed, volatility):
+    cash_params, shares_params, super_params, home_params, home_loan_params, \
+            car_loan_params, hecs_params = [dict(params) for params in sim_params]
+    # Shares and super are invested in the same market, both loans see the same interest
+    # rate environment, and HECS is indexed to inflation, so each of those groups is
+    # sampled from the same random stream.
+    def stream(name):
+        return random.Random(f"{seed}:{name}")
+    shares_params["ANNUAL_ROR"] = sample_returns(shares_params["ANNUAL_ROR"], \
+                                        volatility["RETURNS"], num_weeks, stream("market"))
+    super_params["ANNUAL_ROR"] = sample_returns(super_params["ANNUAL_ROR"], \
+                                        volatility["RETURNS"], num_weeks, stream("market"))
+    home_params["ANNUAL_ROR"] = sample_returns(home_params["ANNUAL_ROR"], \
+                                        volatility["HOME"], num_weeks, stream("home"))
+    for params in [home_loan_params, car_loan_params]:
+        params["ANNUAL_INTEREST_RATE"] = sample_rates(params["ANNUAL_INTEREST_RATE"], \
+                                        volatility["INTEREST_RATE"], num_weeks, stream("interest"))
+    cash_params["ANNUAL_INFLATION_RATE"] = sample_rates(cash_params["ANNUAL_INFLATION_RATE"], \
+                                        volatility["INFLATION"], num_weeks, stream("inflation"))
+    hecs_params["ANNUAL_INDEXATION_RATE"] = sample_rates(hecs_params["ANNUAL_INDEXATION_RATE"], \
+                                        volatility["INFLATION"], num_weeks, stream("inflation"))
+    return cash_params, shares_params, super_params, home_params, home_loan_params, \
+            car_loan_params, hecs_params
+
+def simulate_paths(sim_params, num_weeks, seed, paths, volatility, sample_weeks):
+    # Runs a batch of Monte Carlo paths, keeping only the sampled weeks of each path
+    summaries = []
+    for path in paths:
+        path_params = sample_params(sim_params, num_weeks, f"{seed}:{path}", volatility)
+        simulator = Simulator(path_params)
+        try:
+            simulator.simulate(num_weeks, report=False)
+            negative_balance = False
+        except AssertionError:
+            negative_balance = True
+        results = simulator.results
+        summary = {
+            "net_worth": [],
+            "real_net_worth": [],
+            "cash": [],
+            "debt": [],
+            "negative_balance": negative_balance
+        }
+        # Each path is deflated by its own inflation
+        real_factors = simulator.real_factors(num_weeks)
+        for week in sample_weeks:
+            summary["net_worth"].append(net_worth(results, week))
+            summary["real_net_worth"].append(net_worth(results, week) * real_factors[week])
+            summary["cash"].append(results["cash"][week])
+            summary["debt"].append(total_debt(results, week))
+        summaries.append(summary)
+    return summaries
+
+def total_debt(results, week):
+    return results["home_loan"][week] + results["car_loan"][week] + results["hecs"][week]
+
+def net_worth(results, week):
+    assets = results["shares"][week] + results["super"][week] + results["home"][week]
+    return assets + results["cash"][week] - total_debt(results, week)
+
+def point_params(sim_params, scenario, point):
+    # Grid names like "HOME_LOAN ANNUAL_INTEREST_RATE" set a param as in params.txt,
+    # and anything else is a scenario knob, see Simulator.load_scenario()
+    sim_params = [dict(params) for params in sim_params]
+    scenario = dict(scenario)
+    for name, value in point.items():
+        if " " in name:
+            asset, param_name = name.split()
+            sim_params[PARAM_GROUPS.index(asset)][param_name] = value
+        else:
+            scenario[name] = value
+    return sim_params, scenario
+
+def simulate_points(sim_params, scenario, num_weeks, points, cache=None):
+    # Runs a batch of sweep points. Every point gets its own Simulator and nothing is
+    # exported, so points running at the same time share no state besides the cache.
+    rows = []
+    for point in points:
+        simulator = Simulator(*point_params(sim_params, scenario, point))
+        simulator.cache = cache
+        try:
+            simulator.simulate(num_weeks, report=False)
+            negative_balance = False
+        except AssertionError:
+            negative_balance = True
+        results = simulator.results
+        week = num_weeks - 1
+        rows.append({
+            "point": point,
+            "net_worth": net_worth(results, week),
+            "real_net_worth": net_worth(results, week) * simulator.real_factors(num_weeks)[week],
+            "cash": results["cash"][week],
+            "debt": total_debt(results, week),
+            "negative_balance": negative_balance
+        })
+    return rows
+
+def simulate_plans(sim_params, scenario, num_weeks, allocations, points, cache=None):
+    # Runs a batch of the optimizer's candidate plans, each a point setting "ALLOCATIONS"
+    # to the plan so far, allocations, with one more week allocated. The runs are
+    # incremental, on a simulator kept in this process between batches, so a plan that
+    # only differs from the last plan run from some week on is only simulated again from
+    # the last checkpoint before that week. The plan so far is run first, so each
+    # candidate's super caps are judged on its balances, see Simulator.allocate().
+    key = content_hash([sim_params, scenario, num_weeks])
+    if key not in plan_simulators:
+        if len(plan_simulators) >= MAX_PLAN_SIMULATORS:
+            del plan_simulators[next(iter(plan_simulators))]
+        plan_simulators[key] = Simulator(sim_params, dict(scenario))
+    simulator = plan_simulators[key]
+    simulator.cache = cache
+    simulator.simulate_plan(num_weeks, allocations)
+    rows = []
+    for point in points:
+        row = simulator.simulate_plan(num_weeks, point["ALLOCATIONS"])
+        row["point"] = point
+        rows.append(row)
+    return rows
 
 
 class Simulator:
-    def __init__(self):
+    def __init__(self, sim_params=None, scenario=None):
         self.output_cash_files = ["shares.txt",
                                     "super.txt",
                                     "home.txt",
@@ -73,38 +221,507 @@ class Simulator:
         self.output_tax_files = ["invoice.txt",
                                     "super_invoice.txt"]
         self.final_output_file = "output_files/cash.txt"
-        sim_params = self.get_params()
+        if sim_params is None:
+            sim_params = self.get_params()
         self.cash_params, self.shares_params, self.super_params, self.home_params, \
                 self.home_loan_params, self.car_loan_params, self.hecs_params \
                 = sim_params
-        #TODO:Adjust for inflation when generating input files
-        #TODO:Add support for inflation in tax brackets
-        #TODO:Re-initialise all input files when generating them instead of commenting code out
-        #     Could re-write them with initial values at end of generate_input_files()
-        #TODO:Create an experiments Python file from which I can import my experiments so I don't delete the code
         self.out_cash = [self.cash_params["STARTING_BALANCE"]]
-        #TODO:Add annual inflation rate parameter to input_files/params.txt
-        self.apply_inflation = create_inflation_adjuster(3)
+        annual_inflation_rate = self.cash_params["ANNUAL_INFLATION_RATE"]
+        self.inflation_index = shared_inflation_index(annual_inflation_rate)
+        self.apply_inflation = self.inflation_index.inflate
+        self.inflation_rate = annual_inflation_rate
+        # Scenario knobs, e.g. {"HOME_LOAN_AMOUNT": 300000}, used by sweep(), and the
+        # scenario file in "SCENARIO_FILE"
+        self.scenario = {} if scenario is None else scenario
+        # In-memory schedules and series, keyed by the file they would be read from
+        self.sources = {}
+        self.results = {}
+        self.allocated = {}
+        self.export = False
+        self.profiler = None
+        self.profile = None
+        # The bracket table loaded for each file, and what it was built from
+        self.tables = {}
+        # What an incremental run keeps for the next one to carry on from
+        self.last_run = None
+        # A ResultCache to load repeated runs from and save new ones to, see cache.py.
+        # Sweeps and the optimizer share it with the simulators of their points.
+        self.cache = None
+
+    def simulate(self, num_weeks, export=False, report=True, profile=False, \
+                    incremental=False):
+        # With export off, the generated schedules and every output series stay in
+        # memory and no input_files/output_files are written. export can be True to
+        # write them as text, or "binary" to write the numeric ones as binary columns.
+        # profile can be True to time each stage and count the rows read and written,
+        # or "cprofile" or "tracemalloc" to capture the whole run as well. The report is
+        # kept in self.profile.
+        # incremental can be True to keep checkpoints of every asset, so that the next
+        # incremental run over the same horizon only simulates the assets whose inputs or
+        # params have changed, from their last checkpoint before the change, and only
+        # works out tax again from the first year affected. Exported runs are run in full.
+        # With a cache set, a run that is not exported is looked up in it once its inputs
+        # are generated, and only simulated if it is not there.
+        self.export = export
+        self.sources = {}
+        self.out_cash = [self.cash_params["STARTING_BALANCE"]]
+        self.profiler = Profiler(profile) if profile else None
+        if self.profiler is not None:
+            self.profiler.start()
+        use_binary_files(export == "binary")
+        try:
+            self.run_stages(num_weeks, export, incremental)
+        finally:
+            use_binary_files(False)
+            if self.profiler is not None:
+                self.profiler.stop()
+                self.profile = self.profiler.report()
+
+        if report:
+            self.print_final_report(num_weeks)
+            if self.profiler is not None:
+                print()
+                self.print_profile_report()
+        return self.results
+
+    def run_stages(self, num_weeks, export, incremental=False):
+        with self.stage("inputs"):
+            self.generate_input_files(num_weeks)
+
+        cache_key = None
+        if self.cache is not None and not export:
+            cache_key = self.cache_key(num_weeks)
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                self.last_run = None
+                self.results = entry["results"]
+                self.out_cash = self.results["cash"]
+                self.assert_positive_balance()
+                return
+
+        last_run = self.last_run
+        if not incremental or export or last_run is None or last_run["num_weeks"] != num_weeks:
+            last_run = None
+        self.last_run = None
+        inputs = {}
+        fingerprints = {}
+        changes = {}
+        if incremental:
+            for in_file in set(TAX_INPUTS).union(*ASSET_INPUTS.values()):
+                inputs[in_file] = self.source(in_file)
+                # Tables kept from the last run need not be fingerprinted again
+                if last_run is not None and not isinstance(inputs[in_file], str) \
+                        and inputs[in_file] is last_run["inputs"][in_file]:
+                    fingerprints[in_file] = last_run["fingerprints"][in_file]
+                else:
+                    fingerprints[in_file] = fingerprint(inputs[in_file], \
+                                                        INPUT_PERIOD_WEEKS.get(in_file, 1))
+                if last_run is not None:
+                    changes[in_file] = first_change(last_run["fingerprints"][in_file], \
+                                                    fingerprints[in_file])
+
+        assets = {}
+        asset_params = {}
+        # The week each asset was simulated from, or None if it was kept as it was
+        starts = {}
+        for name, in_files in ASSET_INPUTS.items():
+            asset_params[name] = dict(self.asset_params(name))
+            asset = None
+            start = 0
+            if last_run is not None and last_run["params"][name] == asset_params[name]:
+                change = earliest(*[changes[in_file] for in_file in in_files])
+                checkpoint = None if change is None \
+                        else latest_checkpoint(last_run["assets"][name].checkpoints, change)
+                if change is None or (checkpoint is not None and checkpoint > 0):
+                    asset = last_run["assets"][name]
+                    start = checkpoint
+                    self.use_sources(name, asset)
+            if asset is None:
+                asset = self.create_asset(name)
+                if incremental:
+                    asset.checkpoints = {}
+            if start is not None:
+                with self.stage(name):
+                    asset.simulate(num_weeks, export, start)
+            assets[name] = asset
+            starts[name] = start
+            self.sources[asset.out_cash_file_gen.out_file] = asset.out_cash_file_gen.cash
+        shares_sim = assets["shares"]
+        super_sim = assets["super"]
+        self.sources[shares_sim.tax_receipt_gen.tax_file] = \
+                shares_sim.tax_receipt_gen.taxable_income
+        self.sources[super_sim.tax_receipt_gen.tax_file] = \
+                [super_sim.tax_receipt_gen.taxed_amount, super_sim.tax_receipt_gen.untaxed_earnings]
+        self.results = {
+            "shares": shares_sim.out_file_gen.total_amount,
+            "super": super_sim.out_file_gen.total_amount,
+            "home": assets["home"].out_file_gen.property_value,
+            "home_loan": assets["home_loan"].out_file_gen.loan_value,
+            "car_loan": assets["car_loan"].out_file_gen.loan_value,
+            "hecs": assets["hecs"].out_file_gen.loan_value,
+            "super_excess": super_sim.out_excess_file_gen.excess_amount
+        }
+
+        with self.stage("tax"):
+            # Years before the first change to a tax input or receipt are kept
+            start_year = 0
+            previous_ledger = None
+            if last_run is not None:
+                change = earliest(*[changes[in_file] for in_file in TAX_INPUTS], \
+                                    starts["shares"], starts["super"])
+                start_year = num_weeks // 52 + 1 if change is None else change // 52
+                previous_ledger = last_run["tax_ledger"]
+            # The tax inputs are found the same way as every other input, so one that is
+            # neither generated nor on disk is empty
+            tax_sources = dict(self.sources)
+            for in_file in TAX_INPUTS:
+                tax_sources[in_file] = inputs[in_file] if in_file in inputs \
+                        else self.source(in_file)
+            tax_ledger = tax.TaxLedger(tax_sources, previous_ledger, start_year)
+            tax_collectors = [tax.IncomeTaxCollector(tax_sources, tax_ledger),
+                                tax.SuperTaxCollector(tax_sources, tax_ledger)]
+            if last_run is not None:
+                for tax_collector, previous in zip(tax_collectors, last_run["tax_collectors"]):
+                    tax_collector.invoice = list(previous.invoice)
+            tax.TaxCollector(tax_collectors).apply_tax(export, start_year)
+        for tax_collector in tax_collectors:
+            self.sources[tax_collector.tax_file] = tax_collector.invoice
+
+        if incremental and not export:
+            self.last_run = {
+                "num_weeks": num_weeks,
+                "inputs": inputs,
+                "fingerprints": fingerprints,
+                "params": asset_params,
+                "assets": assets,
+                "tax_ledger": tax_ledger,
+                "tax_collectors": tax_collectors
+            }
+
+        with self.stage("receipts"):
+            self.parse_receipts(num_weeks)
+        self.results["cash"] = self.out_cash
+        if cache_key is not None:
+            self.cache.put(cache_key, self.results)
+        self.assert_positive_balance()
 
-    def simulate(self, num_weeks):
+    def cache_key(self, num_weeks):
+        # A hash of everything the run's results depend on, once its inputs are generated
+        sim_params = (self.cash_params, self.shares_params, self.super_params, \
+                        self.home_params, self.home_loan_params, self.car_loan_params, \
+                        self.hecs_params)
+        parts = [MODEL_VERSION, num_weeks, sim_params]
+        for in_file in INPUT_FILES:
+            source = self.source(in_file)
+            # A table built here is hashed by what it was built from, which is quicker
+            if in_file in self.tables and self.tables[in_file][1] is source:
+                source = self.tables[in_file][0]
+            parts.append(source)
+        return content_hash(parts)
+
+    def asset_params(self, name):
+        return {
+            "shares": self.shares_params,
+            "super": self.super_params,
+            "home": self.home_params,
+            "home_loan": self.home_loan_params,
+            "car_loan": self.car_loan_params,
+            "hecs": self.hecs_params
+        }[name]
+
+    def create_asset(self, name):
+        if name == "shares":
+            return shares.Shares(self.source("input_files/shares.txt"), self.shares_params)
+        if name == "super":
+            return superannuation.Super(self.source("input_files/super.txt"), self.super_params, \
+                                        self.inflation_index)
+        if name == "home":
+            return home.Home(self.source("input_files/home.txt"), self.home_params)
+        if name == "home_loan":
+            return home_loan.HomeLoan(self.source("input_files/home_loan.txt"), \
+                                        self.home_loan_params)
+        if name == "car_loan":
+            return car_loan.CarLoan(self.source("input_files/car_loan.txt"), \
+                                        self.car_loan_params)
+        if name == "hecs":
+            return hecs.Hecs(self.source("input_files/hecs.txt"), self.hecs_params, \
+                                self.source("input_files/income.txt"), \
+                                self.source("input_files/hecs_brackets.txt"))
+
+    def use_sources(self, name, asset):
+        # An asset kept from the last run reads this run's schedules from now on
+        asset.in_file = self.source(ASSET_INPUTS[name][0])
+        if name == "hecs":
+            asset.income_file = self.source("input_files/income.txt")
+            asset.brackets_file = self.source("input_files/hecs_brackets.txt")
+
+    def stage(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(name)
+
+    def monte_carlo(self, num_weeks, num_paths, seed=0, num_processes=None, \
+                    volatility=MONTE_CARLO_VOLATILITY, percentiles=[5, 25, 50, 75, 95], \
+                    report=True):
+        # Every path resamples the weekly returns, interest rates and inflation around
+        # the fixed rates in params.txt. Paths are run in batches across a process pool,
+        # and the result is the percentile bands of net worth, cash and debt at the start
+        # of each year and in the final week, plus how often cash went negative.
+        sample_weeks = list(range(0, num_weeks - 1, 52)) + [num_weeks - 1]
+        sim_params = (self.cash_params, self.shares_params, self.super_params, \
+                        self.home_params, self.home_loan_params, self.car_loan_params, \
+                        self.hecs_params)
+        if num_processes is None:
+            num_processes = os.cpu_count()
+        batch_size = max(1, math.ceil(num_paths / (4 * num_processes)))
+        batches = [range(start, min(start + batch_size, num_paths)) \
+                    for start in range(0, num_paths, batch_size)]
+        args = [(sim_params, num_weeks, seed, batch, volatility, sample_weeks) \
+                    for batch in batches]
+        if num_processes == 1:
+            batch_summaries = [simulate_paths(*batch_args) for batch_args in args]
+        else:
+            with ProcessPoolExecutor(num_processes) as executor:
+                batch_summaries = list(executor.map(simulate_paths, *zip(*args)))
+        summaries = [summary for batch in batch_summaries for summary in batch]
+
+        num_negative = len([summary for summary in summaries if summary["negative_balance"]])
+        bands = {
+            "weeks": sample_weeks,
+            "num_paths": num_paths,
+            "probability_negative_balance": num_negative / num_paths
+        }
+        for name in ["net_worth", "real_net_worth", "cash", "debt"]:
+            bands[name] = {percent: [] for percent in percentiles}
+            for i in range(len(sample_weeks)):
+                values = sorted([summary[name][i] for summary in summaries])
+                for percent in percentiles:
+                    bands[name][percent].append(percentile(values, percent))
+        if report:
+            self.print_monte_carlo_report(bands)
+        return bands
+
+    def stress_test_loans(self, num_weeks, num_paths, seed=0, \
+                            volatility=MONTE_CARLO_VOLATILITY, percentiles=[5, 25, 50, 75, 95], \
+                            report=True):
+        # Runs the home loan, car loan and HECS schedules under num_paths paths of
+        # interest and indexation rates, sampled as monte_carlo() samples them, with every
+        # path of each debt worked out together in this process (see HomeLoanPaths).
+        # Income, and so each HECS repayment, follows the fixed inflation rate. The result
+        # is the percentile bands of each debt at the start of each year and in the final
+        # week, and of the total repaid on each.
+        self.export = False
+        self.sources = {}
         self.generate_input_files(num_weeks)
-
-        assets = [shares.Shares("input_files/shares.txt", self.shares_params),
-                    superannuation.Super("input_files/super.txt", self.super_params),
-                    home.Home("input_files/home.txt", self.home_params),
-                    home_loan.HomeLoan("input_files/home_loan.txt", self.home_loan_params),
-                    car_loan.CarLoan("input_files/car_loan.txt", self.car_loan_params),
-                    hecs.Hecs("input_files/hecs.txt", self.hecs_params)]
-        for asset in assets:
-            asset.simulate(num_weeks)
-
-        tax_collectors = [tax.IncomeTaxCollector(),
-                            tax.SuperTaxCollector()]
-        tax.TaxCollector(tax_collectors).apply_tax()
-
-        self.parse_receipts()
-
-        self.print_final_report(num_weeks)
+        sample_weeks = list(range(0, num_weeks - 1, 52)) + [num_weeks - 1]
+        def path_rates(annual_rate, annual_volatility, name):
+            return PathRates((sample_rates(annual_rate, annual_volatility, num_weeks, \
+                                            random.Random(f"{seed}:{path}:{name}")) \
+                                for path in range(num_paths)), num_weeks)
+        interest_rates = path_rates(self.home_loan_params["ANNUAL_INTEREST_RATE"], \
+                                    volatility["INTEREST_RATE"], "interest")
+        if self.car_loan_params["ANNUAL_INTEREST_RATE"] != \
+                self.home_loan_params["ANNUAL_INTEREST_RATE"]:
+            car_interest_rates = path_rates(self.car_loan_params["ANNUAL_INTEREST_RATE"], \
+                                            volatility["INTEREST_RATE"], "interest")
+        else:
+            car_interest_rates = interest_rates
+        indexation_rates = path_rates(self.hecs_params["ANNUAL_INDEXATION_RATE"], \
+                                        volatility["INFLATION"], "inflation")
+        incomes = hecs.weekly_incomes(self.source("input_files/income.txt"), num_weeks)
+        loans = {
+            "home_loan": home_loan.HomeLoanPaths(self.source("input_files/home_loan.txt"), \
+                                                    interest_rates),
+            "car_loan": car_loan.CarLoanPaths(self.source("input_files/car_loan.txt"), \
+                                                car_interest_rates),
+            "hecs": hecs.HecsPaths(self.source("input_files/hecs.txt"), indexation_rates, \
+                                    [incomes] * num_paths, \
+                                    self.source("input_files/hecs_brackets.txt"))
+        }
+
+        bands = {
+            "weeks": sample_weeks,
+            "num_paths": num_paths,
+            "repaid": {}
+        }
+        for name, loan in loans.items():
+            loan.simulate(num_weeks, sample_weeks)
+            bands[name] = {percent: [] for percent in percentiles}
+            for balances in loan.balances:
+                values = sorted(balances)
+                for percent in percentiles:
+                    bands[name][percent].append(percentile(values, percent))
+            values = sorted(loan.repaid)
+            bands["repaid"][name] = {percent: percentile(values, percent) \
+                                        for percent in percentiles}
+        if report:
+            self.print_stress_test_report(bands)
+        return bands
+
+    def sweep(self, num_weeks, grid, num_processes=None, report=True, rank_by="net_worth"):
+        # grid maps each knob to the values to try, e.g.
+        # {"HOME_LOAN_AMOUNT": [300000, 400000], "HOME_LOAN ANNUAL_INTEREST_RATE": [5, 6]}
+        # Every combination is simulated across a process pool, and the rows come back
+        # sorted by final net worth, best first, or by real net worth with rank_by set to
+        # "real_net_worth".
+        points = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+        if num_processes is None:
+            num_processes = os.cpu_count()
+        if num_processes == 1:
+            rows = self.evaluate_points(num_weeks, points, 1)
+        else:
+            with ProcessPoolExecutor(num_processes) as executor:
+                rows = self.evaluate_points(num_weeks, points, num_processes, executor)
+        rows.sort(key=lambda row: row[rank_by], reverse=True)
+        if report:
+            self.print_sweep_report(grid, rows)
+        return rows
+
+    def evaluate_points(self, num_weeks, points, num_processes, executor=None):
+        # Simulates each point on top of this simulator's params and scenario, in batches
+        # across the executor if there is one
+        sim_params = (self.cash_params, self.shares_params, self.super_params, \
+                        self.home_params, self.home_loan_params, self.car_loan_params, \
+                        self.hecs_params)
+        batch_size = max(1, math.ceil(len(points) / (4 * num_processes)))
+        batches = [points[start:start + batch_size] \
+                    for start in range(0, len(points), batch_size)]
+        if executor is None:
+            batch_rows = [simulate_points(sim_params, self.scenario, num_weeks, batch, \
+                                            self.cache) for batch in batches]
+        else:
+            batch_rows = list(executor.map(simulate_points, \
+                                            [sim_params] * len(batches), \
+                                            [self.scenario] * len(batches), \
+                                            [num_weeks] * len(batches), batches, \
+                                            [self.cache] * len(batches)))
+        return [row for batch in batch_rows for row in batch]
+
+    def optimize(self, num_weeks, period=52, fractions=[0.25, 0.5, 0.75, 1], \
+                    num_processes=None, report=True):
+        # Searches for the allocation plan with the best final net worth, one period at a
+        # time. At the start of each period, the headroom is the most cash that can be
+        # spent then without the balance going negative later. Each target is tried with
+        # each fraction of the headroom, the candidates are simulated across a process
+        # pool, and the best one is added to the plan if it beats the plan so far without
+        # going over the super caps by any more than it does. Every candidate only changes
+        # the plan from the period on, so each is only simulated again from there, see
+        # simulate_plans().
+        if num_processes is None:
+            num_processes = os.cpu_count()
+        executor = None
+        if num_processes > 1:
+            executor = ProcessPoolExecutor(num_processes)
+        allocations = {}
+        try:
+            best = self.simulate_plan(num_weeks, allocations)
+            for week in range(0, num_weeks, period):
+                if best["negative_balance"]:
+                    break
+                headroom = min(self.results["cash"][week:])
+                points = []
+                for target in ALLOCATION_TARGETS:
+                    for fraction in fractions:
+                        amount = int(fraction * headroom)
+                        if amount > 0:
+                            plan = dict(allocations)
+                            plan[week] = {target: amount}
+                            points.append({"ALLOCATIONS": plan})
+                rows = self.evaluate_plans(num_weeks, allocations, points, num_processes, \
+                                            executor)
+                rows = [row for row in rows if not row["negative_balance"] \
+                        and row["super_excess"] <= best["super_excess"] \
+                        and row["net_worth"] > best["net_worth"]]
+                if len(rows) > 0:
+                    row = max(rows, key=lambda row: row["net_worth"])
+                    best = self.simulate_plan(num_weeks, row["point"]["ALLOCATIONS"])
+                    allocations = self.allocated
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        best["allocations"] = allocations
+        if report:
+            self.print_optimize_report(best)
+        return best
+
+    def evaluate_plans(self, num_weeks, allocations, points, num_processes, executor=None):
+        # Simulates each candidate plan on top of this simulator's params and scenario, in
+        # one batch for each process, so each process carries on from its own last runs
+        sim_params = (self.cash_params, self.shares_params, self.super_params, \
+                        self.home_params, self.home_loan_params, self.car_loan_params, \
+                        self.hecs_params)
+        batch_size = max(1, math.ceil(len(points) / num_processes))
+        batches = [points[start:start + batch_size] \
+                    for start in range(0, len(points), batch_size)]
+        if executor is None:
+            batch_rows = [simulate_plans(sim_params, self.scenario, num_weeks, allocations, \
+                                            batch, self.cache) for batch in batches]
+        else:
+            batch_rows = list(executor.map(simulate_plans, \
+                                            [sim_params] * len(batches), \
+                                            [self.scenario] * len(batches), \
+                                            [num_weeks] * len(batches), \
+                                            [allocations] * len(batches), batches, \
+                                            [self.cache] * len(batches)))
+        return [row for batch in batch_rows for row in batch]
+
+    def simulate_plan(self, num_weeks, allocations):
+        scenario = self.scenario
+        self.scenario = dict(scenario, ALLOCATIONS=allocations)
+        try:
+            self.simulate(num_weeks, report=False, incremental=True)
+            negative_balance = False
+        except AssertionError:
+            negative_balance = True
+        finally:
+            self.scenario = scenario
+        return {
+            "net_worth": net_worth(self.results, num_weeks - 1),
+            "super_excess": sum(self.results["super_excess"]),
+            "negative_balance": negative_balance
+        }
+
+    def source(self, in_file):
+        # Generated schedules take priority, then hand-written input files on disk.
+        # An input that is neither is an empty schedule.
+        if in_file in self.sources:
+            if self.profiler is not None and isinstance(self.sources[in_file], list):
+                self.profiler.count_rows(in_file, "read", len(self.sources[in_file]))
+            return self.sources[in_file]
+        if os.path.exists(in_file):
+            return in_file
+        return []
+
+    def load_inputs(self, *in_file_gens):
+        for in_file_gen in in_file_gens:
+            self.load_schedule(in_file_gen.in_file, in_file_gen.schedule(), \
+                                in_file_gen.num_weeks)
+
+    def load_schedule(self, in_file, schedule, horizon=None):
+        self.sources[in_file] = schedule
+        if self.export:
+            write_schedule(in_file, schedule, horizon)
+
+    def load_table(self, in_file, table):
+        # Bracket tables are kept whole, and only written out as a schedule
+        self.sources[in_file] = table
+        if self.export:
+            write_schedule(in_file, table.schedule())
+
+    def load_indexed_brackets(self, in_file, rates, thresholds, factors):
+        # Thresholds are multiplied by each period's inflation factor, so a table built
+        # before with the same brackets, horizon and inflation rate is used again
+        inflation_rate = self.inflation_rate
+        if isinstance(inflation_rate, list):
+            inflation_rate = tuple(inflation_rate)
+        key = (in_file, tuple(rates), tuple(thresholds), len(factors), inflation_rate)
+        if key not in bracket_tables:
+            if len(bracket_tables) >= MAX_BRACKET_TABLES:
+                del bracket_tables[next(iter(bracket_tables))]
+            bracket_tables[key] = indexed_brackets(rates, thresholds, factors)
+        self.tables[in_file] = (key, bracket_tables[key])
+        self.load_table(in_file, bracket_tables[key])
 
     def get_params(self):
         params_file = open("input_files/params.txt", "r")
@@ -140,211 +757,125 @@ class Simulator:
                 car_loan_params, hecs_params
 
     def generate_tax_brackets(self, num_weeks):
-        params_file = open("input_files/tax_brackets.txt", "w")
         tax_brackets = [18200, 45000, 120000, 180000]
         mtr = [19, 32.5, 37, 45]
-        for year in range(num_weeks // 52):
-            params_file.write(f"{year} RATES ")
-            for rate in mtr:
-                params_file.write(f"{rate} ")
-            params_file.write("\n")
-            params_file.write(f"{year} BRACKETS ")
-            for bracket in tax_brackets:
-                #params_file.write(f"{bracket} ")
-                params_file.write(f"{self.apply_inflation(bracket, 52 * year)} ")
-            params_file.write("\n")
-            params_file.write("\n")
-        params_file.close()
-    
+        # Each year's brackets are indexed from the start of the year
+        self.load_indexed_brackets("input_files/tax_brackets.txt", mtr, tax_brackets, \
+                                    self.inflation_index.over(range(0, num_weeks // 52 * 52, 52)))
+
     def generate_hecs_brackets(self, num_weeks):
-        params_file = open("input_files/hecs_brackets.txt", "w")
         repayment_rates = [0, 1, 2, 2.5, 3, 3.5, 4, 4.5, 5, 5.5, 6, 6.5, 7, 7.5, \
                             8, 8.5, 9, 9.5, 10]
         income_brackets = [51550, 59518, 63089, 66875, 70888, 75140, \
                             79649, 84429, 89494, 94865, 100557, 106590, \
                             112985, 119764, 126950, 134568, 142642, 151200]
-        for week in range(num_weeks):
-            params_file.write(f"{week} RATES ")
-            for rate in repayment_rates:
-                params_file.write(f"{rate} ")
-            params_file.write("\n")
-            params_file.write(f"{week} BRACKETS ")
-            for bracket in income_brackets:
-                #params_file.write(f"{bracket} ")
-                params_file.write(f"{self.apply_inflation(bracket, week)} ")
-            params_file.write("\n")
-            params_file.write("\n")
-        params_file.close()
-
-    def comprehensive_experiment(self, num_weeks):
-        misc_file_gen = misc.InputFileGenerator(num_weeks)
-
-        # Income
-        income_file_gen = income.InputFileGenerator(num_weeks)
-        weekly_income = int(75000 / 52)
-        for week in range(num_weeks):
-            income_file_gen.add(week, self.apply_inflation(weekly_income, week))
-        home_loan_start_year = 2
-        weekly_expenses = 500
-        for week in range(home_loan_start_year * 52, num_weeks):
-            misc_file_gen.add(week, self.apply_inflation(weekly_expenses, week))
-
-        # Super
-        super_file_gen = superannuation.InputFileGenerator(num_weeks)
-        employer_super_contribution = 0.11 * weekly_income
-        for week in range(num_weeks):
-            super_file_gen.buy(self.apply_inflation(employer_super_contribution, week), "CC", week)
-        for week in range(15):
-            super_file_gen.buy(self.apply_inflation(employer_super_contribution, week) \
-                                + 1000, "CC", week)
-        for week in range(1 * 52, 1 * 52 + 15):
-            super_file_gen.buy(self.apply_inflation(employer_super_contribution, week) \
-                                + 1000, "CC", week)
-        #for week in range(15):
-            #super_file_gen.buy(1000, "CC", week)
-        #for week in range(1 * 52, 1 * 52 + 15):
-            #super_file_gen.buy(1000, "CC", week)
-        #fhss_yearly_cap = 15000
-        #super_file_gen.buy(fhss_yearly_cap, "CC", 0)
-        #super_file_gen.buy(fhss_yearly_cap, "CC", 1 * 52)
-        fhss_yearly_cap = 15000
-        fhss_total_earnings = 3992 # This number is correct, at least until I change parameters
-        super_file_gen.sell(2 * fhss_yearly_cap + fhss_total_earnings, home_loan_start_year * 52)
-        #super_cc_yearly_cap = 30000
-        #num_contribs = 8
-        #for year in range(home_loan_start_year + 1, home_loan_start_year + 1 + num_contribs):
-            #week = year * 52
-            #super_file_gen.buy(self.apply_inflation(super_cc_yearly_cap, week), "CC", week)
-
-        # Home
-        home_file_gen = home.InputFileGenerator(num_weeks)
-        home_purchase_price = 500000
-        home_file_gen.buy(home_purchase_price, home_loan_start_year * 52)
-        misc_file_gen.add(home_loan_start_year * 52, -200000)
-
-        # Home Loan
-        home_loan_file_gen = home_loan.InputFileGenerator(num_weeks)
-        loan_amount = 0.8 * home_purchase_price
-        loan_duration_years = 30
-        home_loan_file_gen.buy(loan_amount, home_loan_start_year * 52, loan_duration_years)
-
-        # Car Loan
-        car_loan_file_gen = car_loan.InputFileGenerator(num_weeks)
-        balloon_payment = 0
-        start_week = 10 * 52
-        loan_duration_years = 5
-        loan_amount = self.apply_inflation(25000, start_week)
-        car_loan_file_gen.buy(loan_amount, balloon_payment, start_week, loan_duration_years)
-
-        misc_file_gen.write()
-        income_file_gen.write()
-        super_file_gen.write()
-        home_file_gen.write()
-        home_loan_file_gen.write()
-        car_loan_file_gen.write()
-
-        #reset_inputs = ["SHARES",
-                        #"CAR_LOAN"]
-        #reset_input_files(num_weeks, reset_inputs)
+        self.load_indexed_brackets("input_files/hecs_brackets.txt", repayment_rates, \
+                                    income_brackets, self.inflation_index.over(range(num_weeks)))
+
+    def allocate(self, num_weeks, in_file_gens):
+        # Puts the surplus cash planned in self.scenario["ALLOCATIONS"], a dict of
+        # week -> {"SUPER": amount, "HOME_LOAN": amount, "SHARES": amount}, into the
+        # scenario's input file generators, by target, adding any it does not have.
+        # Super contributions are limited to what is left of the concessional cap, and
+        # the amounts actually allocated are kept in self.allocated.
+        # Carry-forward depends on the super balance at the end of each year. That is
+        # taken from the last run over the same horizon, whose plan is taken to be the
+        # same as this one up to the year allocated in, as it is for the optimizer's
+        # candidates, see simulate_plans(). Without one, the balance is estimated. The
+        # estimate leaves out withdrawals, so it errs on the side of ending carry-forward
+        # too early rather than too late.
+        self.allocated = {}
+        if "ALLOCATIONS" not in self.scenario:
+            return
+        allocations = self.scenario["ALLOCATIONS"]
+        cc_yearly_cap = self.scenario.get("SUPER_CC_YEARLY_CAP", \
+                                            self.super_params.get("CC_YEARLY_CAP", CC_YEARLY_CAP))
+        super_file_gen = in_file_gens.setdefault("SUPER", \
+                                                superannuation.InputFileGenerator(num_weeks))
+        home_loan_file_gen = in_file_gens.setdefault("HOME_LOAN", \
+                                                    home_loan.InputFileGenerator(num_weeks))
+        shares_file_gen = in_file_gens.setdefault("SHARES", shares.InputFileGenerator(num_weeks))
+        # The caps are followed through the contributions already planned, a whole year at
+        # a time
+        caps = ContributionCaps(cc_yearly_cap, self.inflation_index)
+        planned = [event for event in super_file_gen.events() if event[1] == "BUY"]
+        next_event = 0
+        last_super = self.results.get("super")
+        if last_super is not None and len(last_super) != num_weeks:
+            last_super = None
+        growth_index = GrowthIndex(self.super_params["ANNUAL_ROR"])
+        balance = self.super_params.get("STARTING_BALANCE", 0)
+        for week in sorted(allocations):
+            if week >= num_weeks:
+                continue
+            allocation = {target: allocations[week].get(target, 0) \
+                            for target in ALLOCATION_TARGETS}
+            year = week // 52
+            while next_event < len(planned) and planned[next_event][0] < (year + 1) * 52:
+                event_week, _, variant, amount = planned[next_event]
+                if event_week // 52 > caps.year():
+                    balance = self.start_caps_year(caps, event_week // 52, balance, \
+                                                    last_super, growth_index)
+                caps.contribute(event_week, amount, variant)
+                balance += amount
+                next_event += 1
+            if year > caps.year():
+                balance = self.start_caps_year(caps, year, balance, last_super, growth_index)
+            # Whole dollars, so rounding never takes a contribution over the cap
+            allocation["SUPER"] = int(max(0, min(allocation["SUPER"], caps.remaining_cc(week))))
+            allocation["HOME_LOAN"] = int(allocation["HOME_LOAN"])
+            if allocation["SUPER"] > 0:
+                caps.contribute(week, allocation["SUPER"], "CC")
+                balance += allocation["SUPER"]
+                super_file_gen.buy(super_file_gen.buy_cc_list.get(week, 0) \
+                                    + allocation["SUPER"], "CC", week)
+            if allocation["HOME_LOAN"] > 0:
+                home_loan_file_gen.pay(home_loan_file_gen.pay_list.get(week, 0) \
+                                        + allocation["HOME_LOAN"], week)
+            if allocation["SHARES"] > 0:
+                shares_file_gen.buy(allocation["SHARES"], week)
+            self.allocated[week] = allocation
+
+    def start_caps_year(self, caps, year, estimate, last_super, growth_index):
+        # Starts the caps' year with the super balance at the end of the year before: the
+        # last run's, if there is one, or else the estimate, which is grown to the start of
+        # the year with its earnings taxed at 15%, as Super does. Returns the estimate.
+        for closed_year in range(caps.year(), year):
+            growth = growth_index[52 * (closed_year + 1)] / growth_index[52 * closed_year]
+            estimate += 0.85 * (growth - 1) * estimate
+        week = 52 * year
+        if last_super is None:
+            caps.start_year(year, estimate)
+        else:
+            # Super takes the balance after the week before's growth, before any events
+            caps.start_year(year, last_super[week - 1] * growth_index[week] \
+                                    / growth_index[week - 1])
+        return estimate
+
+    def load_scenario(self, num_weeks, scenario_file=None):
+        # Compiles a scenario file into input file generators, by target, see scenario.py.
+        # The scenario can use the params, and the numeric knobs in self.scenario are used
+        # instead of its own LET of the same name.
+        if scenario_file is None:
+            scenario_file = self.scenario.get("SCENARIO_FILE", DEFAULT_SCENARIO_FILE)
+        sim_params = (self.cash_params, self.shares_params, self.super_params, \
+                        self.home_params, self.home_loan_params, self.car_loan_params, \
+                        self.hecs_params)
+        variables = {}
+        for group, params in zip(PARAM_GROUPS, sim_params):
+            for name, value in params.items():
+                if isinstance(value, (int, float)):
+                    variables[f"{group}_{name}"] = value
+        knobs = {name: value for name, value in self.scenario.items() \
+                    if isinstance(value, (int, float))}
+        compiled = compile_scenario(scenario_file, num_weeks, variables, knobs, \
+                                    self.inflation_rate)
+        return input_file_gens(compiled, num_weeks)
 
     def generate_input_files(self, num_weeks):
-        self.comprehensive_experiment(num_weeks)
-        #self.car_loan_experiment1(num_weeks)
-        #self.car_loan_experiment2(num_weeks)
-        #self.car_loan_experiment3(num_weeks)
-        #self.car_loan_experiment4(num_weeks)
-
-        # Income
-        #in_file_gen = income.InputFileGenerator(num_weeks)
-        #weekly_income = int(75000 / 52)
-        #for week in range(num_weeks):
-            ##in_file_gen.add(week, weekly_income)
-            #in_file_gen.add(week, self.inflation_adjuster.apply_inflation(weekly_income, week))
-        #misc_file_gen.add(0, self.cash_params["STARTING_BALANCE"])
-        #in_file_gen.write()
-
-        ##amount = 1
-        ##week = 0
-        ##misc_file_gen.add(week, amount)
-
-        # Shares
-        #in_file_gen = shares.InputFileGenerator(num_weeks)
-        ##amount = 1
-        ##week = 0
-        ##in_file_gen.buy(amount, week)
-        #total_amount = 0
-        #for week in range(5 * 52):
-            #amount = self.inflation_adjuster.apply_inflation(weekly_income, week)
-            #in_file_gen.buy(amount, week)
-            #total_amount += amount
-        #in_file_gen.sell(total_amount, 5 * 52)
-        ##total_amount = 0
-        ##for week in range(15, 2 * 52):
-            ##in_file_gen.buy(1000, week)
-            ##total_amount += 1000
-        ##in_file_gen.sell(135000 + total_amount, 2 * 52)
-        #in_file_gen.write()
-
-        # Super
-        #in_file_gen = superannuation.InputFileGenerator(num_weeks)
-        ##super_amount = 0.11 * weekly_income
-        ##variant = "CC"
-        ##week = 0
-        ##for week in range(num_weeks):
-            ##in_file_gen.buy(super_amount, variant, week)
-            ##misc_file_gen.add(week, -0.15 * super_amount)
-        ##for week in range(15):
-            ##in_file_gen.buy(1000, "CC", week)
-        ##in_file_gen.sell(15000 + 2700, 2 * 52)
-        #in_file_gen.buy(1, "CC", 0)
-        #in_file_gen.write()
-
-        # Home
-        #in_file_gen = home.InputFileGenerator(num_weeks)
-        ##amount = 500000
-        ##week = 2 * 52
-        #amount = 1
-        #week = 0
-        #in_file_gen.buy(amount, week)
-        ##in_file_gen.sell(3 * 52)
-        #in_file_gen.write()
-
-        # Home loan
-        #in_file_gen = home_loan.InputFileGenerator(num_weeks)
-        ##amount = 300000
-        ##start_week = 2 * 52
-        ##duration_years = 30
-        #amount = 1
-        #start_week = 0
-        #duration_years = 1
-        #in_file_gen.buy(amount, start_week, duration_years)
-        #in_file_gen.write()
-
-        # Car loan
-        #in_file_gen = car_loan.InputFileGenerator(num_weeks)
-        #balloon_payment = 0
-        #start_week = 17
-        #duration_years = 5
-        #amount = 25000
-        ##amount = self.inflation_adjuster.apply_inflation(amount, start_week)
-        ##amount = 1
-        ##balloon_payment = 0
-        ##start_week = 0
-        ##duration_years = 1
-        #in_file_gen.buy(amount, balloon_payment, start_week, duration_years)
-        #in_file_gen.write()
-
-        # HECS
-        #in_file_gen = hecs.InputFileGenerator(num_weeks)
-        ##amount = 25000
-        ##start_week = 0
-        #amount = 1
-        #start_week = 0
-        #in_file_gen.buy(amount, start_week)
-        ##in_file_gen.pay(10000, 52)
-        #in_file_gen.write()
-
-        #misc_file_gen.write()
+        in_file_gens = self.load_scenario(num_weeks)
+        self.allocate(num_weeks, in_file_gens)
+        self.load_inputs(*in_file_gens.values())
 
         # HECS brackets
         self.generate_hecs_brackets(num_weeks)
@@ -352,356 +883,158 @@ class Simulator:
         # Tax brackets
         self.generate_tax_brackets(num_weeks)
 
-    def parse_receipts(self):
-        income_file = open("input_files/income.txt", "r")
-        line = income_file.readline().split()
-        while len(line) > 0:
-            week = int(line[0])
-            if len(line) == 2:
-                amount = float(line[1])
-            else:
-                amount = 0
-            if week < len(self.out_cash):
-                self.out_cash[week] += amount
-            else:
-                self.out_cash.append(amount)
-            line = income_file.readline().split()
-        income_file.close()
-
-        misc_file = open("input_files/misc.txt", "r")
-        line = misc_file.readline().split()
-        while len(line) > 0:
-            week = int(line[0])
-            if len(line) == 2:
-                amount = float(line[1])
-            else:
-                amount = 0
-            if week < len(self.out_cash):
-                self.out_cash[week] += amount
-            else:
-                self.out_cash.append(amount)
-            line = misc_file.readline().split()
-        misc_file.close()
+    def parse_receipts(self, num_weeks):
+        cash = CashLedger(num_weeks, self.cash_params["STARTING_BALANCE"])
+        # Weeks without receipts are not listed
+        for in_file in ["input_files/income.txt", "input_files/misc.txt"]:
+            for line in read_schedule(self.source(in_file)):
+                if len(line) == 2:
+                    cash.add(int(line[0]), float(line[1]))
 
         for out_cash_file in self.output_cash_files:
-            f = open(f"output_files/cash/{out_cash_file}", "r")
-            line = f.readline().split()
-            while len(line) > 0:
-                week = int(line[0])
-                if len(line) == 2:
-                    amount = float(line[1])
-                else:
-                    amount = 0
-                if week < len(self.out_cash):
-                    self.out_cash[week] += amount
-                else:
-                    self.out_cash.append(amount)
-                line = f.readline().split()
-            f.close()
+            cash.add_series(read_series(f"output_files/cash/{out_cash_file}", self.sources))
 
         for output_tax_file in self.output_tax_files:
-            tax_file = open(f"output_files/tax/{output_tax_file}", "r")
-            line = tax_file.readline().split()
-            while len(line) > 0:
-                year = int(line[0])
-                week = (year + 1) * 52 - 1
-                try:
-                    amount = float(line[1])
-                except:
-                    amount = 0
-                self.out_cash[week] -= amount
-                line = tax_file.readline().split()
-            tax_file.close()
-
-        for week in range(len(self.out_cash)):
-            if week != 0:
-                self.out_cash[week] += self.out_cash[week - 1]
-
-        f = open(self.final_output_file, "w")
-        for week, amount in enumerate(self.out_cash):
-            f.write(f"{week} {amount}\n")
-        f.close()
+            invoice = read_series(f"output_files/tax/{output_tax_file}", self.sources)
+            for year, amount in enumerate(invoice):
+                cash.add((year + 1) * 52 - 1, -amount)
 
-        self.assert_positive_balance()
+        self.out_cash = cash.balance()
+        if self.export:
+            write_series(self.final_output_file, self.out_cash)
 
     def assert_positive_balance(self):
-        for amount in self.out_cash:
-            #print(amount)
-            assert amount >= 0
+        week = first_negative_week(self.out_cash)
+        if week is not None:
+            raise NegativeBalanceError(week, self.out_cash[week])
     
-    def car_loan_experiment1(self, num_weeks):
-        misc_file_gen = misc.InputFileGenerator(num_weeks)
-        misc_file_gen.add(0, -60) # Because HECS
-        tax = [15312, 15925, 16562, 17224, 17913]
-        tax = [yearly_tax / 52 for yearly_tax in tax]
-
-        # Experiment 1 - Buying car without loan
-        # Parameters
-        loan_duration_years = 5
-        weekly_expenses = 0
-
-        # Income
-        in_file_gen = income.InputFileGenerator(num_weeks)
-        weekly_income = int(75000 / 52)
-        misc_file_gen.add(0, self.cash_params["STARTING_BALANCE"])
-        for week in range(num_weeks):
-            in_file_gen.add(week, self.apply_inflation(weekly_income, week))
-            misc_file_gen.add(week, self.apply_inflation(weekly_expenses, week))
-        in_file_gen.write()
-
-        # Shares
-        in_file_gen = shares.InputFileGenerator(num_weeks)
-        total_amount = 0
-        for week in range(loan_duration_years * 52):
-            amount = self.apply_inflation(weekly_income - weekly_expenses, week) - tax[week // 52]
-            in_file_gen.buy(amount, week)
-            total_amount += amount
-        in_file_gen.sell(total_amount, loan_duration_years * 52 - 1)
-        in_file_gen.write()
-
-        # Car loan
-        in_file_gen = car_loan.InputFileGenerator(num_weeks)
-        balloon_payment = 0
-        start_week = 0
-        amount = 1
-        in_file_gen.buy(amount, balloon_payment, start_week, loan_duration_years)
-        in_file_gen.write()
-        misc_file_gen.write()
-
-        reset_inputs = ["SUPER",
-                        "HOME",
-                        "HOME_LOAN",
-                        "HECS"]
-        reset_input_files(num_weeks, reset_inputs)
-
-    def car_loan_experiment2(self, num_weeks):
-        misc_file_gen = misc.InputFileGenerator(num_weeks)
-        misc_file_gen.add(0, -60) # Because HECS
-        tax = [15312, 15925, 16562, 17224, 17913]
-        tax = [yearly_tax / 52 for yearly_tax in tax]
-
-        # Experiment 2 - Buying car with loan
-        # Parameters
-        loan_duration_years = 5
-        balloon_payment = 0
-        weekly_loan_repayment = 123 # Need to set this manually
-        weekly_expenses = 0
-
-        # Income
-        in_file_gen = income.InputFileGenerator(num_weeks)
-        weekly_income = int(75000 / 52)
-        for week in range(num_weeks):
-            in_file_gen.add(week, self.apply_inflation(weekly_income, week))
-            misc_file_gen.add(week, self.apply_inflation(weekly_expenses, week))
-        in_file_gen.write()
-
-        # Shares
-        in_file_gen = shares.InputFileGenerator(num_weeks)
-        total_amount = 0
-        amount = self.cash_params["STARTING_BALANCE"]
-        #in_file_gen.buy(amount, 0)
-        #total_amount += amount
-        for week in range(loan_duration_years * 52):
-            amount += self.apply_inflation(weekly_income, week) \
-                    - self.apply_inflation(weekly_expenses, week) \
-                    - weekly_loan_repayment \
-                    - tax[week // 52]
-            in_file_gen.buy(amount, week)
-            total_amount += amount
-            amount = 0
-        in_file_gen.sell(total_amount, loan_duration_years * 52 - 1)
-        in_file_gen.write()
-
-        # Car loan
-        in_file_gen = car_loan.InputFileGenerator(num_weeks)
-        start_week = 0
-        amount = self.cash_params["STARTING_BALANCE"]
-        in_file_gen.buy(amount, balloon_payment, start_week, loan_duration_years)
-        in_file_gen.write()
-
-        misc_file_gen.write()
-
-        reset_inputs = ["SUPER",
-                        "HOME",
-                        "HOME_LOAN",
-                        "HECS"]
-        reset_input_files(num_weeks, reset_inputs)
-
-    def car_loan_experiment3(self, num_weeks):
-        misc_file_gen = misc.InputFileGenerator(num_weeks)
-        misc_file_gen.add(0, -60) # Because HECS
-        tax = [15444, 15925, 16562, 17224, 17913, 18629]
-        tax = [yearly_tax / 52 for yearly_tax in tax]
-
-        # Experiment 3 - Saving up to buy car without loan
-        # Parameters
-        car_cost = 25000
-        num_shares_for_car = 24926
-        loan_duration_years = 5
-        weekly_expenses = 0
-
-        # Income
-        in_file_gen = income.InputFileGenerator(num_weeks)
-        weekly_income = int(75000 / 52)
-        for week in range(num_weeks):
-            in_file_gen.add(week, self.apply_inflation(weekly_income, week))
-            misc_file_gen.add(week, self.apply_inflation(weekly_expenses, week))
-        in_file_gen.write()
-
-        # Shares
-        in_file_gen = shares.InputFileGenerator(num_weeks)
-        bought_car = False
-        total_amount = 0
-        for week in range(num_weeks):
-            amount = self.apply_inflation(weekly_income - weekly_expenses, week) - tax[week // 52]
-            in_file_gen.buy(amount, week)
-            total_amount += amount
-            if total_amount >= num_shares_for_car and not bought_car:
-                print(self.apply_inflation(car_cost, week))
-                in_file_gen.sell(num_shares_for_car, week)
-                misc_file_gen.add(week, self.apply_inflation(car_cost, week))
-                bought_car = True
-        total_amount -= num_shares_for_car
-        in_file_gen.sell(total_amount, num_weeks - 1)
-        in_file_gen.write()
-
-        # Car loan
-        in_file_gen = car_loan.InputFileGenerator(num_weeks)
-        balloon_payment = 0
-        start_week = 0
-        amount = 1
-        in_file_gen.buy(amount, balloon_payment, start_week, loan_duration_years)
-        in_file_gen.write()
-
-        misc_file_gen.write()
-
-        reset_inputs = ["SUPER",
-                        "HOME",
-                        "HOME_LOAN",
-                        "HECS"]
-        reset_input_files(num_weeks, reset_inputs)
-
-    def car_loan_experiment4(self, num_weeks):
-        misc_file_gen = misc.InputFileGenerator(num_weeks)
-        misc_file_gen.add(0, -60) # Because HECS
-        tax = [15444, 15925, 16562, 17224, 17913, 18629]
-        tax = [yearly_tax / 52 for yearly_tax in tax]
-
-        # Experiment 4 - Buying car with loan then saving afterwards
-        # Parameters
-        car_cost = 25000
-        loan_duration_years = 5
-        balloon_payment = 0
-        weekly_loan_repayment = 115 # Need to set this manually
-        weekly_expenses = 0
-
-        # Income
-        in_file_gen = income.InputFileGenerator(num_weeks)
-        weekly_income = int(75000 / 52)
-        for week in range(num_weeks):
-            in_file_gen.add(week, self.apply_inflation(weekly_income, week))
-            misc_file_gen.add(week, self.apply_inflation(weekly_expenses, week))
-        in_file_gen.write()
-
-        # Shares
-        in_file_gen = shares.InputFileGenerator(num_weeks)
-        total_amount = 0
-        amount = self.cash_params["STARTING_BALANCE"]
-        for week in range(loan_duration_years * 52):
-            amount += self.apply_inflation(weekly_income, week) \
-                    - self.apply_inflation(weekly_expenses, week) \
-                    - weekly_loan_repayment \
-                    - tax[week // 52]
-            in_file_gen.buy(amount, week)
-            total_amount += amount
-            amount = 0
-        for week in range(loan_duration_years * 52, num_weeks):
-            amount = self.apply_inflation(weekly_income - weekly_expenses, week) - tax[week // 52]
-            in_file_gen.buy(amount, week)
-            total_amount += amount
-        in_file_gen.sell(total_amount, num_weeks - 1)
-        in_file_gen.write()
-
-        # Car loan
-        in_file_gen = car_loan.InputFileGenerator(num_weeks)
-        start_week = 0
-        amount = car_cost
-        in_file_gen.buy(amount, balloon_payment, start_week, loan_duration_years)
-        in_file_gen.write()
-
-        misc_file_gen.write()
-
-        reset_inputs = ["SUPER",
-                        "HOME",
-                        "HOME_LOAN",
-                        "HECS"]
-        reset_input_files(num_weeks, reset_inputs)
+    def real_factors(self, num_weeks):
+        # What each week's amounts are multiplied by to be in today's dollars: deflated by
+        # inflation, or discounted at the annual rate in self.scenario["DISCOUNT_RATE"]
+        if "DISCOUNT_RATE" in self.scenario:
+            return discount_factors(self.scenario["DISCOUNT_RATE"], num_weeks)
+        return self.inflation_index.deflators(num_weeks)
+
+    def real_results(self, num_weeks):
+        # Every output series of the run in today's dollars, see real_factors()
+        return present_values(self.results, self.real_factors(num_weeks))
+
+    def load_results(self, out_dir="output_files"):
+        # Loads an exported run's output series lazily, e.g. to report on a run archived
+        # elsewhere with print_final_report() without simulating it again
+        self.results = Results(out_dir)
+        return self.results
 
     def print_final_report(self, num_weeks):
-        out_cash_file = open("output_files/cash.txt", "r")
-
-        out_shares_file = open("output_files/shares.txt", "r")
-        out_super_file = open("output_files/super.txt", "r")
-        out_home_file = open("output_files/home.txt", "r")
-        out_home_loan_file = open("output_files/home_loan.txt", "r")
-        out_car_loan_file = open("output_files/car_loan.txt", "r")
-        out_hecs_file = open("output_files/hecs.txt", "r")
-
+        # Each final amount is followed by its value in today's dollars
+        real_factor = self.real_factors(num_weeks)[-1] if num_weeks > 0 else 1
         print("---------------")
         print("Debts")
         print("---------------")
-        for line in out_home_loan_file:
-            pass
-        week, amount = line.split()
-        if int(week) == num_weeks - 1:
-            formatted_amount = "${:,.2f}".format(float(amount))
-            print(f"Home Loan = {formatted_amount}")
-        for line in out_car_loan_file:
-            pass
-        week, amount = line.split()
-        if int(week) == num_weeks - 1:
-            formatted_amount = "${:,.2f}".format(float(amount))
-            print(f"Car Loan = {formatted_amount}")
-        for line in out_hecs_file:
-            pass
-        week, amount = line.split()
-        if int(week) == num_weeks - 1:
-            formatted_amount = "${:,.2f}".format(float(amount))
-            print(f"HECS = {formatted_amount}")
+        self.print_final_amount("Home Loan", self.results["home_loan"], num_weeks, real_factor)
+        self.print_final_amount("Car Loan", self.results["car_loan"], num_weeks, real_factor)
+        self.print_final_amount("HECS", self.results["hecs"], num_weeks, real_factor)
 
         print()
         print("---------------")
         print("Assets")
         print("---------------")
-        for line in out_shares_file:
-            pass
-        week, amount = line.split()
-        if int(week) == num_weeks - 1:
-            formatted_amount = "${:,.2f}".format(float(amount))
-            print(f"Shares = {formatted_amount}")
-        for line in out_home_file:
-            pass
-        week, amount = line.split()
-        if int(week) == num_weeks - 1:
-            formatted_amount = "${:,.2f}".format(float(amount))
-            print(f"Home = {formatted_amount}")
+        self.print_final_amount("Shares", self.results["shares"], num_weeks, real_factor)
+        self.print_final_amount("Home", self.results["home"], num_weeks, real_factor)
 
         print()
         print("---------------")
         print("Cash")
         print("---------------")
-        for line in out_super_file:
-            pass
-        week, amount = line.split()
-        if int(week) == num_weeks - 1:
-            formatted_amount = "${:,.2f}".format(float(amount))
-            print(f"Super = {formatted_amount}")
-        for line in out_cash_file:
-            pass
-        week, amount = line.split()
-        if int(week) == num_weeks - 1:
-            formatted_amount = "${:,.2f}".format(float(amount))
-            print(f"Cash = {formatted_amount}")
+        self.print_final_amount("Super", self.results["super"], num_weeks, real_factor)
+        self.print_final_amount("Cash", self.results["cash"], num_weeks, real_factor)
+
+        # Contributions over the super caps are made anyway, and listed by year
+        if "super_excess" in self.results and max(self.results["super_excess"], default=0) > 0:
+            excess = self.results["super_excess"]
+            print()
+            print("---------------")
+            print("Super Caps")
+            print("---------------")
+            for year_start in range(0, len(excess), 52):
+                amount = sum(excess[year_start:year_start + 52])
+                if amount > 0:
+                    formatted_amount = "${:,.2f}".format(amount)
+                    print(f"Year {year_start // 52} = {formatted_amount} over the caps")
+
+    def print_final_amount(self, name, series, num_weeks, real_factor=1):
+        if len(series) == num_weeks:
+            formatted_amount = "${:,.2f}".format(float(series[-1]))
+            formatted_real_amount = "${:,.2f}".format(float(series[-1]) * real_factor)
+            print(f"{name} = {formatted_amount} ({formatted_real_amount} real)")
+
+    def print_profile_report(self):
+        print("---------------")
+        print(f"Profile ({self.profile['seconds']:.3f}s)")
+        print("---------------")
+        for record in self.profile["stages"]:
+            line = f"{record['stage']} = {record['seconds']:.4f}s, " \
+                    + f"{record['allocated_blocks']:,} blocks"
+            if "peak_memory" in record:
+                line += f", peak {record['peak_memory'] / 1024:,.1f} KiB"
+            print(line)
+        print()
+        for path, rows in sorted(self.profile["rows"].items()):
+            print(f"{path} = {rows['read']:,} read, {rows['written']:,} written")
+        if self.profile["profile_stats"] is not None:
+            print()
+            print(self.profile["profile_stats"])
+        if self.profile["top_allocations"] is not None:
+            print()
+            for allocation in self.profile["top_allocations"]:
+                print(f"{allocation['location']} = {allocation['size'] / 1024:,.1f} KiB " \
+                        + f"in {allocation['count']:,} blocks")
+
+    def print_monte_carlo_report(self, bands):
+        print("---------------")
+        print(f"Monte Carlo ({bands['num_paths']} paths, final week)")
+        print("---------------")
+        for name, label in [("net_worth", "Net Worth"), ("real_net_worth", "Real Net Worth"), \
+                            ("cash", "Cash"), ("debt", "Debts")]:
+            formatted_amounts = [f"{percent}% ${bands[name][percent][-1]:,.2f}" \
+                                    for percent in bands[name]]
+            print(f"{label} = " + ", ".join(formatted_amounts))
+        print(f"P(Cash < 0) = {100 * bands['probability_negative_balance']:.1f}%")
+
+    def print_stress_test_report(self, bands):
+        print("---------------")
+        print(f"Stress Test ({bands['num_paths']} paths, final week)")
+        print("---------------")
+        for name, label in [("home_loan", "Home Loan"), ("car_loan", "Car Loan"), \
+                            ("hecs", "HECS")]:
+            formatted_amounts = [f"{percent}% ${bands[name][percent][-1]:,.2f}" \
+                                    for percent in bands[name]]
+            print(f"{label} = " + ", ".join(formatted_amounts))
+            formatted_amounts = [f"{percent}% ${amount:,.2f}" \
+                                    for percent, amount in bands["repaid"][name].items()]
+            print(f"{label} Repaid = " + ", ".join(formatted_amounts))
+
+    def print_sweep_report(self, grid, rows):
+        print("---------------")
+        print(f"Sweep ({len(rows)} points, final week)")
+        print("---------------")
+        for row in rows:
+            knobs = ", ".join([f"{name}={row['point'][name]}" for name in grid])
+            formatted_amount = "${:,.2f}".format(row["net_worth"])
+            formatted_real_amount = "${:,.2f}".format(row["real_net_worth"])
+            flag = " (Cash < 0)" if row["negative_balance"] else ""
+            print(f"{formatted_amount} ({formatted_real_amount} real){flag}: {knobs}")
+
+    def print_optimize_report(self, best):
+        print("---------------")
+        print("Allocation Plan")
+        print("---------------")
+        for week, allocation in sorted(best["allocations"].items()):
+            formatted_amounts = [f"{target} ${allocation[target]:,.2f}" \
+                                    for target in ALLOCATION_TARGETS if allocation[target] > 0]
+            print(f"Week {week}: " + ", ".join(formatted_amounts))
+        formatted_amount = "${:,.2f}".format(best["net_worth"])
+        print(f"Net Worth = {formatted_amount}")
 
 
 if __name__ == "__main__":
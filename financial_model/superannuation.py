@@ -121,213 +121,327 @@
 
 # I think I have fixed everything in this file and tax_collector now, but worth carefully scrutinising my changes.
 
-import math
+from caps import CC_VARIANTS, CC_YEARLY_CAP, FHSS_DEEMED_RATE, NCC_VARIANTS, ContributionCaps
+from rates import GrowthIndex
+from checkpoints import drop_checkpoints_after
+from ledger import EventLedger
+from schedule import event_weeks, read_schedule_from, write_schedule, write_series, write_columns
 
 class Super:
-    def __init__(self, in_file, params):
+    def __init__(self, in_file, params, cap_index=None):
+        # cap_index indexes the contribution caps, e.g. to inflation, see caps.py
         self.in_file = in_file
-        self.shares = []
+        # Parcels are held oldest first in parallel lists, with sold parcels before
+        # self.first_parcel. Every parcel grows at the same rate between the yearly taxes
+        # on earnings, so a parcel is worth units * scale * growth_index[week], where scale
+        # carries the earnings tax for every parcel held since the last tax. Parcels bought
+        # since then, from self.first_untaxed_parcel onward, are brought onto the new
+        # scale individually when earnings are next taxed.
+        self.buy_time = []
+        self.units = []
+        self.first_parcel = 0
+        self.first_untaxed_parcel = 0
+        self.total_units = 0
+        self.scale = 1
+        self.last_tax_time = 0
         annual_ror = params["ANNUAL_ROR"]
         starting_balance = params["STARTING_BALANCE"]
+        self.growth_index = GrowthIndex(annual_ror)
         self.buy(starting_balance, 0)
-        self.weekly_ror = 100 * (math.exp(math.log(1 + annual_ror / 100) / 52) - 1)
+        # Contributions over the caps are still made, and kept as excess
+        self.caps = ContributionCaps(params.get("CC_YEARLY_CAP", CC_YEARLY_CAP), cap_index)
+        # The most the FHSS can release: the contributions counted towards it, plus
+        # earnings deemed at the FHSS rate from the week after each one. It can only be
+        # released once.
+        self.fhss_index = GrowthIndex(params.get("FHSS_DEEMED_RATE", FHSS_DEEMED_RATE))
+        self.fhss_amount = 0
+        self.fhss_released = False
         self.out_file_gen = OutputFileGenerator()
         self.out_cash_file_gen = OutputCashFileGenerator()
+        self.out_excess_file_gen = OutputExcessFileGenerator()
         self.tax_receipt_gen = TaxReceiptGenerator()
-
-    def simulate(self, num_weeks):
-        f = open(self.in_file, "r")
-        input_line = f.readline().split()
-        time = int(input_line[0])
-        for week in range(num_weeks):
+        # Set to a dict to keep a checkpoint at the start of every year, see checkpoints.py
+        self.checkpoints = None
+
+    def simulate(self, num_weeks, export=True, start=0):
+        # start can be a week with a checkpoint, to carry on from there
+        if start > 0:
+            self.restore(start)
+        input_lines = read_schedule_from(self.in_file, start)
+        input_line = next(input_lines, [])
+        time = int(input_line[0]) if len(input_line) > 0 else -1
+        for week in range(start, num_weeks):
+            if self.checkpoints is not None and week % 52 == 0:
+                self.checkpoints[week] = self.checkpoint()
+            if week % 52 == 0:
+                # Carry-forward depends on the balance at the end of the previous year
+                self.caps.start_year(week // 52, \
+                                        self.total_units * self.scale * self.growth_index[week])
+            if self.fhss_amount > 0:
+                self.fhss_amount *= 1 + self.fhss_index.rate(week) / 100
             while time == week:
-                if len(input_line) == 1:
-                    command = "NONE"
-                elif len(input_line) == 3:
+                command = "NONE"
+                if len(input_line) == 3:
                     time, command, amount = input_line
                 elif len(input_line) == 4:
                     time, command, variant, amount = input_line
-                time, amount = int(time), float(amount)
+                time = int(time)
                 if command == "BUY":
-                    if variant == "CC":
-                        self.buy(amount, time)
-                        self.out_cash_file_gen.add_bought_shares(amount, time)
-                    elif variant == "NCC":
+                    amount = float(amount)
+                    if variant in CC_VARIANTS or variant in NCC_VARIANTS:
                         self.buy(amount, time)
                         self.out_cash_file_gen.add_bought_shares(amount, time)
+                        fhss_total = self.caps.fhss_total
+                        excess = self.caps.contribute(time, amount, variant)
+                        self.out_excess_file_gen.add_excess(excess, time)
+                        if not self.fhss_released:
+                            self.fhss_amount += self.caps.fhss_total - fhss_total
                 elif command == "SELL":
-                    sold_shares = self.sell(amount, time)
+                    if amount == "FHSS":
+                        # As much as the FHSS allows, which ends it
+                        amount = self.fhss_amount
+                        self.fhss_amount = 0
+                        self.fhss_released = True
+                    sold_shares = self.sell(float(amount), time)
                     self.out_cash_file_gen.add_sold_shares(sold_shares)
                     self.tax_receipt_gen.add_sold_shares(sold_shares)
-                input_line = f.readline().split()
+                input_line = next(input_lines, [])
                 if len(input_line) == 0:
                     break
                 time = int(input_line[0])
-            self.out_file_gen.write_output(self.shares)
-            for share in self.shares:
-                share["untaxed_earnings"] *= 1 + self.weekly_ror / 100
-                share["untaxed_earnings"] += share["taxed_amount"] * self.weekly_ror / 100
+            self.out_file_gen.write_output(self.total_units * self.scale * self.growth_index[week])
             if week % 52 == 0:
-                self.tax(15)
-        f.close()
-        self.out_file_gen.generate_output_file()
-        self.out_cash_file_gen.generate_output_file(num_weeks)
-        self.tax_receipt_gen.generate_tax_receipt(num_weeks)
+                # Earnings are taxed at the end of the week, after that week's growth
+                self.tax(15, week + 1)
+        self.out_file_gen.generate_output_file(export)
+        self.out_cash_file_gen.generate_output_file(num_weeks, export)
+        self.out_excess_file_gen.generate_output_file(num_weeks, export)
+        self.tax_receipt_gen.generate_tax_receipt(num_weeks, export)
+
+    def checkpoint(self):
+        # Sold parcels and buy times never change, so only the rest of the parcels are kept
+        return {
+            "num_parcels": len(self.units),
+            "first_parcel": self.first_parcel,
+            "first_untaxed_parcel": self.first_untaxed_parcel,
+            "units": self.units[self.first_parcel:],
+            "total_units": self.total_units,
+            "scale": self.scale,
+            "last_tax_time": self.last_tax_time,
+            "caps": self.caps.checkpoint(),
+            "fhss_amount": self.fhss_amount,
+            "fhss_released": self.fhss_released
+        }
+
+    def restore(self, week):
+        state = self.checkpoints[week]
+        self.first_parcel = state["first_parcel"]
+        self.first_untaxed_parcel = state["first_untaxed_parcel"]
+        del self.buy_time[state["num_parcels"]:]
+        self.units[self.first_parcel:] = state["units"]
+        self.total_units = state["total_units"]
+        self.scale = state["scale"]
+        self.last_tax_time = state["last_tax_time"]
+        self.caps.restore(state["caps"])
+        self.fhss_amount = state["fhss_amount"]
+        self.fhss_released = state["fhss_released"]
+        del self.out_file_gen.total_amount[week:]
+        self.out_cash_file_gen.truncate(week)
+        self.out_excess_file_gen.truncate(week)
+        self.tax_receipt_gen.truncate(week)
+        drop_checkpoints_after(self.checkpoints, week)
 
     def buy(self, amount, time):
-        self.shares.append({
-            "buy_time": time,
-            "taxed_amount": amount,
-            "untaxed_earnings": 0
-            })
+        units = amount / (self.scale * self.growth_index[time])
+        self.buy_time.append(time)
+        self.units.append(units)
+        self.total_units += units
+
+    def taxed_amount(self, i):
+        # Earnings are untaxed since the last tax, or since the parcel was bought
+        return self.units[i] * self.scale \
+                * self.growth_index[max(self.last_tax_time, self.buy_time[i])]
 
     def sell(self, amount, time):
-        # The only way you can sell is FHSS
+        # The only way you can sell is FHSS. Selling more than the balance sells it all.
         amount_remaining = amount
         sold_shares = []
-        while amount_remaining > 0:
-            taxed_amount = self.shares[0]["taxed_amount"]
-            untaxed_earnings = self.shares[0]["untaxed_earnings"]
-            sell_amount = min(amount_remaining, taxed_amount + untaxed_earnings)
-            sell_amount_taxed = sell_amount / (taxed_amount + untaxed_earnings) \
-                    * taxed_amount
-            sell_amount_untaxed = sell_amount / (taxed_amount + untaxed_earnings) \
-                    * untaxed_earnings
+        growth_factor = self.scale * self.growth_index[time]
+        while amount_remaining > 0 and self.first_parcel < len(self.units):
+            i = self.first_parcel
+            parcel_amount = self.units[i] * growth_factor
+            taxed_amount = self.taxed_amount(i)
+            untaxed_earnings = parcel_amount - taxed_amount
+            sell_amount = min(amount_remaining, parcel_amount)
+            sell_amount_taxed = sell_amount / parcel_amount * taxed_amount
+            sell_amount_untaxed = sell_amount / parcel_amount * untaxed_earnings
             sold_shares.append({
                 "sell_time": time,
                 "taxed_amount": sell_amount_taxed,
                 "untaxed_earnings": sell_amount_untaxed
             })
-            self.shares[0]["taxed_amount"] -= sell_amount_taxed
-            self.shares[0]["untaxed_earnings"] -= sell_amount_untaxed
-            if self.shares[0]["taxed_amount"] == 0 and self.shares[0]["untaxed_earnings"] == 0:
-                self.shares.pop(0)
+            sold_units = sell_amount / parcel_amount * self.units[i]
+            self.units[i] -= sold_units
+            self.total_units -= sold_units
+            if self.units[i] == 0:
+                self.first_parcel += 1
             amount_remaining -= sell_amount
         return sold_shares
 
-    def tax(self, tax_rate):
-        for share in self.shares:
-            share["taxed_amount"] += (100 - tax_rate) / 100 * share["untaxed_earnings"]
-            share["untaxed_earnings"] = 0
+    def tax(self, tax_rate, time):
+        # Taxing earnings leaves a parcel worth taxed_amount + (1 - tax_rate) * earnings,
+        # which for every parcel held since the last tax is the same multiple of its value.
+        after_tax = (100 - tax_rate) / 100
+        growth_factor = self.growth_index[time]
+        held_factor = after_tax + (1 - after_tax) \
+                * self.growth_index[self.last_tax_time] / growth_factor
+        for i in range(max(self.first_parcel, self.first_untaxed_parcel), len(self.units)):
+            factor = after_tax + (1 - after_tax) \
+                    * self.growth_index[self.buy_time[i]] / growth_factor
+            units = self.units[i] * factor / held_factor
+            self.total_units += units - self.units[i]
+            self.units[i] = units
+        self.scale *= held_factor
+        self.last_tax_time = time
+        self.first_untaxed_parcel = len(self.units)
 
 
 class InputFileGenerator:
     def __init__(self, num_weeks):
-        self.in_file = open("input_files/super.txt", "w")
+        self.in_file = "input_files/super.txt"
         self.num_weeks = num_weeks
         self.buy_cc_list = {}
         self.buy_ncc_list = {}
+        # Voluntary contributions, which count towards the FHSS
+        self.buy_fhss_cc_list = {}
+        self.buy_fhss_ncc_list = {}
         self.sell_list = {}
 
+    def events(self):
+        for week in event_weeks(self.num_weeks, self.buy_cc_list, self.buy_ncc_list, \
+                                self.buy_fhss_cc_list, self.buy_fhss_ncc_list, self.sell_list):
+            if week in self.buy_cc_list:
+                yield (week, "BUY", "CC", self.buy_cc_list[week])
+            if week in self.buy_ncc_list:
+                yield (week, "BUY", "NCC", self.buy_ncc_list[week])
+            if week in self.buy_fhss_cc_list:
+                yield (week, "BUY", "FHSS_CC", self.buy_fhss_cc_list[week])
+            if week in self.buy_fhss_ncc_list:
+                yield (week, "BUY", "FHSS_NCC", self.buy_fhss_ncc_list[week])
+            if week in self.sell_list:
+                yield (week, "SELL", self.sell_list[week])
+
+    def schedule(self):
+        return list(self.events())
+
     def write(self):
-        for week in range(self.num_weeks):
-            try:
-                self.in_file.write(f"{week} BUY CC {self.buy_cc_list[week]}\n")
-            except:
-                pass
-            try:
-                self.in_file.write(f"{week} BUY NCC {self.buy_ncc_list[week]}\n")
-            except:
-                pass
-            try:
-                self.in_file.write(f"{week} SELL {self.sell_list[week]}\n")
-            except:
-                pass
-            if week not in self.buy_cc_list and \
-                    week not in self.buy_ncc_list and \
-                    week not in self.sell_list:
-                self.in_file.write(f"{week}\n")
-        self.in_file.close()
+        write_schedule(self.in_file, self.events(), self.num_weeks)
 
     def buy(self, amount, variant, time):
         if variant == "CC":
             self.buy_cc_list[time] = amount
         elif variant == "NCC":
             self.buy_ncc_list[time] = amount
+        elif variant == "FHSS_CC":
+            self.buy_fhss_cc_list[time] = amount
+        elif variant == "FHSS_NCC":
+            self.buy_fhss_ncc_list[time] = amount
 
     def sell(self, amount, time):
         self.sell_list[time] = amount
 
+    def release_fhss(self, time):
+        # Sells as much as the FHSS allows, see Super.fhss_amount
+        self.sell_list[time] = "FHSS"
+
 
 class OutputFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/super.txt", "w")
+        self.out_file = "output_files/super.txt"
         self.total_amount = []
 
-    def write_output(self, shares):
-        self.total_amount.append(sum([share["taxed_amount"] + share["untaxed_earnings"] for share in shares]))
+    def write_output(self, total_amount):
+        self.total_amount.append(total_amount)
 
-    def generate_output_file(self):
-        for week, amount in enumerate(self.total_amount):
-            self.out_file.write(f"{week} {amount}\n")
-        self.out_file.close()
+    def generate_output_file(self, export=True):
+        if export:
+            write_series(self.out_file, self.total_amount)
 
 
 class OutputCashFileGenerator:
     def __init__(self):
-        self.out_file = open("output_files/cash/super.txt", "w")
-        self.bought_shares = []
-        self.sold_shares = []
+        self.out_file = "output_files/cash/super.txt"
+        self.bought = EventLedger()
+        self.taxed_amount = EventLedger()
+        self.untaxed_earnings = EventLedger()
+        self.cash = []
 
     def add_bought_shares(self, amount, time):
-        self.bought_shares.append({
-            "buy_time": time,
-            "amount": amount
-        })
+        self.bought.add(time, amount)
 
     def add_sold_shares(self, new_sold_shares):
-        self.sold_shares.extend(new_sold_shares)
-
-    def generate_output_file(self, num_weeks):
-        # I will assume sold_shares list is sorted based on sell_time
-        # Similarly for bought_shares list
-        for week in range(num_weeks):
-            buy_amount = 0
-            taxed_amount = 0
-            untaxed_earnings = 0
-            if len(self.bought_shares) != 0:
-                while self.bought_shares[0]["buy_time"] == week:
-                    buy_amount += self.bought_shares[0]["amount"]
-                    self.bought_shares.pop(0)
-                    if len(self.bought_shares) == 0:
-                        break
-            if len(self.sold_shares) != 0:
-                while self.sold_shares[0]["sell_time"] == week:
-                    taxed_amount += self.sold_shares[0]["taxed_amount"]
-                    untaxed_earnings += self.sold_shares[0]["untaxed_earnings"]
-                    self.sold_shares.pop(0)
-                    if len(self.sold_shares) == 0:
-                        break
-            self.out_file.write(f"{week} {taxed_amount + untaxed_earnings - buy_amount}\n")
-        self.out_file.close()
+        for sold_shares in new_sold_shares:
+            self.taxed_amount.add(sold_shares["sell_time"], sold_shares["taxed_amount"])
+            self.untaxed_earnings.add(sold_shares["sell_time"], sold_shares["untaxed_earnings"])
+
+    def truncate(self, week):
+        self.bought.truncate(week)
+        self.taxed_amount.truncate(week)
+        self.untaxed_earnings.truncate(week)
+
+    def generate_output_file(self, num_weeks, export=True):
+        bought = self.bought.amounts(num_weeks)
+        taxed_amount = self.taxed_amount.amounts(num_weeks)
+        untaxed_earnings = self.untaxed_earnings.amounts(num_weeks)
+        self.cash = [taxed_amount[week] + untaxed_earnings[week] - bought[week] \
+                        for week in range(num_weeks)]
+        if export:
+            write_series(self.out_file, self.cash)
+
+
+class OutputExcessFileGenerator:
+    # The contributions made over the caps in each week
+    def __init__(self):
+        self.out_file = "output_files/super_excess.txt"
+        self.excess = EventLedger()
+        self.excess_amount = []
+
+    def add_excess(self, amount, time):
+        if amount > 0:
+            self.excess.add(time, amount)
+
+    def truncate(self, week):
+        self.excess.truncate(week)
+
+    def generate_output_file(self, num_weeks, export=True):
+        self.excess_amount = self.excess.amounts(num_weeks)
+        if export:
+            write_series(self.out_file, self.excess_amount)
 
 
 class TaxReceiptGenerator:
     def __init__(self):
-        self.tax_file = open("output_files/tax/super.txt", "w")
-        self.sold_shares = []
+        self.tax_file = "output_files/tax/super.txt"
+        self.sold_taxed_amount = EventLedger()
+        self.sold_untaxed_earnings = EventLedger()
+        self.taxed_amount = []
+        self.untaxed_earnings = []
 
     def add_sold_shares(self, new_sold_shares):
-        self.sold_shares.extend(new_sold_shares)
-
-    def generate_tax_receipt(self, num_weeks):
-        # I will assume sold_shares list is sorted based on sell_time
-        for week in range(num_weeks):
-            if len(self.sold_shares) == 0:
-                self.tax_file.write(f"{week}\n")
-            elif self.sold_shares[0]["sell_time"] != week:
-                self.tax_file.write(f"{week}\n")
-            else:
-                taxed_amount = 0
-                untaxed_earnings = 0
-                while self.sold_shares[0]["sell_time"] == week:
-                    taxed_amount += self.sold_shares[0]["taxed_amount"]
-                    untaxed_earnings += self.sold_shares[0]["untaxed_earnings"]
-                    self.sold_shares.pop(0)
-                    if len(self.sold_shares) == 0:
-                        break
-                self.tax_file.write(f"{week} {taxed_amount} {untaxed_earnings}\n")
-        self.tax_file.close()
+        for sold_shares in new_sold_shares:
+            self.sold_taxed_amount.add(sold_shares["sell_time"], sold_shares["taxed_amount"])
+            self.sold_untaxed_earnings.add(sold_shares["sell_time"], \
+                                            sold_shares["untaxed_earnings"])
+
+    def truncate(self, week):
+        self.sold_taxed_amount.truncate(week)
+        self.sold_untaxed_earnings.truncate(week)
+
+    def generate_tax_receipt(self, num_weeks, export=True):
+        self.taxed_amount = self.sold_taxed_amount.amounts(num_weeks)
+        self.untaxed_earnings = self.sold_untaxed_earnings.amounts(num_weeks)
+        if export:
+            write_columns(self.tax_file, self.taxed_amount, self.untaxed_earnings)
 
 
 if __name__ == "__main__":
@@ -7,211 +7,157 @@
 # Maybe I could apply pre-tax into super in simulator.py file instead?
 # Maybe it is close enough to being right that it doesn't really matter.
 
+from brackets import read_brackets
+from caps import CC_VARIANTS, NCC_VARIANTS
+from schedule import read_schedule_from, read_series, read_columns, write_series
+
+# Every collector takes a dict of in-memory schedules and series keyed by the file path
+# they would otherwise be read from. Any path missing from it is read from disk.
+# The receipts are added up by year once, in a TaxLedger, which can be shared between
+# collectors so the same sources are not read again for each one. When only later years
+# have changed since an earlier run, the ledger and invoices can be carried on from that
+# run's, from start_year.
+
+# The amounts a TaxLedger adds up by year
+YEARLY_AMOUNTS = ["income", "shares_taxable_income", "super_cc_contribs", "super_ncc_contribs", \
+                    "super_taxed_amount", "super_untaxed_amount", "taxable_income"]
+
+def add_to_year(yearly_amounts, year, amount):
+    while len(yearly_amounts) <= year:
+        yearly_amounts.append(0)
+    yearly_amounts[year] += amount
+
+
+class TaxLedger:
+    def __init__(self, sources={}, previous=None, start_year=0):
+        # With a previous ledger, the years before start_year are kept from it
+        if previous is None:
+            start_year = 0
+        for name in YEARLY_AMOUNTS:
+            setattr(self, name, [] if previous is None else getattr(previous, name)[:start_year])
+        start = start_year * 52
+
+        for input_line in read_schedule_from("input_files/income.txt", start, sources):
+            year = int(input_line[0]) // 52
+            amount = float(input_line[1]) if len(input_line) == 2 else 0
+            add_to_year(self.income, year, amount)
+
+        tax_receipt = read_series("output_files/tax/shares.txt", sources)
+        for week in range(start, len(tax_receipt)):
+            add_to_year(self.shares_taxable_income, week // 52, tax_receipt[week])
+
+        for input_line in read_schedule_from("input_files/super.txt", start, sources):
+            year = int(input_line[0]) // 52
+            add_to_year(self.super_cc_contribs, year, 0)
+            add_to_year(self.super_ncc_contribs, year, 0)
+            if len(input_line) == 4:
+                _, command, variant, amount = input_line
+                if variant in CC_VARIANTS:
+                    self.super_cc_contribs[year] += float(amount)
+                elif variant in NCC_VARIANTS:
+                    self.super_ncc_contribs[year] += float(amount)
+
+        taxed_receipt, untaxed_receipt = read_columns("output_files/tax/super.txt", \
+                                                        sources, num_columns=2)
+        for week in range(start, min(len(taxed_receipt), len(untaxed_receipt))):
+            add_to_year(self.super_taxed_amount, week // 52, taxed_receipt[week])
+            add_to_year(self.super_untaxed_amount, week // 52, untaxed_receipt[week])
+
+        # NCCs are taxed as income, and CCs are taken out of it to be taxed at 15%
+        for yearly_amounts in [self.income, self.shares_taxable_income, \
+                                self.super_ncc_contribs]:
+            for year in range(start_year, len(yearly_amounts)):
+                add_to_year(self.taxable_income, year, yearly_amounts[year])
+        for year in range(start_year, len(self.super_cc_contribs)):
+            add_to_year(self.taxable_income, year, -self.super_cc_contribs[year])
+
+        # Sparse schedules can end in different years, so every amount is given for every
+        # year that has any
+        num_years = max([len(getattr(self, name)) for name in YEARLY_AMOUNTS])
+        for name in YEARLY_AMOUNTS:
+            yearly_amounts = getattr(self, name)
+            yearly_amounts.extend([0] * (num_years - len(yearly_amounts)))
+
+
 class TaxCollector:
     def __init__(self, tax_collectors):
         self.tax_collectors = tax_collectors
 
-    def apply_tax(self):
+    def apply_tax(self, export=True, start_year=0):
         for tax_collector in self.tax_collectors:
             #tax_collector.parse_receipts()
-            tax_collector.apply_tax()
+            tax_collector.apply_tax(export, start_year)
 
 
 class IncomeTaxCollector:
-    def __init__(self):
-        self.tax_collectors = [self, SharesTaxCollector(), SuperTaxCollector()]
-        self.taxable_income = []
-        for tax_collector in self.tax_collectors:
-            for year, taxable_income in enumerate(tax_collector.get_taxable_income()):
-                try:
-                    self.taxable_income[year] += taxable_income
-                except:
-                    self.taxable_income.append(taxable_income)
-        for year, amount in enumerate(SuperTaxCollector().get_cc_contribs()):
-            self.taxable_income[year] -= amount
+    def __init__(self, sources={}, ledger=None):
+        self.sources = sources
+        self.ledger = TaxLedger(sources) if ledger is None else ledger
+        self.tax_file = "output_files/tax/invoice.txt"
+        self.invoice = []
+        self.taxable_income = self.ledger.taxable_income
 
     def get_taxable_income(self):
-        income_file = open("input_files/income.txt", "r")
-        total_taxable_income = []
-        input_line = income_file.readline().split()
-        while len(input_line) > 0:
-            week = int(input_line[0])
-            year = week // 52
-            if year == len(total_taxable_income):
-                total_taxable_income.append(0)
-            if len(input_line) == 2:
-                _, taxable_income = input_line
-                taxable_income = float(taxable_income)
-                total_taxable_income[year] += taxable_income
-            input_line = income_file.readline().split()
-        income_file.close()
-        return total_taxable_income
-
-    def apply_tax(self):
-        brackets_file = open("input_files/tax_brackets.txt", "r")
-        tax_file = open("output_files/tax/invoice.txt", "w")
-        super_cc_contribs = SuperTaxCollector().get_cc_contribs()
-        for year, taxable_income in enumerate(self.taxable_income):
-            tax_brackets = []
-            tax_rates = []
-            while len(tax_brackets) == 0 or len(tax_rates) == 0:
-                input_line = brackets_file.readline().split()
-                if len(input_line) > 0:
-                    time = int(input_line[0])
-                    command = input_line[1]
-                    if year == time:
-                        if command == "RATES":
-                            for i in range(2, len(input_line)):
-                                tax_rates.append(float(input_line[i]))
-                        if command == "BRACKETS":
-                            for i in range(2, len(input_line)):
-                                tax_brackets.append(float(input_line[i]))
-
-            tax = 0
-            idx = 0
-            while taxable_income > tax_brackets[idx]:
-                if idx >= len(tax_brackets) - 1:
-                    break
-                tax += tax_rates[idx] / 100 * (min(taxable_income, tax_brackets[idx + 1]) \
-                        - tax_brackets[idx])
-                idx += 1
-            if taxable_income > tax_brackets[-1]:
-                tax += tax_rates[-1] / 100 * (taxable_income - tax_brackets[-1])
+        return self.ledger.income
+
+    def apply_tax(self, export=True, start_year=0):
+        # Invoices before start_year are kept, e.g. from an earlier run
+        brackets = read_brackets("input_files/tax_brackets.txt", self.sources)
+        super_cc_contribs = self.ledger.super_cc_contribs
+        del self.invoice[start_year:]
+        for year in range(start_year, len(self.taxable_income)):
+            tax = brackets.tax(year, self.taxable_income[year])
             tax += 0.15 * super_cc_contribs[year]
-            tax_file.write(f"{year} {tax}\n")
-        brackets_file.close()
-        tax_file.close()
+            self.invoice.append(tax)
+        if export:
+            write_series(self.tax_file, self.invoice)
 
     def parse_receipts(self, tax_receipts):
         pass
 
 
 class SharesTaxCollector:
-    def __init__(self):
-        pass
+    def __init__(self, sources={}, ledger=None):
+        self.ledger = TaxLedger(sources) if ledger is None else ledger
 
     def get_taxable_income(self):
-        tax_receipt = open("output_files/tax/shares.txt", "r")
-        total_taxable_income = []
-        input_line = tax_receipt.readline().split()
-        while len(input_line) > 0:
-            week = int(input_line[0])
-            year = week // 52
-            if year == len(total_taxable_income):
-                total_taxable_income.append(0)
-            if len(input_line) == 2:
-                _, taxable_income = input_line
-                taxable_income = float(taxable_income)
-                total_taxable_income[year] += taxable_income
-            input_line = tax_receipt.readline().split()
-        tax_receipt.close()
-        return total_taxable_income
+        return self.ledger.shares_taxable_income
 
     def parse_receipts(self):
         pass
 
 
 class SuperTaxCollector:
-    def __init__(self):
-        self.taxed_amount = []
-        self.untaxed_amount = []
-        self.parse_receipt()
+    def __init__(self, sources={}, ledger=None):
+        self.sources = sources
+        self.ledger = TaxLedger(sources) if ledger is None else ledger
+        self.tax_file = "output_files/tax/super_invoice.txt"
+        self.invoice = []
+        self.taxed_amount = list(self.ledger.super_taxed_amount)
+        self.untaxed_amount = self.ledger.super_untaxed_amount
 
     def get_taxable_income(self):
-        input_file = open("input_files/super.txt", "r")
-        ncc_amount = []
-        input_line = input_file.readline().split()
-        while len(input_line) > 0:
-            week = int(input_line[0])
-            year = week // 52
-            if year == len(ncc_amount):
-                ncc_amount.append(0)
-            if len(input_line) == 4:
-                _, command, variant, amount = input_line
-                amount = float(amount)
-                if variant == "NCC":
-                    ncc_amount[year] += amount
-            input_line = input_file.readline().split()
-        input_file.close()
-        return ncc_amount
+        return self.ledger.super_ncc_contribs
 
     def get_cc_contribs(self):
-        input_file = open("input_files/super.txt", "r")
-        cc_amount = []
-        input_line = input_file.readline().split()
-        while len(input_line) > 0:
-            week = int(input_line[0])
-            year = week // 52
-            if year == len(cc_amount):
-                cc_amount.append(0)
-            if len(input_line) == 4:
-                _, command, variant, amount = input_line
-                amount = float(amount)
-                if variant == "CC":
-                    cc_amount[year] += amount
-            input_line = input_file.readline().split()
-        input_file.close()
-        return cc_amount
-
-    def parse_receipt(self):
-        tax_receipt = open("output_files/tax/super.txt", "r")
-        input_line = tax_receipt.readline().split()
-        while len(input_line) > 0:
-            week = int(input_line[0])
-            year = week // 52
-            if year >= len(self.taxed_amount):
-                self.taxed_amount.append(0)
-                self.untaxed_amount.append(0)
-            if len(input_line) == 3:
-                _, taxed_amount, untaxed_amount = input_line
-                taxed_amount = float(taxed_amount)
-                untaxed_amount = float(untaxed_amount)
-                self.taxed_amount[-1] += taxed_amount
-                self.untaxed_amount[-1] += untaxed_amount
-            input_line = tax_receipt.readline().split()
-        tax_receipt.close()
-
-    def apply_tax(self):
-        brackets_file = open("input_files/tax_brackets.txt", "r")
-        tax_file = open("output_files/tax/super_invoice.txt", "w")
-        total_taxable_income = IncomeTaxCollector().taxable_income
-        #total_taxable_income = IncomeTaxCollector().get_taxable_income()
-        for year, taxable_income in enumerate(total_taxable_income):
-            tax_brackets = []
-            tax_rates = []
-            while len(tax_brackets) == 0 or len(tax_rates) == 0:
-                input_line = brackets_file.readline().split()
-                if len(input_line) > 0:
-                    time = int(input_line[0])
-                    command = input_line[1]
-                    if year == time:
-                        if command == "RATES":
-                            for i in range(2, len(input_line)):
-                                tax_rates.append(float(input_line[i]))
-                        if command == "BRACKETS":
-                            for i in range(2, len(input_line)):
-                                tax_brackets.append(float(input_line[i]))
-
-            tax = 0
-            idx = 0
+        return self.ledger.super_cc_contribs
+
+    def apply_tax(self, export=True, start_year=0):
+        # Invoices before start_year are kept, e.g. from an earlier run
+        brackets = read_brackets("input_files/tax_brackets.txt", self.sources)
+        total_taxable_income = self.ledger.taxable_income
+        del self.invoice[start_year:]
+        for year in range(start_year, len(total_taxable_income)):
+            taxable_income = total_taxable_income[year]
             self.taxed_amount[year] += 0.15 * self.untaxed_amount[year]
-            tax += 0.15 * self.untaxed_amount[year]
-            while idx < len(tax_brackets) \
-            and taxable_income > tax_brackets[idx]:
-                idx += 1
-            while idx < len(tax_brackets) \
-            and taxable_income + self.taxed_amount[year] > tax_brackets[idx-1]:
-                tax += (tax_rates[idx-1] - 30) / 100 * (min(taxable_income + \
-                        self.taxed_amount[year], tax_brackets[idx]) \
-                        - max(taxable_income, tax_brackets[idx-1]))
-                idx += 1
-            if taxable_income + self.taxed_amount[year] > tax_brackets[-1]:
-                tax += (tax_rates[-1] - 30) / 100 * (taxable_income + \
-                        self.taxed_amount[year] - max(taxable_income, tax_brackets[-1]))
-            tax_file.write(f"{year} {tax}\n")
-        brackets_file.close()
-        tax_file.close()
-
+            tax = 0.15 * self.untaxed_amount[year]
+            # The taxed amount sits on top of taxable income, at the marginal rates less
+            # the 30% already paid on it
+            tax += brackets.tax(year, taxable_income + self.taxed_amount[year], 30) \
+                    - brackets.tax(year, taxable_income, 30)
+            self.invoice.append(tax)
+        if export:
+            write_series(self.tax_file, self.invoice)
 
 if __name__ == "__main__":
     tax_collector = SuperTaxCollector()
@@ -0,0 +1,10 @@
+# The modules import each other by name and read input_files/ from the working
+# directory, as when they are run from financial_model/, so the tests run from there too.
+# Run them with python -m pytest from anywhere.
+
+import os
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+os.chdir(PACKAGE_DIR)
@@ -0,0 +1,73 @@
+# BracketTable's bisect lookups against scanning the brackets one at a time
+
+import random
+
+from brackets import BracketTable
+
+import pytest
+
+TAX_RATES = [19, 32.5, 37, 45]
+TAX_THRESHOLDS = [18200, 45000, 120000, 180000]
+HECS_RATES = [0, 1, 2, 2.5, 3, 3.5, 4, 4.5, 5]
+HECS_THRESHOLDS = [51550, 59518, 63089, 66875, 70888, 75140, 79649, 84429]
+
+def scanned_tax(rates, thresholds, income, rate_offset=0):
+    # Each rate, less rate_offset, on the part of the income between its threshold and
+    # the next
+    tax = 0
+    for i, (rate, threshold) in enumerate(zip(rates, thresholds)):
+        upper = thresholds[i + 1] if i + 1 < len(thresholds) else income
+        if income > threshold:
+            tax += (rate - rate_offset) / 100 * (min(income, upper) - threshold)
+    return tax
+
+def scanned_marginal_rate(rates, thresholds, income):
+    # For income tax, no rate applies below the first threshold. HECS has one more rate
+    # than thresholds, for income below the first.
+    rate = rates[0] if len(rates) > len(thresholds) else 0
+    offset = len(rates) - len(thresholds)
+    for i, threshold in enumerate(thresholds):
+        if income >= threshold:
+            rate = rates[i + offset]
+    return rate
+
+def incomes(thresholds):
+    # Random incomes, and every threshold and the dollars either side of it
+    rng = random.Random(1)
+    edges = [threshold + step for threshold in thresholds for step in [-1, 0, 1]]
+    return [0] + edges + [rng.uniform(0, 2 * thresholds[-1]) for _ in range(200)]
+
+def two_periods(rates, thresholds):
+    # A second period with every threshold 10% higher
+    return BracketTable([rates, rates], [thresholds, [1.1 * t for t in thresholds]])
+
+@pytest.mark.parametrize("rate_offset", [0, 30])
+def test_tax_matches_scan(rate_offset):
+    table = two_periods(TAX_RATES, TAX_THRESHOLDS)
+    for period in range(2):
+        thresholds = table.thresholds[period]
+        for income in incomes(thresholds):
+            assert table.tax(period, income, rate_offset) == pytest.approx( \
+                    scanned_tax(TAX_RATES, thresholds, income, rate_offset), abs=1e-6)
+
+@pytest.mark.parametrize("rates, thresholds", [(TAX_RATES, TAX_THRESHOLDS), \
+                                                (HECS_RATES, HECS_THRESHOLDS)])
+def test_marginal_rate_matches_scan(rates, thresholds):
+    table = two_periods(rates, thresholds)
+    for period in range(2):
+        period_incomes = incomes(table.thresholds[period])
+        expected = [scanned_marginal_rate(rates, table.thresholds[period], income) \
+                    for income in period_incomes]
+        assert [table.marginal_rate(period, income) for income in period_incomes] == expected
+
+def test_marginal_rates_match_scan():
+    # One income for each period, repeated for a stretch of periods with the same
+    # brackets, which marginal_rates() looks up once
+    rng = random.Random(2)
+    thresholds = [HECS_THRESHOLDS] * 20 + [[1.1 * t for t in HECS_THRESHOLDS]] * 20
+    table = BracketTable([HECS_RATES] * 40, thresholds)
+    period_incomes = [income for _ in range(10) for income in [rng.uniform(40000, 90000)] * 4]
+    expected = [scanned_marginal_rate(HECS_RATES, thresholds[period], income) \
+                for period, income in enumerate(period_incomes)]
+    assert table.marginal_rates(period_incomes) == expected
+    assert table.marginal_rates(period_incomes, 13) == expected[13:]
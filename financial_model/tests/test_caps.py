@@ -0,0 +1,97 @@
+# The super contribution caps: ContributionCaps on its own, and as Super and
+# Simulator.allocate() apply them
+
+from caps import BRING_FORWARD_YEARS, CARRY_FORWARD_BALANCE_LIMIT, CARRY_FORWARD_YEARS, \
+                    CC_YEARLY_CAP, FHSS_TOTAL_LIMIT, FHSS_YEARLY_LIMIT, NCC_CAP_MULTIPLE, \
+                    ContributionCaps
+from simulator import Simulator
+import superannuation
+
+import pytest
+
+NCC_YEARLY_CAP = NCC_CAP_MULTIPLE * CC_YEARLY_CAP
+
+def test_cc_over_the_cap_is_excess():
+    caps = ContributionCaps()
+    assert caps.contribute(0, CC_YEARLY_CAP - 1000, "CC") == 0
+    assert caps.remaining_cc(10) == 1000
+    assert caps.contribute(10, 3000, "CC") == 2000
+    assert caps.excess() == {0: {"CC": 2000, "NCC": 0}}
+
+def test_carry_forward_uses_unused_cap_oldest_first():
+    caps = ContributionCaps()
+    caps.contribute(0, CC_YEARLY_CAP - 5000, "CC")
+    caps.contribute(52, CC_YEARLY_CAP - 3000, "CC")
+    caps.start_year(2, 0)
+    assert caps.remaining_cc(104) == CC_YEARLY_CAP + 8000
+    assert caps.contribute(104, CC_YEARLY_CAP + 6000, "CC") == 0
+    # The 5000 left from year 0 went first
+    assert caps.unused_cc[:2] == [0, 2000]
+    assert caps.contribute(104, 3000, "CC") == 1000
+
+def test_carry_forward_expires():
+    caps = ContributionCaps()
+    caps.start_year(CARRY_FORWARD_YEARS + 1, 0)
+    # Year 0's unused cap is too old, so only the CARRY_FORWARD_YEARS after it are left
+    assert caps.remaining_cc(52 * (CARRY_FORWARD_YEARS + 1)) \
+            == (CARRY_FORWARD_YEARS + 1) * CC_YEARLY_CAP
+
+def test_no_carry_forward_over_the_balance_limit():
+    caps = ContributionCaps()
+    caps.start_year(1, CARRY_FORWARD_BALANCE_LIMIT)
+    assert caps.remaining_cc(52) == CC_YEARLY_CAP
+    assert caps.contribute(52, CC_YEARLY_CAP + 1000, "CC") == 1000
+
+def test_ncc_bring_forward():
+    caps = ContributionCaps()
+    assert caps.remaining_ncc(0) == BRING_FORWARD_YEARS * NCC_YEARLY_CAP
+    assert caps.contribute(0, 2 * NCC_YEARLY_CAP, "NCC") == 0
+    assert caps.contribute(52, NCC_YEARLY_CAP, "NCC") == 0
+    assert caps.contribute(104, 1000, "NCC") == 1000
+    # The bring-forward period ends, and the yearly cap applies again
+    caps.start_year(BRING_FORWARD_YEARS, 0)
+    assert caps.remaining_ncc(52 * BRING_FORWARD_YEARS) == BRING_FORWARD_YEARS * NCC_YEARLY_CAP
+
+def test_fhss_limits():
+    caps = ContributionCaps()
+    total = 0
+    for year in range(5):
+        caps.contribute(52 * year, 20000, "FHSS_NCC")
+        assert caps.fhss[year] == min(FHSS_YEARLY_LIMIT, FHSS_TOTAL_LIMIT - total)
+        total += caps.fhss[year]
+    assert caps.fhss_total == FHSS_TOTAL_LIMIT
+    # Only contributions within the caps count
+    caps = ContributionCaps()
+    caps.contribute(0, CC_YEARLY_CAP, "CC")
+    caps.contribute(1, 10000, "FHSS_CC")
+    assert caps.fhss_total == 0
+
+def test_checkpoint_and_restore():
+    caps = ContributionCaps()
+    caps.contribute(0, 10000, "CC")
+    state = caps.checkpoint()
+    caps.contribute(60, 100000, "CC")
+    caps.contribute(60, 500000, "NCC")
+    caps.restore(state)
+    assert caps.checkpoint() == state
+    assert caps.excess() == {}
+
+def test_super_reports_what_goes_over():
+    schedule = [(0, "BUY", "CC", CC_YEARLY_CAP), (10, "BUY", "CC", 500), \
+                (60, "BUY", "NCC", 4 * NCC_YEARLY_CAP)]
+    simulator = superannuation.Super(schedule, {"ANNUAL_ROR": 5, "STARTING_BALANCE": 0})
+    simulator.simulate(104, export=False)
+    excess = simulator.out_excess_file_gen.excess_amount
+    assert excess[10] == pytest.approx(500)
+    assert excess[60] == pytest.approx(NCC_YEARLY_CAP)
+    assert sum(excess) == pytest.approx(500 + NCC_YEARLY_CAP)
+
+def test_super_allocation_is_limited_to_the_caps():
+    # By year 32 the balance is well over the carry-forward limit through growth, though
+    # contributions alone add up to less. A run on its own has no earlier run to take
+    # balances from, so it relies on the estimate in Simulator.allocate().
+    num_weeks = 34 * 52
+    simulator = Simulator(scenario={"ALLOCATIONS": {1664: {"SUPER": 190328}}})
+    simulator.simulate(num_weeks, report=False)
+    assert 0 < simulator.allocated[1664]["SUPER"] < 190328
+    assert sum(simulator.results["super_excess"]) == 0
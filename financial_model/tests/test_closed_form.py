@@ -0,0 +1,88 @@
+# The closed forms in rates.py, amortization.py, shares.py and superannuation.py against
+# stepping through the weeks one at a time
+
+import random
+
+from amortization import amortize
+from rates import GrowthIndex, weekly_rate
+import shares
+import superannuation
+
+import pytest
+
+NUM_WEEKS = 520
+
+def annual_rates(kind):
+    if kind == "fixed":
+        return 7
+    rng = random.Random(1)
+    return [rng.uniform(-5, 15) for _ in range(NUM_WEEKS + 1)]
+
+@pytest.mark.parametrize("kind", ["fixed", "path"])
+def test_growth_index_matches_stepping(kind):
+    rates = annual_rates(kind)
+    growth_index = GrowthIndex(rates)
+    growth = 1
+    for week in range(NUM_WEEKS):
+        assert growth_index[week] == pytest.approx(growth, rel=1e-12)
+        annual_rate = rates if kind == "fixed" else rates[week]
+        growth *= 1 + weekly_rate(annual_rate) / 100
+
+@pytest.mark.parametrize("kind", ["fixed", "path"])
+@pytest.mark.parametrize("repayment", [50, 200, 2000])
+def test_amortize_matches_stepping(kind, repayment):
+    growth_index = GrowthIndex(annual_rates(kind))
+    start, end = 26, NUM_WEEKS
+    balances, last_week, closing_balance = amortize(growth_index, 10000, repayment, start, end)
+    # The week's repayment is made after its interest, until a week opens with nothing
+    # owing
+    balance = 10000
+    stepped = []
+    for week in range(start, end):
+        stepped.append(balance)
+        if balance <= 0:
+            break
+        balance = balance * (1 + growth_index.rate(week) / 100) - repayment
+    assert len(balances) == len(stepped)
+    assert balances == pytest.approx(stepped, rel=1e-9, abs=1e-6)
+    assert last_week == (start + len(stepped) - 1 if stepped[-1] <= 0 else end)
+    if last_week == end:
+        assert closing_balance == pytest.approx(balance, rel=1e-9)
+
+@pytest.mark.parametrize("kind", ["fixed", "path"])
+def test_shares_value_matches_stepping(kind):
+    rates = annual_rates(kind)
+    rng = random.Random(2)
+    buys = sorted((rng.randrange(NUM_WEEKS), rng.randrange(1, 5000)) for _ in range(40))
+    schedule = [(week, "BUY", amount) for week, amount in buys]
+    simulator = shares.Shares(schedule, {"ANNUAL_ROR": rates, "STARTING_BALANCE": 1000})
+    simulator.simulate(NUM_WEEKS, export=False)
+    # Every parcel grows by the week's rate from the week after it is bought
+    value = 1000
+    for week in range(NUM_WEEKS):
+        value += sum([amount for buy_week, amount in buys if buy_week == week])
+        assert simulator.out_file_gen.total_amount[week] == pytest.approx(value, rel=1e-9)
+        annual_rate = rates if kind == "fixed" else rates[week]
+        value *= 1 + weekly_rate(annual_rate) / 100
+
+@pytest.mark.parametrize("kind", ["fixed", "path"])
+def test_super_value_matches_stepping(kind):
+    rates = annual_rates(kind)
+    rng = random.Random(3)
+    buys = sorted((rng.randrange(NUM_WEEKS), rng.randrange(1, 5000)) for _ in range(40))
+    schedule = [(week, "BUY", "CC", amount) for week, amount in buys]
+    simulator = superannuation.Super(schedule, {"ANNUAL_ROR": rates, "STARTING_BALANCE": 1000})
+    simulator.simulate(NUM_WEEKS, export=False)
+    # Each parcel's value, and what it was worth when it was bought or its earnings were
+    # last taxed. Earnings are taxed at 15% at the end of the first week of each year.
+    parcels = [[1000, 1000]]
+    for week in range(NUM_WEEKS):
+        parcels += [[amount, amount] for buy_week, amount in buys if buy_week == week]
+        value = sum([parcel[0] for parcel in parcels])
+        assert simulator.out_file_gen.total_amount[week] == pytest.approx(value, rel=1e-9)
+        annual_rate = rates if kind == "fixed" else rates[week]
+        for parcel in parcels:
+            parcel[0] *= 1 + weekly_rate(annual_rate) / 100
+            if week % 52 == 0:
+                parcel[0] = parcel[1] + 0.85 * (parcel[0] - parcel[1])
+                parcel[1] = parcel[0]
@@ -0,0 +1,70 @@
+# The FMCOLS01 binary format, written and read back directly, through the schedule
+# readers and writers, and converted to and from text
+
+from columnar import MAGIC, convert, is_columnar, read_columnar, write_columnar
+import schedule
+
+import pytest
+
+WEEKS = [0, 1, 2, 5, 9]
+COLUMNS = [[1.5, -2.25, 0, 1e12, 1 / 3], [0.1, 0.2, 0.3, 0.4, 0.5]]
+
+@pytest.fixture
+def binary_files():
+    schedule.use_binary_files(True)
+    yield
+    schedule.use_binary_files(False)
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "table.txt")
+    write_columnar(path, WEEKS, COLUMNS, names=["taxed", "untaxed"], horizon=52)
+    assert is_columnar(path)
+    table = read_columnar(path)
+    assert table["horizon"] == 52
+    assert table["names"] == ["taxed", "untaxed"]
+    assert list(table["weeks"]) == WEEKS
+    assert [list(column) for column in table["columns"]] == COLUMNS
+
+def test_columns_are_aligned(tmp_path):
+    # Odd lengths of names and week index still leave every column 8-byte aligned
+    path = str(tmp_path / "table.txt")
+    write_columnar(path, [0, 1, 2], [[1, 2, 3]], names=["abc"])
+    table = read_columnar(path)
+    assert list(table["columns"][0]) == [1, 2, 3]
+    assert table["horizon"] == 3
+
+def test_empty_table(tmp_path):
+    path = str(tmp_path / "table.txt")
+    write_columnar(path, [], [[]], horizon=10)
+    table = read_columnar(path)
+    assert table["horizon"] == 10
+    assert list(table["weeks"]) == []
+
+def test_series_written_as_binary(tmp_path, binary_files):
+    path = str(tmp_path / "output_files" / "series.txt")
+    schedule.write_series(path, COLUMNS[0])
+    assert open(path, "rb").read(len(MAGIC)) == MAGIC
+    assert list(schedule.read_series(path)) == COLUMNS[0]
+    schedule.write_columns(path, *COLUMNS)
+    assert [list(column) for column in schedule.read_columns(path, num_columns=2)] == COLUMNS
+
+def test_schedules_with_commands_stay_text(tmp_path, binary_files):
+    path = str(tmp_path / "schedule.txt")
+    schedule.write_schedule(path, [(0, "BUY", 100), (3, "SELL", "FHSS")], 52)
+    assert not is_columnar(path)
+    assert [list(line) for line in schedule.read_schedule(path)] \
+            == [["0", "BUY", "100"], ["3", "SELL", "FHSS"]]
+
+def test_convert_round_trip(tmp_path):
+    path = str(tmp_path / "schedule.txt")
+    lines = list(zip(WEEKS, *COLUMNS))
+    schedule.write_schedule(path, lines, 52)
+    convert(path, "binary")
+    assert is_columnar(path)
+    assert read_columnar(path)["horizon"] == 52
+    assert [tuple(line) for line in schedule.read_schedule(path)] == lines
+    convert(path, "text")
+    assert not is_columnar(path)
+    assert schedule.read_horizon(path) == 52
+    assert [(int(line[0]), *[float(amount) for amount in line[1:]]) \
+            for line in schedule.read_schedule(path)] == lines
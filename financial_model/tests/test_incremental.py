@@ -0,0 +1,87 @@
+# Incremental runs, resumed from checkpoints, and runs loaded from a ResultCache against
+# full runs of the same inputs
+
+import random
+
+from cache import ResultCache
+import benchmark
+from simulator import Simulator
+
+NUM_WEEKS = 20 * 52
+
+class ChangedSimulator(benchmark.BenchmarkSimulator):
+    # The benchmark's synthetic schedules, with a list of changes made on top of them
+    def __init__(self, changes=()):
+        super().__init__(12, 3)
+        self.changes = list(changes)
+
+    def generate_input_files(self, num_weeks):
+        file_gens = benchmark.synthetic_input_file_gens(num_weeks, 12, 3)
+        income_file_gen, _, shares_file_gen, super_file_gen, home_file_gen, \
+                home_loan_file_gen, car_loan_file_gen, hecs_file_gen = file_gens
+        for kind, week, amount in self.changes:
+            if kind == "pay":
+                home_loan_file_gen.pay(amount, week)
+            elif kind == "buy":
+                shares_file_gen.buy(amount, week)
+            elif kind == "sell":
+                shares_file_gen.sell(amount, week)
+            elif kind == "super":
+                super_file_gen.buy(amount, "NCC", week)
+            elif kind == "income":
+                income_file_gen.add(week, amount)
+            elif kind == "hecs":
+                hecs_file_gen.pay(amount, week)
+            elif kind == "car":
+                car_loan_file_gen.buy(20000, 0, week, 3)
+        self.load_inputs(*file_gens)
+        self.generate_hecs_brackets(num_weeks)
+        self.generate_tax_brackets(num_weeks)
+
+def run(simulator, incremental=False):
+    try:
+        simulator.simulate(NUM_WEEKS, report=False, incremental=incremental)
+    except AssertionError:
+        pass
+    return {name: list(series) for name, series in simulator.results.items()}
+
+def test_incremental_runs_match_full_runs():
+    rng = random.Random(1)
+    kinds = ["pay", "buy", "sell", "super", "income", "hecs", "car"]
+    incremental = ChangedSimulator()
+    run(incremental, True)
+    for _ in range(15):
+        incremental.changes.append((rng.choice(kinds), rng.randrange(NUM_WEEKS), \
+                                    rng.randrange(1, 3000)))
+        if rng.random() < 0.2:
+            incremental.home_loan_params = dict(incremental.home_loan_params, \
+                                                ANNUAL_INTEREST_RATE=rng.choice([5, 6, 7]))
+        full = ChangedSimulator(incremental.changes)
+        full.home_loan_params = incremental.home_loan_params
+        assert run(incremental, True) == run(full)
+
+def test_incremental_allocation_plans_match_full_runs():
+    # As the optimizer runs them, a plan at a time on the same simulator
+    incremental = Simulator()
+    plan = {}
+    for week, target in [(104, "SHARES"), (312, "SUPER"), (520, "HOME_LOAN"), (208, "SHARES")]:
+        plan = dict(plan)
+        plan[week] = {target: 1000}
+        incremental.simulate_plan(NUM_WEEKS, plan)
+        results = {name: list(series) for name, series in incremental.results.items()}
+        assert results == run(Simulator(scenario={"ALLOCATIONS": plan}))
+
+def test_cached_runs_match_full_runs(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    simulated = Simulator()
+    simulated.cache = cache
+    results = run(simulated)
+    cached = Simulator()
+    cached.cache = cache
+    assert run(cached) == results
+    assert (cache.hits, cache.misses) == (1, 1)
+    # A different run is not taken from the cache
+    changed = Simulator(scenario={"HOME_PURCHASE_PRICE": 400000})
+    changed.cache = cache
+    assert run(changed) != results
+    assert cache.misses == 2
@@ -0,0 +1,11 @@
+from simulator import Simulator
+
+def test_optimized_plan_stays_under_super_caps():
+    # Over this horizon the super balance passes the carry-forward limit through growth
+    # alone, which an allocation plan must not miss
+    num_weeks = 34 * 52
+    simulator = Simulator()
+    best = simulator.optimize(num_weeks, period=208, num_processes=1, report=False)
+    assert best["super_excess"] == 0
+    simulator.simulate_plan(num_weeks, best["allocations"])
+    assert sum(simulator.results["super_excess"]) == 0